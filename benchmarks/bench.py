@@ -0,0 +1,413 @@
+"""
+Benchmarks for the hot paths: parsing RSS feeds, filtering episodes, finding the
+missing ones in big download directories and downloading them.
+
+Run from the repository root:
+
+    python benchmarks/bench.py --json results.json
+
+and compare a later run to it, which fails when something got slower:
+
+    python benchmarks/bench.py --compare results.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import ctypes
+import asyncio
+import argparse
+import platform
+import statistics
+import resource
+import tempfile
+import contextlib
+from pathlib import Path
+
+import attrs
+import httpx
+from lxml import etree
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from podcast_dl import rss_parsers  # noqa: E402
+from podcast_dl.cli import EpisodeList  # noqa: E402
+from podcast_dl.mockserver import (  # noqa: E402
+    ServerConfig,
+    server_podcasts,
+    subprocess_server,
+)
+from podcast_dl.podcast_dl import (  # noqa: E402
+    RssItemParser,
+    download_episodes,
+    download_feed,
+    filter_rss_items,
+    find_missing,
+    get_all_rss_items,
+    make_episodes,
+)
+from podcast_dl.progress import NoProgress  # noqa: E402
+from podcast_dl.ratelimit import parse_size  # noqa: E402
+
+XML_DIR = Path(__file__).resolve().parent.parent / "xml"
+
+PARSERS = (
+    rss_parsers.BaseItem,
+    rss_parsers.TalkPythonItem,
+    rss_parsers.ChangelogItem,
+    rss_parsers.IndieHackersItem,
+    rss_parsers.CoRecursiveItem,
+)
+
+FIXTURES = {
+    "talkpython.xml": rss_parsers.TalkPythonItem,
+    "pythonbytes.xml": rss_parsers.TalkPythonItem,
+    "podcastinit.xml": rss_parsers.BaseItem,
+}
+
+# Every parser can handle these items: the title has an episode number for
+# TalkPython and IndieHackers, the URL has parameters for CoRecursive.
+ITEM_TEMPLATE = """
+    <item>
+      <title>#{n} - Episode number {n} about something interesting</title>
+      <itunes:title>#{n} - Episode number {n} about something interesting</itunes:title>
+      <itunes:episode>{n}</itunes:episode>
+      <link>https://example.com/podcast/{n}</link>
+      <guid isPermaLink="false">episode-{n}</guid>
+      <pubDate>{pub_date}</pubDate>
+      <description>Show notes of episode {n}. {filler}</description>
+      <enclosure url="https://{host}/episodes/{n}.mp3?s=1" length="{size}"
+                 type="audio/mpeg"/>
+    </item>"""
+
+FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 10
+
+
+def synthetic_feed(items: int, host="example.com", size=50_000_000) -> bytes:
+    """An RSS feed with the given number of weekly episodes."""
+    start = 1_700_000_000
+    week = 7 * 24 * 60 * 60
+    body = "".join(
+        ITEM_TEMPLATE.format(
+            n=n,
+            pub_date=time.strftime(
+                "%a, %d %b %Y %H:%M:%S +0000", time.gmtime(start - n * week)
+            ),
+            filler=FILLER,
+            host=host,
+            size=size,
+        )
+        for n in range(1, items + 1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+        f"<channel><title>Synthetic</title>{body}</channel></rss>"
+    ).encode()
+
+
+@attrs.frozen
+class Result:
+    name: str
+    best: float
+    median: float
+    # Items or bytes processed in one run
+    amount: int
+    unit: str
+    peak_memory: int
+
+    @property
+    def throughput(self) -> float:
+        return self.amount / self.best
+
+    def format(self) -> str:
+        if self.unit == "B":
+            throughput = f"{self.throughput / 1024**2:10.1f} MB/s "
+        else:
+            throughput = f"{self.throughput:10.0f} {self.unit}/s"
+        return (
+            f"{self.name:<44} {self.best * 1000:10.1f} ms {self.median * 1000:10.1f} ms"
+            f" {throughput} {self.peak_memory / 1024**2:8.1f} MB"
+        )
+
+
+def _max_rss():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _malloc_trim():
+    with contextlib.suppress(OSError, AttributeError):
+        ctypes.CDLL(None).malloc_trim(0)
+
+
+def _peak_memory(name, func, args):
+    """How much the resident memory grows while func runs. Unlike tracemalloc, this
+    includes the memory of libxml2. A forked process starts from the current
+    memory usage, not from the peak of the benchmarks before."""
+    # Memory freed by the benchmarks before is given back to the system, or the
+    # forked process could reuse it without growing
+    _malloc_trim()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            start = _max_rss()
+            with _quiet():
+                func(*args)
+            os.write(write_fd, str(_max_rss() - start).encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as output:
+        peak_memory = output.read()
+    os.waitpid(pid, 0)
+    if not peak_memory:
+        raise RuntimeError(f"Measuring the memory usage of {name} failed")
+    return int(peak_memory)
+
+
+@contextlib.contextmanager
+def _quiet():
+    """The library functions report their progress on stdout."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def measure(name, func, amount, unit="items", repeat=3, setup=None):
+    """Run func once in a forked process for its peak memory usage, then repeat
+    times for timing it. setup makes the arguments of func before every run.
+    """
+    args = setup() if setup is not None else ()
+    peak_memory = _peak_memory(name, func, args)
+
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        with _quiet():
+            start = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - start)
+    return Result(name, min(times), statistics.median(times), amount, unit, peak_memory)
+
+
+def bench_parse(sizes, repeat):
+    for xml_name, rss_parser in FIXTURES.items():
+        content = (XML_DIR / xml_name).read_bytes()
+        items = content.count(b"<item>")
+        yield measure(
+            f"parse {xml_name}",
+            lambda: get_all_rss_items(etree.XML(content), rss_parser),
+            items,
+            repeat=repeat,
+        )
+
+    for size in sizes:
+        content = synthetic_feed(size)
+        for rss_parser in PARSERS:
+            yield measure(
+                f"parse tree {rss_parser.__name__} {size}",
+                lambda: get_all_rss_items(etree.XML(content), rss_parser),
+                size,
+                repeat=repeat,
+            )
+        yield measure(
+            f"parse stream BaseItem {size}",
+            lambda: _parse_streaming(content, rss_parsers.BaseItem),
+            size,
+            repeat=repeat,
+        )
+
+
+def _parse_streaming(content, rss_parser, chunk_size=64 * 1024):
+    parser = RssItemParser(rss_parser)
+    for start in range(0, len(content), chunk_size):
+        parser.feed(content[start : start + chunk_size])
+    return parser.close()
+
+
+def bench_filter(sizes, repeat):
+    for size in sizes:
+        items = get_all_rss_items(etree.XML(synthetic_feed(size)), rss_parsers.BaseItem)
+        # Every other episode in ranges of 100, with some titles and the last ones
+        spec = ",".join(f"{n}-{n + 99}" for n in range(1, size, 200))
+        spec += ",Some title,Another title,last:100"
+        selection = EpisodeList().convert(spec)
+        yield measure(
+            f"EpisodeList {size}",
+            lambda: EpisodeList().convert(spec),
+            spec.count(",") + 1,
+            "params",
+            repeat=repeat,
+        )
+        yield measure(
+            f"filter_rss_items {size}",
+            lambda: filter_rss_items(items, selection),
+            size,
+            repeat=repeat,
+        )
+
+
+def bench_find_missing(sizes, repeat):
+    for size in sizes:
+        items = get_all_rss_items(etree.XML(synthetic_feed(size)), rss_parsers.BaseItem)
+        with tempfile.TemporaryDirectory() as tmp:
+            download_dir = Path(tmp)
+            # Half of the episodes are downloaded
+            for item in items[::2]:
+                (download_dir / item.filename).write_bytes(b"")
+
+            for check_size in (False, True):
+                yield measure(
+                    f"find_missing {size}" + (" check size" if check_size else ""),
+                    lambda episodes: find_missing(episodes, _noprint, check_size),
+                    size,
+                    repeat=repeat,
+                    setup=lambda: (make_episodes(download_dir, items),),
+                )
+
+
+def bench_download(episodes, episode_size, threads, repeat):
+    config = ServerConfig(episodes=episodes, episode_size=episode_size)
+    with subprocess_server(config) as url, tempfile.TemporaryDirectory() as tmp:
+        download_dir = Path(tmp)
+        podcast = server_podcasts(url)[0]
+        with _quiet():
+            items = asyncio.run(_download_feed(podcast))
+
+        def setup():
+            for path in download_dir.iterdir():
+                path.unlink()
+            return (make_episodes(download_dir, items),)
+
+        def download(all_episodes):
+            asyncio.run(_download(all_episodes, threads))
+
+        yield measure(
+            f"download {episodes}x{episode_size / 1024**2:g}MB {threads} threads",
+            download,
+            episodes * episode_size,
+            "B",
+            repeat=repeat,
+            setup=setup,
+        )
+
+
+async def _download_feed(podcast):
+    async with httpx.AsyncClient() as http:
+        feed = await download_feed(http, podcast.rss, podcast.rss_parser)
+        return feed.items
+
+
+async def _download(episodes, threads):
+    async with httpx.AsyncClient() as http:
+        failed = await download_episodes(
+            http, episodes, threads, _noprint, NoProgress()
+        )
+    if failed:
+        raise RuntimeError(f"Failed downloads: {failed}")
+
+
+def _noprint(*args, **kwargs):
+    pass
+
+
+def compare(results, baseline_path, tolerance):
+    """Print the changes from the baseline and return the slower benchmarks."""
+    baseline = {r["name"]: r for r in json.loads(baseline_path.read_text())["results"]}
+    regressions = []
+    print(f"\nCompared to {baseline_path}:")
+    for result in results:
+        if result.name not in baseline:
+            continue
+        ratio = result.best / baseline[result.name]["best"]
+        marker = ""
+        if ratio > tolerance:
+            marker = "  SLOWER"
+            regressions.append(result.name)
+        print(f"{result.name:<44} {ratio:8.2f}x{marker}")
+    return regressions
+
+
+def _sizes(value):
+    return [_positive(size) for size in value.split(",")]
+
+
+def _positive(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split("\n\n")[0].replace("\n", " ")
+    )
+    parser.add_argument(
+        "--items",
+        type=_sizes,
+        default=[10_000, 100_000],
+        help="number of items in the synthetic feeds (default: 10000,100000)",
+    )
+    parser.add_argument("--repeat", type=_positive, default=3)
+    parser.add_argument(
+        "--only",
+        choices=("parse", "filter", "find_missing", "download"),
+        action="append",
+        help="run only these benchmarks, can be given multiple times",
+    )
+    parser.add_argument("--episodes", type=int, default=20)
+    parser.add_argument("--episode-size", type=parse_size, default="32M")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--json", type=Path, help="save the results to this file")
+    parser.add_argument("--compare", type=Path, help="compare to saved results")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="fail when a benchmark is this many times slower (default: 1.25)",
+    )
+    args = parser.parse_args(argv)
+    only = set(args.only or ("parse", "filter", "find_missing", "download"))
+
+    benchmarks = []
+    if "parse" in only:
+        benchmarks.append(bench_parse(args.items, args.repeat))
+    if "filter" in only:
+        benchmarks.append(bench_filter(args.items, args.repeat))
+    if "find_missing" in only:
+        benchmarks.append(bench_find_missing(args.items, args.repeat))
+    if "download" in only:
+        benchmarks.append(
+            bench_download(args.episodes, args.episode_size, args.threads, args.repeat)
+        )
+
+    print(
+        f"{'benchmark':<44} {'best':>13} {'median':>13} {'throughput':>15}"
+        f" {'peak mem':>11}"
+    )
+    results = []
+    for bench in benchmarks:
+        for result in bench:
+            print(result.format(), flush=True)
+            results.append(result)
+
+    if args.json:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": [attrs.asdict(result) for result in results],
+        }
+        args.json.write_text(json.dumps(report, indent=2))
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Load test of concurrent downloads against the local mock server, for tuning the
+number of downloads, segments, connection pooling and retries.
+
+Every combination of the given settings is run, e.g.:
+
+    python benchmarks/loadtest.py --threads 1,4,16 --segments 1,4 --latency 0.05
+"""
+import io
+import sys
+import time
+import asyncio
+import argparse
+import functools
+import contextlib
+import itertools
+import statistics
+import tempfile
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from podcast_dl.mockserver import (  # noqa: E402
+    ServerConfig,
+    server_podcasts,
+    subprocess_server,
+)
+from podcast_dl.podcast_dl import (  # noqa: E402
+    DownloadSettings,
+    Episode,
+    download_episodes,
+    download_feed,
+)
+from podcast_dl.progress import NoProgress  # noqa: E402
+from podcast_dl.ratelimit import parse_size  # noqa: E402
+from podcast_dl.retry import CircuitBreaker, RetryPolicy, with_retries  # noqa: E402
+
+
+class _TimedEpisode(Episode):
+    """Measures the time from starting to download the episode until it is done,
+    including the retries."""
+
+    started = None
+    latency = None
+
+    async def download(self, *args, **kwargs):
+        if self.started is None:
+            self.started = time.perf_counter()
+        await super().download(*args, **kwargs)
+        self.latency = time.perf_counter() - self.started
+
+
+async def run(url, podcasts, download_dir, threads, segments, keepalive, retries):
+    limits = httpx.Limits(
+        max_connections=threads * segments,
+        max_keepalive_connections=threads * segments,
+        keepalive_expiry=keepalive,
+    )
+    timeout = httpx.Timeout(30.0, pool=None)
+    retry_policy = RetryPolicy(attempts=retries + 1, backoff=0.1)
+    circuit_breaker = CircuitBreaker(0)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as http:
+        episodes = []
+        for podcast in server_podcasts(url)[:podcasts]:
+            podcast_dir = download_dir / podcast.name
+            podcast_dir.mkdir()
+            feed = await with_retries(
+                functools.partial(download_feed, http, podcast.rss, podcast.rss_parser),
+                retry_policy,
+                circuit_breaker,
+                podcast.name,
+                _noprint,
+                "Downloading the feed",
+            )
+            episodes += [_TimedEpisode(item, podcast_dir) for item in feed.items]
+
+        started = time.perf_counter()
+        failed = await download_episodes(
+            http,
+            episodes,
+            threads,
+            _noprint,
+            NoProgress(),
+            DownloadSettings(segments),
+            retry_policy=retry_policy,
+            circuit_breaker=circuit_breaker,
+        )
+        elapsed = time.perf_counter() - started
+
+    downloaded = [ep for ep in episodes if ep not in failed]
+    total_size = sum(ep.full_path.stat().st_size for ep in downloaded)
+    latencies = [ep.latency for ep in downloaded]
+    return elapsed, total_size, latencies, len(failed)
+
+
+def _noprint(*args, **kwargs):
+    pass
+
+
+def _percentiles(latencies):
+    if len(latencies) < 2:
+        return [latencies[0] if latencies else float("nan")] * 3
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return quantiles[49], quantiles[94], quantiles[98]
+
+
+def _list(convert):
+    return lambda value: [convert(v) for v in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=_list(int), default=[1, 4, 8, 16])
+    parser.add_argument("--segments", type=_list(int), default=[1])
+    parser.add_argument("--keepalive", type=_list(float), default=[5.0])
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--podcasts", type=int, default=4)
+    parser.add_argument("--episodes", type=int, default=10, help="per podcast")
+    parser.add_argument("--episode-size", type=parse_size, default="8M")
+    parser.add_argument("--latency", type=_list(float), default=[0.0])
+    parser.add_argument(
+        "--bandwidth",
+        type=_list(parse_size),
+        default=[0],
+        help="bytes per second for every response, 0 means unlimited",
+    )
+    parser.add_argument("--error-rate", type=_list(float), default=[0.0])
+    parser.add_argument("--truncate-rate", type=_list(float), default=[0.0])
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'threads':>7} {'segm':>4} {'keepalive':>9} {'latency':>7}"
+        f" {'bandwidth':>9} {'errors':>6} {'trunc':>5} |"
+        f" {'MB/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'failed':>6}"
+    )
+    server_settings = itertools.product(
+        args.latency, args.bandwidth, args.error_rate, args.truncate_rate
+    )
+    for latency, bandwidth, error_rate, truncate_rate in server_settings:
+        config = ServerConfig(
+            episodes=args.episodes,
+            episode_size=args.episode_size,
+            latency=latency,
+            bandwidth=bandwidth,
+            error_rate=error_rate,
+            truncate_rate=truncate_rate,
+            seed=0,
+        )
+        with subprocess_server(config) as url:
+            client_settings = itertools.product(
+                args.threads, args.segments, args.keepalive
+            )
+            for threads, segments, keepalive in client_settings:
+                # The library reports its progress on stdout
+                quiet = contextlib.redirect_stdout(io.StringIO())
+                with tempfile.TemporaryDirectory() as tmp, quiet:
+                    elapsed, total_size, latencies, failed = asyncio.run(
+                        run(
+                            url,
+                            args.podcasts,
+                            Path(tmp),
+                            threads,
+                            segments,
+                            keepalive,
+                            args.retries,
+                        )
+                    )
+                p50, p95, p99 = _percentiles(latencies)
+                print(
+                    f"{threads:>7} {segments:>4} {keepalive:>9} {latency:>7}"
+                    f" {bandwidth:>9} {error_rate:>6} {truncate_rate:>5} |"
+                    f" {total_size / elapsed / 1024**2:>8.1f} {p50:>7.2f} {p95:>7.2f}"
+                    f" {p99:>7.2f} {failed:>6}",
+                    flush=True,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,55 @@
 #!/usr/bin/env python3
 import re
 import sys
-import atexit
-import asyncio
-import functools
+import datetime
 from pathlib import Path
-from typing import List, Tuple
 from operator import attrgetter
-import httpx
 import click
 from .site_parser import parse_site, InvalidSite
-from .podcasts import PODCASTS
-from .podcast_dl import (
-    ensure_download_dir,
-    download_rss,
-    get_all_rss_items,
-    filter_rss_items,
-    make_episodes,
-    find_missing,
-    download_episodes,
-)
+from .registry import InvalidRegistry, load_podcasts
+from .selection import EpisodeParam, EpisodeSelection, merge_ranges
+
+# The keys of EPISODE_ORDERS in podcast_dl.py, which is too slow to import for --help
+EPISODE_ORDERS = ["filename", "newest", "smallest", "episode"]
 
+_DATE = r"[0-9]{4}-[0-9]{2}-[0-9]{2}"
+_episode_range_re = re.compile(r"^([0-9]+)-([0-9]+)$")
+# Examples: 2024-01-01..2024-06-30, 2024-01-01.., ..2023-12-31
+_date_range_re = re.compile(rf"^({_DATE})?\.\.({_DATE})?$")
+# Examples: newest:5, newest:5@2024-01-01
+_newest_re = re.compile(rf"^NEWEST:([0-9]+)(?:@({_DATE}))?$")
 
 HELP = """
 Download podcast episodes to the given directory
 
 URL or domain or short name for the PODCAST argument can be specified,
-e.g. pythonbytes.fm or talkpython or https://talkpython.fm
-"""
-
-
-@functools.total_ordering
-class EpisodeParam:
-    def __init__(self, original: str):
-        self.original = original
-        self._spec = original.upper()
-
-    def __hash__(self):
-        return hash(self._spec)
-
-    def __eq__(self, other):
-        """Case insensitive equality."""
-        if self.__class__ is not other.__class__:
-            return self._spec == other.upper()
-        return self._spec == other._spec
+e.g. pythonbytes.fm or talkpython or https://talkpython.fm, or the URL of
+the RSS feed of any other podcast.
 
-    def __lt__(self, other):
-        if self.__class__ is not other.__class__:
-            return NotImplemented
-        return self._spec < other._spec
-
-    def __str__(self):
-        return self.original
-
-    def __repr__(self):
-        return repr(self.original)
+Multiple podcasts can be synced at the same time, e.g.
+talkpython pythonbytes changelog, or every supported podcast with --all.
+Every podcast is downloaded to a subdirectory of the download directory then.
+"""
 
 
 class EpisodeList(click.ParamType):
     name = "episodelist"
 
-    def convert(self, value, param=None, ctx=None) -> Tuple[List[EpisodeParam], int]:
+    def convert(self, value, param=None, ctx=None) -> EpisodeSelection:
+        if isinstance(value, EpisodeSelection):
+            return value
         biggest_last_n = 0
-        episodes = set()
-        episode_range_re = re.compile(r"^([0-9]{1,4})-([0-9]{1,4})$")
+        ranges = []
+        names = set()
+        date_ranges = []
+        title_patterns = []
+        newest = []
 
         for param in value.split(","):
             spec = param.upper()
 
             if spec.isnumeric():
-                episodes.add(EpisodeParam(spec.zfill(4)))
+                ranges.append((int(spec), int(spec)))
                 continue
 
             if spec == "LAST":
@@ -77,44 +57,161 @@ class EpisodeList(click.ParamType):
                 continue
 
             if spec.startswith("LAST:"):
-                # will be added at the end once, when we know the biggest n value
+                # will be selected once, with the biggest n value
                 n = int(spec.split(":")[1])
                 biggest_last_n = max(biggest_last_n, n)
                 continue
 
-            m = episode_range_re.match(spec)
+            m = _episode_range_re.match(spec)
             if m:
                 first, last = m.group(1, 2)
-                start, end = int(first), int(last) + 1
-                episodes |= set(EpisodeParam(f"{e:04}") for e in range(start, end))
+                ranges.append((int(first), int(last)))
+                continue
+
+            m = _date_range_re.match(spec)
+            if m and any(m.groups()):
+                since, until = (self._parse_date(d, param, ctx) for d in m.groups())
+                date_ranges.append((since, until))
+                continue
+
+            m = _newest_re.match(spec)
+            if m:
+                since = self._parse_date(m.group(2), param, ctx)
+                newest.append((int(m.group(1)), since))
+                continue
+
+            if spec.startswith("TITLE:"):
+                try:
+                    title_patterns.append(re.compile(param[6:], re.IGNORECASE))
+                except re.error as exc:
+                    message = f'"{param}" is not a valid regular expression: {exc}'
+                    self.fail(message, ctx=ctx)
                 continue
 
             if spec:
-                episodes.add(EpisodeParam(param))
+                names.add(EpisodeParam(param))
+
+        return EpisodeSelection(
+            merge_ranges(ranges),
+            tuple(sorted(names)),
+            biggest_last_n,
+            tuple(date_ranges),
+            tuple(title_patterns),
+            tuple(newest),
+        )
+
+    def _parse_date(self, value, part, ctx):
+        if value is None:
+            return None
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            self.fail(f'"{part}" has an invalid date: {value}', ctx=ctx)
+
+
+class Rate(click.ParamType):
+    name = "rate"
+
+    def convert(self, value, param=None, ctx=None) -> int:
+        from .ratelimit import parse_rate
+
+        try:
+            return parse_rate(value)
+        except ValueError:
+            self.fail(f'"{value}" is not a valid rate, e.g. 500K or 2M', param, ctx)
+
+
+class Size(click.ParamType):
+    name = "size"
+
+    def convert(self, value, param=None, ctx=None) -> int:
+        if isinstance(value, int):
+            return value
+        from .ratelimit import parse_size
+
+        try:
+            return parse_size(value)
+        except ValueError:
+            self.fail(f'"{value}" is not a valid size, e.g. 64K or 1M', param, ctx)
 
-        return sorted(episodes), biggest_last_n
+
+class RateSchedule(click.ParamType):
+    name = "schedule"
+
+    def convert(self, value, param=None, ctx=None) -> list:
+        from .ratelimit import parse_schedule
+
+        try:
+            return parse_schedule(value)
+        except ValueError:
+            self.fail(
+                f'"{value}" is not a valid schedule, e.g. 09:00-17:00=500K', param, ctx
+            )
+
+
+class ProgressFile(click.File):
+    """A file for the JSON progress. The standard output has the messages, the
+    JSON lines couldn't be read from it."""
+
+    def convert(self, value, param=None, ctx=None):
+        if value == "-":
+            self.fail("the standard output is used for the messages", param, ctx)
+        return super().convert(value, param, ctx)
+
+
+def load_registry(ctx, param, value):
+    # The XPaths are checked only when downloading, because compiling them loads
+    # lxml, which is not needed just for listing the podcasts
+    ctx.meta["registry"] = value
+    podcasts = _load_registry(ctx, value, check_xpaths=False)
+    # Eager options are processed in command line order, so the podcasts are
+    # listed here when --list-podcasts came first
+    if ctx.meta.get("list_podcasts"):
+        _list_podcasts(ctx, podcasts)
+    return podcasts
+
+
+def _load_registry(ctx, path, check_xpaths):
+    try:
+        return load_podcasts(path, check_xpaths)
+    except InvalidRegistry as exc:
+        raise click.BadParameter(str(exc), ctx=ctx, param_hint="'--registry'")
 
 
 def list_podcasts(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
+    if "known_podcasts" not in ctx.params:
+        ctx.meta["list_podcasts"] = True
+        return
+    _list_podcasts(ctx, ctx.params["known_podcasts"])
+
+
+def _list_podcasts(ctx, podcasts):
     click.echo("The following podcasts are supported:")
 
-    longest_name = max(len(p.name) for p in PODCASTS)
-    longest_title = max(len(p.title) for p in PODCASTS)
+    longest_name = max(len(p.name) for p in podcasts)
+    longest_title = max(len(p.title) for p in podcasts)
     format_str = "{:<%s}{:<%s}{}" % (longest_name + 4, longest_title + 4)
 
     click.echo(format_str.format("Name", "Title", "Webpage"))
     click.echo(format_str.format("----", "-----", "-------"))
 
-    for podcast in sorted(PODCASTS, key=attrgetter("name")):
+    for podcast in sorted(podcasts, key=attrgetter("name")):
         click.echo(format_str.format(podcast.name, podcast.title, podcast.url))
 
     ctx.exit()
 
 
 @click.command(help=HELP, context_settings={"help_option_names": ["--help", "-h"]})
-@click.argument("podcast_name", metavar="PODCAST", required=False)
+@click.argument("podcast_names", metavar="PODCAST...", nargs=-1)
+@click.option(
+    "-a",
+    "--all",
+    "all_podcasts",
+    is_flag=True,
+    help="Sync every supported podcast.",
+)
 @click.option(
     "-d",
     "--download-dir",
@@ -123,14 +220,21 @@ def list_podcasts(ctx, param, value):
     envvar="DOWNLOAD_DIR",
     help=(
         "Where to save downloaded episodes. Can be specified by the "
-        "DOWNLOAD_DIR environment variable.  [default: name of PODCAST]"
+        "DOWNLOAD_DIR environment variable.  [default: name of PODCAST, "
+        "or the current directory for multiple podcasts]"
     ),
 )
 @click.option(
     "-e",
     "--episodes",
     "episodes_param",
-    help="Episodes to download.",
+    help=(
+        "Episodes to download, separated by commas: episode numbers and ranges"
+        " (1,5-10), filenames and titles, last or last:N, newest:N or"
+        " newest:N@DATE (the N most recently published since DATE), publishing"
+        " date ranges (2024-01-01..2024-06-30, either end can be left out) and"
+        " title:REGEX."
+    ),
     type=EpisodeList(),
 )
 @click.option(
@@ -145,17 +249,56 @@ def list_podcasts(ctx, param, value):
     expose_value=False,
     callback=list_podcasts,
 )
+@click.option(
+    "--registry",
+    "known_podcasts",
+    type=Path,
+    default=None,
+    envvar="PODCAST_REGISTRY",
+    help=(
+        "TOML file with more podcasts and their parsing rules, which replace the"
+        " built-in podcasts with the same name. Can be specified with the"
+        " PODCAST_REGISTRY environment variable."
+        "  [default: ~/.config/podcast-dl/podcasts.toml, if it exists]"
+    ),
+    is_eager=True,
+    callback=load_registry,
+)
+@click.option(
+    "--check-size",
+    is_flag=True,
+    help=(
+        "Download episodes again when the file size is not the same as "
+        "in the RSS feed."
+    ),
+)
 @click.option(
     "-p",
     "--progress",
     "show_progressbar",
     is_flag=True,
-    help="Show progress bar instead of detailed messages during download.",
+    help=(
+        "Show the downloaded bytes, throughput and ETA of every download instead"
+        " of detailed messages."
+    ),
+)
+@click.option(
+    "--progress-json",
+    type=ProgressFile("w"),
+    default=None,
+    help="Write the progress as JSON lines to this file.",
+)
+@click.option(
+    "--progress-interval",
+    type=click.FloatRange(0.05),
+    default=0.5,
+    help="Update the progress this many seconds apart.",
+    show_default=True,
 )
 @click.option(
     "-t",
     "--max-threads",
-    type=click.IntRange(0, 10),
+    type=click.IntRange(1),
     default=10,
     envvar="MAX_THREADS",
     help=(
@@ -164,6 +307,249 @@ def list_podcasts(ctx, param, value):
     ),
     show_default=True,
 )
+@click.option(
+    "-o",
+    "--order",
+    type=click.Choice(EPISODE_ORDERS),
+    default="filename",
+    envvar="ORDER",
+    help=(
+        "The order of downloading the episodes: by filename, newest first,"
+        " smallest first or by episode number. Can be specified with the ORDER"
+        " environment variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--max-per-host",
+    type=click.IntRange(1),
+    default=None,
+    envvar="MAX_PER_HOST",
+    help=(
+        "The maximum number of simultaneous downloads from the same host. Can be"
+        " specified with the MAX_PER_HOST environment variable.  [default: no limit]"
+    ),
+)
+@click.option(
+    "--segments",
+    type=click.IntRange(1, 16),
+    default=1,
+    envvar="SEGMENTS",
+    help=(
+        "Download large episodes in this many parts at the same time, when there"
+        " are free connections. Can be specified with the SEGMENTS environment"
+        " variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--write-buffer-size",
+    type=Size(),
+    default="1M",
+    envvar="WRITE_BUFFER_SIZE",
+    help=(
+        "Collect this many bytes before writing them to the disk. Can be"
+        " specified with the WRITE_BUFFER_SIZE environment variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--preallocate",
+    is_flag=True,
+    envvar="PREALLOCATE",
+    help=(
+        "Allocate the disk space for the whole episode before downloading it."
+        " Interrupted preallocated downloads are started again, not resumed."
+    ),
+)
+@click.option(
+    "--max-connections",
+    type=click.IntRange(1),
+    default=None,
+    envvar="MAX_CONNECTIONS",
+    help=(
+        "The maximum number of open connections in the connection pool. Can be"
+        " specified with the MAX_CONNECTIONS environment variable."
+        "  [default: the maximum number of simultaneous downloads]"
+    ),
+)
+@click.option(
+    "--keepalive-expiry",
+    type=click.FloatRange(0),
+    default=5.0,
+    envvar="KEEPALIVE_EXPIRY",
+    help=(
+        "Seconds to keep idle connections open for reuse. Can be specified with"
+        " the KEEPALIVE_EXPIRY environment variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--timeout",
+    type=click.FloatRange(0, min_open=True),
+    default=5.0,
+    envvar="TIMEOUT",
+    help=(
+        "Seconds to wait for connecting and for every read and write on the"
+        " network. Can be specified with the TIMEOUT environment variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--http2",
+    is_flag=True,
+    envvar="HTTP2",
+    help=(
+        "Use HTTP/2 when the server supports it. Needs the http2 extra:"
+        ' pip install "simple-podcast-dl[http2]"'
+    ),
+)
+@click.option(
+    "--limit-rate",
+    type=Rate(),
+    default=None,
+    envvar="LIMIT_RATE",
+    help=(
+        "The maximum download speed for all downloads in bytes per second,"
+        " e.g. 500K or 2M. Can be specified with the LIMIT_RATE environment"
+        " variable.  [default: no limit]"
+    ),
+)
+@click.option(
+    "--limit-rate-per-host",
+    type=Rate(),
+    default=None,
+    envvar="LIMIT_RATE_PER_HOST",
+    help=(
+        "The maximum download speed from the same host in bytes per second."
+        " Can be specified with the LIMIT_RATE_PER_HOST environment variable."
+    ),
+)
+@click.option(
+    "--limit-schedule",
+    type=RateSchedule(),
+    default="",
+    envvar="LIMIT_SCHEDULE",
+    help=(
+        "Use different --limit-rate in time windows, e.g."
+        " 09:00-17:00=500K,17:00-19:00=2M, 0 means no limit. Can be specified"
+        " with the LIMIT_SCHEDULE environment variable."
+    ),
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(0),
+    default=3,
+    envvar="RETRIES",
+    help=(
+        "How many times to retry failed requests, with exponential backoff. Can"
+        " be specified with the RETRIES environment variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--retry-backoff",
+    type=click.FloatRange(0),
+    default=1.0,
+    envvar="RETRY_BACKOFF",
+    help=(
+        "Seconds to wait before the first retry, doubled for every next one."
+        " Can be specified with the RETRY_BACKOFF environment variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--max-host-failures",
+    type=click.IntRange(0),
+    default=5,
+    envvar="MAX_HOST_FAILURES",
+    help=(
+        "Stop sending requests to a host for a minute after this many failed"
+        " requests in a row, 0 means never. Can be specified with the"
+        " MAX_HOST_FAILURES environment variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--state-db",
+    type=Path,
+    default=None,
+    envvar="STATE_DB",
+    help=(
+        "SQLite database for keeping track of downloaded episodes, so they are"
+        " not downloaded again after moving or deleting the files. Can be shared"
+        " by multiple processes, and specified by the STATE_DB environment"
+        " variable."
+    ),
+)
+@click.option(
+    "--cache-dir",
+    type=Path,
+    default=None,
+    envvar="CACHE_DIR",
+    help=(
+        "Where to store downloaded RSS feeds between runs. Can be specified by the "
+        "CACHE_DIR environment variable.  [default: ~/.cache/podcast-dl]"
+    ),
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always download the whole RSS feed, even if it has not changed.",
+)
+@click.option(
+    "--metrics-log",
+    type=Path,
+    default=None,
+    envvar="METRICS_LOG",
+    help=(
+        "Append timings of downloading and parsing feeds, finding missing episodes,"
+        " downloads and HTTP connections to this file as JSON lines. Can be"
+        " specified with the METRICS_LOG environment variable."
+    ),
+)
+@click.option(
+    "--metrics-textfile",
+    type=Path,
+    default=None,
+    envvar="METRICS_TEXTFILE",
+    help=(
+        "Write the total timings and downloaded bytes to this file in the"
+        " Prometheus text format, e.g. for the textfile collector of the node"
+        " exporter. Can be specified with the METRICS_TEXTFILE environment"
+        " variable."
+    ),
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help=(
+        "Keep running and download new episodes as they come out. Every feed is"
+        " polled on its own schedule, based on how often episodes are published."
+    ),
+)
+@click.option(
+    "--watch-min-interval",
+    type=click.FloatRange(1),
+    default=15 * 60,
+    envvar="WATCH_MIN_INTERVAL",
+    help=(
+        "Never poll a feed more often than this many seconds in watch mode. Can be"
+        " specified with the WATCH_MIN_INTERVAL environment variable."
+    ),
+    show_default=True,
+)
+@click.option(
+    "--watch-max-interval",
+    type=click.FloatRange(1),
+    default=6 * 60 * 60,
+    envvar="WATCH_MAX_INTERVAL",
+    help=(
+        "Poll every feed at least this often in seconds in watch mode. Can be"
+        " specified with the WATCH_MAX_INTERVAL environment variable."
+    ),
+    show_default=True,
+)
 @click.option(
     "-v", "--verbose", is_flag=True, help="Show detailed informations during download."
 )
@@ -171,12 +557,40 @@ def list_podcasts(ctx, param, value):
 @click.pass_context
 def main(
     ctx,
-    podcast_name,
+    podcast_names,
+    all_podcasts,
     download_dir,
     max_threads,
+    order,
+    max_per_host,
+    segments,
+    write_buffer_size,
+    preallocate,
+    max_connections,
+    keepalive_expiry,
+    timeout,
+    http2,
+    limit_rate,
+    limit_rate_per_host,
+    limit_schedule,
+    retries,
+    retry_backoff,
+    max_host_failures,
     episodes_param,
     show_episodes,
+    known_podcasts,
+    check_size,
     show_progressbar,
+    progress_json,
+    progress_interval,
+    state_db,
+    cache_dir,
+    no_cache,
+    metrics_log,
+    metrics_textfile,
+    watch,
+    watch_min_interval,
+    watch_max_interval,
     verbose,
 ):
     if len(sys.argv) == 1:
@@ -186,111 +600,111 @@ def main(
 
     # We have to handle this because it's not required,
     # to be able to show help when run without arguments
-    if podcast_name is None:
+    if not podcast_names and not all_podcasts:
         raise click.UsageError('Missing argument "PODCAST".', ctx=ctx)
 
-    try:
-        podcast = parse_site(podcast_name)
-    except InvalidSite:
-        raise click.BadArgumentUsage(
-            f'The given podcast "{podcast_name}" is not supported or invalid.\n'
-            f'See the list of supported podcasts with "{ctx.info_name} --list-podcasts"',
-            ctx=ctx,
-        )
+    if watch and show_episodes:
+        raise click.UsageError("--watch can't be used with --show-episodes.", ctx=ctx)
 
-    vprint = click.secho if verbose else _noprint
-    loop = _make_asyncio_loop()
-    http = _make_async_http_client(loop)
-    rss_root = loop.run_until_complete(download_rss(http, podcast.rss))
-    all_rss_items = get_all_rss_items(rss_root, podcast.rss_parser)
-
-    if episodes_param is not None:
-        episode_params, last_n = episodes_param
-        rss_items, unknown_episodes = filter_rss_items(
-            all_rss_items, episode_params, last_n
-        )
-        _warn_about_unknown_episodes(unknown_episodes)
+    known_podcasts = _load_registry(ctx, ctx.meta["registry"], check_xpaths=True)
+    if all_podcasts:
+        podcasts = known_podcasts
     else:
-        rss_items = all_rss_items
-
-    if show_episodes:
-        _list_episodes(rss_items)
-        return 0
-
-    if download_dir is None:
-        download_dir = Path(podcast.name)
-    ensure_download_dir(download_dir)
-    episodes = make_episodes(download_dir, rss_items)
-    missing_episodes = find_missing(episodes, vprint)
-
-    if not missing_episodes:
-        click.secho("Every episode is downloaded.", fg="green")
-        return 0
-
-    click.echo(f"Found a total of {len(missing_episodes)} missing episodes.")
-    progressbar = _make_progressbar(show_progressbar, len(missing_episodes))
-    dl_coro = download_episodes(
-        http, missing_episodes, max_threads, vprint, progressbar
+        podcasts = _parse_podcasts(ctx, podcast_names, known_podcasts)
+    multiple = len(podcasts) > 1
+    if multiple and download_dir is None:
+        download_dir = Path()
+
+    # Imported only here, so --help and --list-podcasts don't have to load the
+    # HTTP client and the XML parser
+    from . import metrics
+    from .feed_cache import FeedCache, default_cache_dir
+    from .retry import CircuitBreaker, RetryPolicy
+    from .watch import FeedWatcher
+    from .podcast_dl import DownloadSettings
+    from .sync import (
+        Sync,
+        enable_metrics,
+        make_async_http_client,
+        make_asyncio_loop,
+        make_rate_limiter,
+        make_state_db,
+        run_until_complete,
+        watch_podcasts,
     )
 
+    vprint = click.secho if verbose else _noprint
+    metrics_enabled = enable_metrics(metrics_log, metrics_textfile)
+    loop = make_asyncio_loop()
+    if max_connections is None:
+        max_connections = max(max_threads, len(podcasts))
     try:
-        loop.run_until_complete(dl_coro)
-    except KeyboardInterrupt:
-        for task in asyncio.Task.all_tasks():
-            task.cancel()
-        click.secho("CTRL-C pressed, aborting...", fg="yellow", err=True)
-        return 1
-
-    click.secho("Done.", fg="green")
-    return 0
-
-
-def _noprint(*args, **kwargs):
-    """Do nothing with the arguments. Used for suppressing print output."""
-
-
-def _list_episodes(rss_items):
-    click.echo("List of episodes:")
-    for item in rss_items:
-        episodenum = item.episode or " N/A"
-        click.echo(f"{episodenum} - {item.title}")
-
-
-def _make_asyncio_loop():
-    loop = asyncio.get_event_loop()
-    atexit.register(loop.close)
-    return loop
-
-
-def _make_async_http_client(loop):
-    http = httpx.AsyncClient()
-    atexit.register(lambda: loop.run_until_complete(http.aclose()))
-    return http
-
-
-def _warn_about_unknown_episodes(unknown_episodes):
-    if unknown_episodes:
-        click.secho(
-            "WARNING: Unknown episode numbers:"
-            + ", ".join(str(e) for e in unknown_episodes),
-            fg="yellow",
-            err=True,
+        http = make_async_http_client(
+            loop,
+            max_connections,
+            keepalive_expiry,
+            timeout,
+            http2,
+            make_rate_limiter(limit_rate, limit_rate_per_host, limit_schedule),
+            metrics.http_event_hooks() if metrics_enabled else None,
         )
-
-
-def _make_progressbar(show_progressbar, length):
-    if show_progressbar:
-        return click.progressbar(length=length)
+    except ImportError:
+        raise click.UsageError(
+            'HTTP/2 support is not installed, install it with: pip install "simple-podcast-dl[http2]"',
+            ctx=ctx,
+        )
+    feed_cache = None if no_cache else FeedCache(cache_dir or default_cache_dir())
+    state = make_state_db(state_db)
+    retry_policy = RetryPolicy(attempts=retries + 1, backoff=retry_backoff)
+    circuit_breaker = CircuitBreaker(max_host_failures)
+    settings = DownloadSettings(segments, check_size, write_buffer_size, preallocate)
+
+    sync = Sync(
+        http,
+        download_dir,
+        multiple,
+        feed_cache,
+        state,
+        episodes_param,
+        show_episodes,
+        show_progressbar,
+        order,
+        max_threads,
+        max_per_host,
+        settings,
+        retry_policy,
+        circuit_breaker,
+        vprint,
+        metrics_textfile,
+        progress_json,
+        progress_interval,
+    )
+    if watch:
+        watcher = FeedWatcher(watch_min_interval, watch_max_interval)
+        coro = watch_podcasts(sync, watcher, podcasts)
     else:
-        return _NoProgressbar()
+        coro = sync.run(podcasts)
 
+    # The return value of the command is not the exit code in standalone mode
+    ctx.exit(run_until_complete(loop, coro))
 
-class _NoProgressbar:
-    def __enter__(self):
-        return self
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        pass
+def _parse_podcasts(ctx, podcast_names, known_podcasts):
+    podcast_map = {podcast.name: podcast for podcast in known_podcasts}
+    podcasts = []
+    for podcast_name in podcast_names:
+        try:
+            podcast = parse_site(podcast_name, podcast_map)
+        except InvalidSite:
+            raise click.BadArgumentUsage(
+                f'The given podcast "{podcast_name}" is not supported or invalid.\n'
+                f'See the list of supported podcasts with "{ctx.info_name} --list-podcasts"',
+                ctx=ctx,
+            )
+        if podcast not in podcasts:
+            podcasts.append(podcast)
+    return podcasts
 
-    def update(self, value):
-        """Do nothing. Used when no progress bar needed."""
+
+def _noprint(*args, **kwargs):
+    """Do nothing with the arguments. Used for suppressing print output."""
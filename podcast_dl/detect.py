@@ -0,0 +1,56 @@
+"""
+Detecting the parser of feeds which don't have one, e.g. the ones given by an
+arbitrary RSS URL. Every candidate parser is tried on the first items of the feed,
+and the one which makes unique filenames with the most episode numbers wins.
+"""
+import re
+
+from . import rss_parsers as rssp
+
+# Items from the start of the feed to detect the parser with
+SAMPLE_SIZE = 50
+
+# The extension of the URL path, without the query string, e.g. episode.mp3?s=1
+_FILE_EXT = re.compile(r"^[^?#]*(\.\w+)(?:[?#]|$)")
+_PLAIN_FILE_EXT = re.compile(r"^\.\w+$")
+# Example titles: "#95 Unleash the py-spy!", "Episode 12: Packaging", "7 - Intro"
+_TITLE_NUMBER = r"^\s*(?:#|episode\s*|ep\.?\s*)?{}\s*[:|.\-–—]?\s+"
+_EPISODE_IN_TITLE = re.compile(_TITLE_NUMBER.format("([0-9]+)"), re.IGNORECASE)
+_TITLE_AFTER_EPISODE = re.compile(
+    _TITLE_NUMBER.format("[0-9]+") + "(.+)$", re.IGNORECASE
+)
+
+# In order of preference, when more than one of them are just as good
+CANDIDATES = {
+    "itunes": rssp.make_rule_parser("ItunesItem", file_ext_regex=_FILE_EXT),
+    "title-number": rssp.make_rule_parser(
+        "TitleNumberItem",
+        title_regex=_TITLE_AFTER_EPISODE,
+        episode_regex=_EPISODE_IN_TITLE,
+        file_ext_regex=_FILE_EXT,
+    ),
+}
+_CANDIDATE_NAMES = {parser: name for name, parser in CANDIDATES.items()}
+
+
+def detect_parser(sample) -> type[rssp.BaseItem]:
+    """The best candidate parser for the sample of <item> elements."""
+    # max() returns the first of the best ones
+    return max(CANDIDATES.values(), key=lambda parser: _score(parser, sample))
+
+
+def _score(parser, sample):
+    try:
+        items = [parser(item_elem) for item_elem in sample]
+    except (ValueError, LookupError, TypeError, AttributeError):
+        # The feed would fail with this parser
+        return (False,)
+    unique_filenames = len({item.filename for item in items}) == len(items)
+    plain_file_exts = sum(1 for i in items if _PLAIN_FILE_EXT.match(i.file_ext))
+    episodes = len({item.episode for item in items if item.episode})
+    return True, unique_filenames, plain_file_exts, episodes
+
+
+def parser_name(parser: type[rssp.BaseItem]) -> str | None:
+    """The name of a detected parser, for caching the detection of the feed."""
+    return _CANDIDATE_NAMES.get(parser)
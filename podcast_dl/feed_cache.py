@@ -0,0 +1,104 @@
+"""
+On-disk cache of RSS feeds, used for conditional requests with ETag/Last-Modified.
+"""
+import os
+import json
+import hashlib
+import contextlib
+from pathlib import Path
+
+
+def default_cache_dir() -> Path:
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(xdg_cache_home) / "podcast-dl"
+
+
+class FeedCache:
+    """Stores the last downloaded body and validators of every RSS feed by URL.
+
+    Validators are sent back to the server whenever the body is cached. When the
+    feed has not changed, the sync can only be skipped if the last complete sync
+    covered the same episodes, otherwise the cached body is used instead.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+
+    def _paths(self, rss_url: str):
+        key = hashlib.sha1(rss_url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.xml", self.cache_dir / f"{key}.json"
+
+    def _load_meta(self, rss_url: str) -> dict:
+        _, meta_path = self._paths(rss_url)
+        try:
+            return json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self, rss_url: str, meta: dict):
+        _, meta_path = self._paths(rss_url)
+        partial_path = meta_path.with_name(meta_path.name + ".partial")
+        partial_path.write_text(json.dumps(meta))
+        partial_path.rename(meta_path)
+
+    def conditional_headers(self, rss_url: str) -> dict:
+        # The metadata is saved after the whole body
+        meta = self._load_meta(rss_url)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def iter_chunks(self, rss_url: str, chunk_size: int = 64 * 1024):
+        body_path, _ = self._paths(rss_url)
+        with body_path.open("rb") as fp:
+            while chunk := fp.read(chunk_size):
+                yield chunk
+
+    @contextlib.contextmanager
+    def storing(self, rss_url: str, headers):
+        """Open the cache file for writing the body chunk by chunk.
+        The previously cached feed is only replaced when the body is complete."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        body_path, _ = self._paths(rss_url)
+        partial_path = body_path.with_name(body_path.name + ".partial")
+        with partial_path.open("wb") as fp:
+            yield fp
+        partial_path.rename(body_path)
+        meta = {
+            "url": rss_url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "synced": None,
+        }
+        # The detected parser is kept, it doesn't change with the feed
+        parser = self.detected_parser(rss_url)
+        if parser is not None:
+            meta["parser"] = parser
+        self._save_meta(rss_url, meta)
+
+    def mark_synced(self, rss_url: str, synced: dict):
+        """Record what the sync of the cached feed covered, e.g. the download
+        directory and the selected episodes."""
+        meta = self._load_meta(rss_url)
+        if not meta:
+            return
+        meta["synced"] = synced
+        self._save_meta(rss_url, meta)
+
+    def is_synced(self, rss_url: str, synced: dict) -> bool:
+        """Whether the cached feed has been synced the same way already."""
+        return self._load_meta(rss_url).get("synced") == synced
+
+    def detected_parser(self, rss_url: str) -> str | None:
+        """The name of the parser detected for the feed the first time."""
+        return self._load_meta(rss_url).get("parser")
+
+    def store_detected_parser(self, rss_url: str, name: str):
+        meta = self._load_meta(rss_url)
+        if not meta:
+            return
+        meta["parser"] = name
+        self._save_meta(rss_url, meta)
@@ -0,0 +1,215 @@
+"""
+Timing spans and counters of the sync, exported as JSON lines while syncing and
+as a Prometheus textfile at the end.
+
+Metrics are disabled by default, then spans and counters cost next to nothing.
+"""
+import json
+import time
+import contextlib
+from pathlib import Path
+
+PROMETHEUS_PREFIX = "podcast_dl"
+
+
+class Span:
+    """A timed operation. Labels are exported to Prometheus too, so they should
+    have few different values, everything else should be an attribute."""
+
+    __slots__ = ("name", "labels", "attributes", "started_at", "duration")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.attributes = {}
+        self.started_at = time.time()
+        self.duration = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def set(self, **attributes):
+        pass
+
+
+class NoRecorder:
+    """Used when metrics are disabled."""
+
+    def span(self, name, **labels):
+        return _NO_SPAN
+
+    def record(self, name, duration, **labels):
+        pass
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def write_prometheus(self, path):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Recorder:
+    """Collects the totals of spans and counters for Prometheus, and writes every
+    span to the JSON lines file as soon as it is finished."""
+
+    def __init__(self, jsonl_file=None, clock=time.perf_counter):
+        self._jsonl_file = jsonl_file
+        self._clock = clock
+        # (name, labels) -> [total seconds, count]
+        self._span_totals = {}
+        # (name, labels) -> value
+        self._counters = {}
+
+    @contextlib.contextmanager
+    def span(self, name: str, **labels):
+        span = Span(name, labels)
+        started = self._clock()
+        try:
+            yield span
+        except BaseException as exc:
+            span.set(error=type(exc).__name__)
+            raise
+        finally:
+            span.duration = self._clock() - started
+            self._finish(span)
+
+    def record(self, name: str, duration: float, **labels):
+        """Record a span which was timed by someone else."""
+        span = Span(name, labels)
+        span.started_at -= duration
+        span.duration = duration
+        self._finish(span)
+
+    def count(self, name: str, value=1, **labels):
+        key = (name, _label_items(labels))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _finish(self, span):
+        key = (span.name, _label_items(span.labels))
+        totals = self._span_totals.setdefault(key, [0.0, 0])
+        totals[0] += span.duration
+        totals[1] += 1
+        if self._jsonl_file is not None:
+            line = {
+                "span": span.name,
+                "started_at": span.started_at,
+                "duration": span.duration,
+                **span.labels,
+                **span.attributes,
+            }
+            self._jsonl_file.write(json.dumps(line, default=str) + "\n")
+
+    def prometheus_text(self) -> str:
+        lines = []
+        if self._span_totals:
+            metric = f"{PROMETHEUS_PREFIX}_span_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for (name, labels), (total, count) in sorted(self._span_totals.items()):
+                label_text = _format_labels((("span", name),) + labels)
+                lines.append(f"{metric}_sum{label_text} {total}")
+                lines.append(f"{metric}_count{label_text} {count}")
+        for name in sorted({name for name, _ in self._counters}):
+            metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, labels), value in sorted(self._counters.items()):
+                if counter_name == name:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path):
+        """Write the metrics for the textfile collector of the node exporter.
+        The file is replaced atomically, so it is never read half written."""
+        partial_path = path.with_name(path.name + ".partial")
+        partial_path.write_text(self.prometheus_text())
+        partial_path.rename(path)
+
+
+def _label_items(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_items) -> str:
+    if not label_items:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in label_items
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+_recorder = NoRecorder()
+
+
+def enable(recorder: Recorder):
+    global _recorder
+    _recorder = recorder
+
+
+def disable():
+    global _recorder
+    _recorder = NoRecorder()
+
+
+def span(name: str, **labels):
+    """Time the code in the with block:
+
+    with metrics.span("find_missing", podcast=name) as span:
+        ...
+        span.set(missing=len(missing))
+    """
+    return _recorder.span(name, **labels)
+
+
+def record(name: str, duration: float, **labels):
+    _recorder.record(name, duration, **labels)
+
+
+def count(name: str, value=1, **labels):
+    _recorder.count(name, value, **labels)
+
+
+def write_prometheus(path: Path):
+    _recorder.write_prometheus(path)
+
+
+def http_event_hooks() -> dict:
+    """httpx event hooks which record the connection-level timings of every
+    request: connecting (with resolving the name), the TLS handshake, sending the
+    request, waiting for the response headers and reading the body."""
+
+    async def on_request(request):
+        request.extensions["trace"] = _make_trace(request.url.host)
+
+    async def on_response(response):
+        host = response.request.url.host
+        count("http_responses", host=host, status=response.status_code)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def _make_trace(host):
+    started = {}
+
+    async def trace(event_name, info):
+        # Example: "http11.receive_response_headers.started"
+        phase, _, state = event_name.rpartition(".")
+        if state == "started":
+            started[phase] = time.perf_counter()
+        elif phase in started:
+            duration = time.perf_counter() - started.pop(phase)
+            name = "http_" + phase.rpartition(".")[2]
+            record(name, duration, host=host, failed=state == "failed")
+
+    return trace
@@ -0,0 +1,406 @@
+"""
+Local stand-in for podcast servers, for testing and load testing downloads offline.
+
+It serves a generated RSS feed for every supported podcast and large synthetic
+episodes, with configurable latency, bandwidth and injected errors. Episodes support
+Range requests and have ETags, feeds can be requested conditionally.
+
+    python -m podcast_dl.mockserver --episodes 50 --episode-size 50M
+"""
+import os
+import re
+import sys
+import time
+import random
+import asyncio
+import hashlib
+import contextlib
+import subprocess
+from pathlib import Path
+from urllib.parse import urlparse
+
+import attrs
+import click
+
+from . import rss_parsers as rssp
+from .podcasts import PODCAST_MAP, PODCASTS, Podcast
+from .cli import Size
+
+# Episodes are generated from a repeated block, so they don't have to be in memory
+BLOCK_SIZE = 64 * 1024
+
+# The enclosure URLs of these feeds have tracking parameters, which their parsers
+# expect to be there
+_URL_PARAMS = {rssp.IndieHackersItem: "?s=1", rssp.CoRecursiveItem: "?s=1"}
+
+_feed_re = re.compile(r"^/feeds/([\w-]+)\.xml$")
+_episode_re = re.compile(r"^/episodes/([\w-]+)/([0-9]+)\.mp3$")
+_range_re = re.compile(r"^bytes=([0-9]*)-([0-9]*)$")
+
+ITEM_TEMPLATE = """
+    <item>
+      <title>#{n} - {podcast_title} episode {n}</title>
+      <itunes:title>#{n} - {podcast_title} episode {n}</itunes:title>
+      <itunes:episode>{n}</itunes:episode>
+      <link>{base_url}/{name}/{n}</link>
+      <guid isPermaLink="false">{name}-{n}</guid>
+      <pubDate>{pub_date}</pubDate>
+      <enclosure url="{base_url}/episodes/{name}/{n}.mp3{params}" length="{size}"
+                 type="audio/mpeg"/>
+    </item>"""
+
+STATUS_REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    304: "Not Modified",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    416: "Range Not Satisfiable",
+    503: "Service Unavailable",
+}
+
+
+@attrs.frozen
+class ServerConfig:
+    # Number of episodes in every feed
+    episodes: int = 20
+    episode_size: int = 8 * 1024 * 1024
+    # Seconds to wait before sending the response headers
+    latency: float = 0.0
+    # Bytes per second for every response, 0 means unlimited
+    bandwidth: int = 0
+    # Ratio of requests answered with 503 Service Unavailable
+    error_rate: float = 0.0
+    # Ratio of episode responses which are cut off in the middle of the body
+    truncate_rate: float = 0.0
+    seed: int | None = None
+
+    def to_args(self) -> list[str]:
+        """Command line arguments for running the server with this config."""
+        args = [
+            f"--episodes={self.episodes}",
+            f"--episode-size={self.episode_size}",
+            f"--latency={self.latency}",
+            f"--bandwidth={self.bandwidth}",
+            f"--error-rate={self.error_rate}",
+            f"--truncate-rate={self.truncate_rate}",
+        ]
+        if self.seed is not None:
+            args.append(f"--seed={self.seed}")
+        return args
+
+
+def episode_etag(name: str, number: int, size: int) -> str:
+    return f'"{name}-{number}-{size}"'
+
+
+def _episode_block(name: str, number: int) -> bytes:
+    digest = hashlib.sha256(f"{name}/{number}".encode()).digest()
+    return (digest * (BLOCK_SIZE // len(digest)))[:BLOCK_SIZE]
+
+
+def iter_episode_content(name: str, number: int, start: int, end: int):
+    """The bytes of an episode from start to end (inclusive) in chunks."""
+    block = memoryview(_episode_block(name, number))
+    position = start
+    while position <= end:
+        offset = position % BLOCK_SIZE
+        length = min(BLOCK_SIZE - offset, end + 1 - position)
+        yield block[offset : offset + length]
+        position += length
+
+
+def episode_content(name: str, number: int, size: int) -> bytes:
+    """The whole content of an episode, for checking small downloads."""
+    return b"".join(iter_episode_content(name, number, 0, size - 1))
+
+
+def generate_feed(podcast: Podcast, base_url: str, config: ServerConfig) -> bytes:
+    """An RSS feed with weekly episodes, which the parser of the podcast can read."""
+    week = 7 * 24 * 60 * 60
+    newest = 1_700_000_000
+    items = "".join(
+        ITEM_TEMPLATE.format(
+            n=n,
+            name=podcast.name,
+            podcast_title=podcast.title,
+            base_url=base_url,
+            params=_URL_PARAMS.get(podcast.rss_parser, ""),
+            size=config.episode_size,
+            pub_date=time.strftime(
+                "%a, %d %b %Y %H:%M:%S +0000",
+                time.gmtime(newest - (config.episodes - n) * week),
+            ),
+        )
+        for n in range(1, config.episodes + 1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+        f"<channel><title>{podcast.title}</title><link>{base_url}</link>"
+        f"{items}</channel></rss>"
+    ).encode()
+
+
+class _Request:
+    def __init__(self, method: str, path: str, headers: dict):
+        self.method = method
+        self.path = path
+        self.headers = headers
+
+
+class MockServer:
+    """HTTP/1.1 server with keep-alive connections, running in the current event
+    loop. Use it as an async context manager:
+
+        async with MockServer(ServerConfig(episodes=5)) as server:
+            podcasts = server.podcasts()
+    """
+
+    def __init__(self, config=ServerConfig(), host="127.0.0.1", port=0):
+        self.config = config
+        self._host = host
+        self._port = port
+        self._server = None
+        self._handlers = set()
+        self._random = random.Random(config.seed)
+        self._feeds = {}
+        self.requests = 0
+        self.bytes_sent = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def podcasts(self) -> list[Podcast]:
+        """Every supported podcast with its RSS feed on this server."""
+        return server_podcasts(self.url)
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection, self._host, self._port
+        )
+
+    async def close(self):
+        self._server.close()
+        # Idle keep-alive connections would be open until the clients close them
+        for handler in self._handlers:
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _handle_connection(self, reader, writer):
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                self.requests += 1
+                keep_alive = await self._respond(request, writer)
+                if not keep_alive or request.headers.get("connection") == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The client closed the connection
+            pass
+        except asyncio.CancelledError:
+            # The server is closed, the handler should finish without an error
+            pass
+        finally:
+            self._handlers.discard(handler)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = request_line.split(" ", 2)
+        headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        return _Request(method, urlparse(target).path, headers)
+
+    async def _respond(self, request, writer) -> bool:
+        """Send the response, return whether the connection can be reused."""
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        if request.method != "GET":
+            return await self._send(writer, 405)
+        if self._random.random() < self.config.error_rate:
+            return await self._send(writer, 503)
+
+        if m := _feed_re.match(request.path):
+            return await self._send_feed(request, writer, m.group(1))
+        if m := _episode_re.match(request.path):
+            name, number = m.group(1), int(m.group(2))
+            if name in PODCAST_MAP and 1 <= number <= self.config.episodes:
+                return await self._send_episode(request, writer, name, number)
+        return await self._send(writer, 404)
+
+    async def _send_feed(self, request, writer, name):
+        if name not in PODCAST_MAP:
+            return await self._send(writer, 404)
+        etag = f'"feed-{name}-{self.config.episodes}"'
+        if request.headers.get("if-none-match") == etag:
+            return await self._send(writer, 304, {"ETag": etag})
+        if name not in self._feeds:
+            self._feeds[name] = generate_feed(PODCAST_MAP[name], self.url, self.config)
+        headers = {"ETag": etag, "Content-Type": "application/rss+xml"}
+        return await self._send(writer, 200, headers, [self._feeds[name]])
+
+    async def _send_episode(self, request, writer, name, number):
+        size = self.config.episode_size
+        etag = episode_etag(name, number, size)
+        headers = {"ETag": etag, "Accept-Ranges": "bytes", "Content-Type": "audio/mpeg"}
+        status, start, end = 200, 0, size - 1
+
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        unsatisfiable = {"Content-Range": f"bytes */{size}"}
+        # A changed episode is sent as a whole
+        if range_header and (if_range is None or if_range == etag):
+            m = _range_re.match(range_header)
+            if m is None or m.groups() == ("", ""):
+                return await self._send(writer, 416, unsatisfiable)
+            first, last = m.groups()
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            else:
+                # The last n bytes
+                start, end = max(0, size - int(last)), size - 1
+            if start >= size or start > end:
+                return await self._send(writer, 416, unsatisfiable)
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        body = iter_episode_content(name, number, start, end)
+        truncate = self._random.random() < self.config.truncate_rate
+        length = end + 1 - start
+        return await self._send(writer, status, headers, body, length, truncate)
+
+    async def _send(
+        self, writer, status, headers=None, body=(), length=None, truncate=False
+    ):
+        if length is None:
+            body = list(body)
+            length = sum(map(len, body))
+        head = [f"HTTP/1.1 {status} {STATUS_REASONS[status]}"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        if status != 304:
+            head.append(f"Content-Length: {length}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+        sent = 0
+        started = time.monotonic()
+        for chunk in body:
+            if truncate and sent + len(chunk) > length // 2:
+                # Close the connection in the middle of the body
+                await writer.drain()
+                return False
+            writer.write(chunk)
+            sent += len(chunk)
+            self.bytes_sent += len(chunk)
+            await writer.drain()
+            if self.config.bandwidth:
+                ahead = sent / self.config.bandwidth - (time.monotonic() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        await writer.drain()
+        return True
+
+
+@contextlib.contextmanager
+def subprocess_server(config=ServerConfig()):
+    """Run the server in a separate process, so it doesn't take CPU time from the
+    event loop of the downloads. Yields the URL of the server."""
+    command = [sys.executable, "-m", "podcast_dl.mockserver", "--port=0"]
+    # The package is importable in the subprocess even when it is not installed,
+    # e.g. when the benchmarks are run from outside the repository
+    package_root = str(Path(__file__).resolve().parent.parent)
+    pythonpath = os.environ.get("PYTHONPATH")
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [package_root, pythonpath])),
+    }
+    process = subprocess.Popen(
+        command + config.to_args(), stdout=subprocess.PIPE, text=True, env=env
+    )
+    try:
+        # The first line is "Serving on <url>"
+        line = process.stdout.readline()
+        if not line.startswith("Serving on "):
+            output = line.strip() or "no output, see its errors above"
+            raise RuntimeError(f"The mock server didn't start: {output}")
+        yield line.split()[-1]
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def server_podcasts(url: str) -> list[Podcast]:
+    """Every supported podcast with its RSS feed on the server at url."""
+    return [
+        attrs.evolve(podcast, rss=f"{url}/feeds/{podcast.name}.xml")
+        for podcast in PODCASTS
+    ]
+
+
+@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8000, show_default=True)
+@click.option("--episodes", type=click.IntRange(1), default=20, show_default=True)
+@click.option("--episode-size", type=Size(), default="8M", show_default=True)
+@click.option(
+    "--latency",
+    type=click.FloatRange(0),
+    default=0.0,
+    help="Seconds to wait before every response.",
+)
+@click.option(
+    "--bandwidth",
+    type=Size(),
+    default="0",
+    help="Bytes per second for every response, 0 means unlimited.",
+)
+@click.option(
+    "--error-rate",
+    type=click.FloatRange(0, 1),
+    default=0.0,
+    help="Ratio of requests answered with 503 Service Unavailable.",
+)
+@click.option(
+    "--truncate-rate",
+    type=click.FloatRange(0, 1),
+    default=0.0,
+    help="Ratio of episodes which are cut off in the middle.",
+)
+@click.option("--seed", type=int, default=None, help="Seed for injecting errors.")
+def main(host, port, **config):
+    """Serve generated RSS feeds and episodes of every supported podcast."""
+    asyncio.run(_serve(host, port, ServerConfig(**config)))
+
+
+async def _serve(host, port, config):
+    async with MockServer(config, host, port) as server:
+        click.echo(f"Serving on {server.url}")
+        for podcast in server.podcasts():
+            click.echo(f"  {podcast.name}: {podcast.rss}")
+        sys.stdout.flush()
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,577 @@
+import os
+import json
+import time
 import asyncio
+import hashlib
+import functools
+import contextlib
 from operator import attrgetter
 from pathlib import Path
+from urllib.parse import urlparse
 
+import attrs
 import click
 import httpx
 from lxml import etree
 
+from . import metrics
+from .feed_cache import FeedCache
 from .rss_parsers import BaseItem
+from .detect import SAMPLE_SIZE, detect_parser
+from .state import PodcastState
+from .retry import CircuitBreaker, HostUnavailable, RetryPolicy, with_retries
+from .progress import FileProgress
+from .selection import EpisodeSelection, FeedIndex
+from .writer import DEFAULT_BUFFER_SIZE, FileWriter, preallocate
+
+# Episodes smaller than this are never downloaded in multiple segments
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+
+# The RSS syndication module: https://web.resource.org/rss/1.0/modules/syndication/
+_SY_NAMESPACE = "http://purl.org/rss/1.0/modules/syndication/"
+_SY_UPDATE_PERIOD = f"{{{_SY_NAMESPACE}}}updatePeriod"
+_SY_UPDATE_FREQUENCY = f"{{{_SY_NAMESPACE}}}updateFrequency"
+_PARSED_TAGS = ("item", "ttl", _SY_UPDATE_PERIOD, _SY_UPDATE_FREQUENCY)
+
+UPDATE_PERIODS = {
+    "hourly": 60 * 60,
+    "daily": 24 * 60 * 60,
+    "weekly": 7 * 24 * 60 * 60,
+    "monthly": 30 * 24 * 60 * 60,
+    "yearly": 365 * 24 * 60 * 60,
+}
+
+
+class DownloadError(Exception):
+    """Raised when an episode could not be downloaded completely."""
+
+    retryable = True
+
+
+class VerificationError(DownloadError):
+    """Raised when the downloaded file is not the expected size."""
+
+
+class SizeMismatchError(VerificationError):
+    """Raised when the downloaded file is not the size in the RSS feed. Downloading
+    it again would give the same file."""
+
+    retryable = False
+
+
+@attrs.frozen
+class DownloadSettings:
+    """How episodes are downloaded and written to the disk."""
+
+    segments: int = 1
+    check_size: bool = False
+    write_buffer_size: int = DEFAULT_BUFFER_SIZE
+    preallocate: bool = False
 
 
 class Episode:
-    def __init__(self, item: BaseItem, download_dir: Path):
+    def __init__(
+        self, item: BaseItem, download_dir: Path, state: PodcastState | None = None
+    ):
+        self.key = item.key
         self.url = item.url
         self.number = item.episode
         self.title = item.title
         self.filename = item.filename
+        self.size = item.size
+        self.published = item.published
         self.download_dir = download_dir
         self.full_path = self.download_dir / self.filename
-
-    @property
-    def is_missing(self):
-        return not self.full_path.exists()
-
-    async def download(self, http: httpx.AsyncClient, vprint):
+        self.host = urlparse(self.url).hostname
+        self.partial_path = self.full_path.with_suffix(".partial")
+        self.resume_path = self.full_path.with_suffix(".partial.json")
+        self.state = state
+
+    async def download(
+        self,
+        http: httpx.AsyncClient,
+        vprint,
+        connections=None,
+        settings=None,
+        progress=None,
+        resume=True,
+    ):
+        """Download the episode to the download directory.
+        If there are free connections in the budget, large files are downloaded
+        in multiple segments at the same time.
+        The file is verified against the Content-Length header, and with check_size
+        also against the enclosure length in the feed, before it is renamed.
+        """
+        settings = settings or DownloadSettings()
+        progress = progress or FileProgress(self.filename, self.size)
         vprint(f"Getting episode: {self.url}")
-        async with http.stream("GET", self.url) as response:
-            await self._save_atomic(response, vprint)
+        headers = self._resume_headers() if resume and not settings.preallocate else {}
+        with metrics.span("download_episode", host=self.host) as span:
+            span.set(filename=self.filename, resumed=bool(headers))
+            async with http.stream("GET", self.url, headers=headers) as response:
+                status = response.status_code
+                span.set(status=status)
+                # Only a Range request can be restarted without it
+                range_error = (
+                    status == httpx.codes.REQUESTED_RANGE_NOT_SATISFIABLE
+                    and bool(headers)
+                )
+                if not range_error:
+                    response.raise_for_status()
+                    extra = await self._acquire_segments(
+                        response, connections, settings.segments
+                    )
+                    span.set(segments=extra + 1)
+                    if extra:
+                        await self._save_segmented(
+                            http,
+                            response,
+                            connections,
+                            extra,
+                            vprint,
+                            settings,
+                            progress,
+                        )
+                    else:
+                        await self._save_atomic(response, vprint, settings, progress)
+                    size = self.full_path.stat().st_size
+                    span.set(bytes=size)
+                    metrics.count("downloaded_bytes", size, host=self.host)
+
+        if range_error:
+            vprint(f"Can't resume, starting again: {self.filename}", fg="yellow")
+            return await self.download(
+                http, vprint, connections, settings, progress, resume=False
+            )
+
         vprint(f"Finished downloading: {self.filename}", fg="green")
 
-    async def _save_atomic(self, response, vprint):
-        partial_filename = self.full_path.with_suffix(".partial")
-        with partial_filename.open("wb") as fp:
+    def _resume_headers(self):
+        """Range request for the rest of the file if there is a partial download.
+        If-Range makes sure the server sends the whole file if it has changed since.
+        """
+        try:
+            offset = self.partial_path.stat().st_size
+            validators = json.loads(self.resume_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+        if offset == 0 or validators.get("url") != self.url:
+            return {}
+
+        # Weak ETags can't be used for If-Range
+        etag = validators.get("etag")
+        if etag and not etag.startswith("W/"):
+            if_range = etag
+        elif validators.get("last_modified"):
+            if_range = validators["last_modified"]
+        else:
+            return {}
+
+        return {"Range": f"bytes={offset}-", "If-Range": if_range}
+
+    def _is_resumed(self, response):
+        if response.status_code != httpx.codes.PARTIAL_CONTENT:
+            return False
+        # Example: "bytes 1000-1999/2000"
+        content_range = response.headers.get("Content-Range", "")
+        start = content_range.removeprefix("bytes ").split("-", 1)[0]
+        return start.isdigit() and int(start) == self.partial_path.stat().st_size
+
+    async def _save_atomic(self, response, vprint, settings, progress):
+        """Write the file while hashing it for the state DB, so it doesn't have to
+        be read again."""
+        hasher = hashlib.sha256() if self.state is not None else None
+        if self._is_resumed(response):
+            flags = os.O_WRONLY
+            vprint(f"Resuming download: {self.filename}")
+            if hasher is None:
+                offset = self.partial_path.stat().st_size
+            else:
+                with self.partial_path.open("rb") as fp:
+                    hashlib.file_digest(fp, lambda: hasher)
+                    offset = fp.tell()
+        else:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+            offset = 0
+            if settings.preallocate:
+                # Preallocated files can't be resumed by their size
+                self.resume_path.unlink(missing_ok=True)
+            else:
+                self._save_validators(response)
+
+        fd = os.open(self.partial_path, flags, 0o644)
+        writer = FileWriter(fd, offset, settings.write_buffer_size)
+        try:
+            expected_size = self._expected_size(response)
+            if settings.preallocate and offset == 0 and expected_size:
+                preallocate(fd, expected_size)
+            progress.start(expected_size, offset)
             vprint(f"Writing file: {self.filename}.partial")
             async for chunk in response.aiter_bytes():
-                fp.write(chunk)
-        partial_filename.rename(self.full_path)
-
-
-async def download_rss(http: httpx.AsyncClient, rss_url: str):
+                await writer.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                progress.advance(len(chunk))
+            await writer.flush()
+        finally:
+            writer.abort()
+            os.close(fd)
+
+        self._verify(response, writer.position, vprint, settings.check_size)
+        self._commit(response, None if hasher is None else hasher.hexdigest())
+
+    async def _acquire_segments(self, response, connections, segments):
+        """Acquire as many extra connections for segments as the budget allows."""
+        if (
+            segments < 2
+            or connections is None
+            or response.status_code != httpx.codes.OK
+            or response.headers.get("Accept-Ranges") != "bytes"
+            or response.headers.get("Content-Encoding", "identity") != "identity"
+            or not response.headers.get("Content-Length", "").isdigit()
+        ):
+            return 0
+        size = int(response.headers["Content-Length"])
+        max_extra = min(segments, size // MIN_SEGMENT_SIZE) - 1
+        return await connections.try_acquire(self.host, max_extra)
+
+    async def _save_segmented(
+        self, http, response, connections, extra, vprint, settings, progress
+    ):
+        """Download the file in byte ranges at the same time. The first segment is
+        read from the already opened response, the others with Range requests.
+        """
+        size = int(response.headers["Content-Length"])
+        segment_size = -(-size // (extra + 1))
+        first, *rest = [
+            (start, min(start + segment_size, size) - 1)
+            for start in range(0, size, segment_size)
+        ]
+        # Segmented downloads are preallocated, so they can't be resumed by size
+        self.resume_path.unlink(missing_ok=True)
+        if_range = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        vprint(f"Downloading in {len(rest) + 1} segments: {self.filename}")
+
+        progress.start(size)
+        fd = os.open(self.partial_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            preallocate(fd, size)
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(
+                    self._write_range(fd, response, *first, settings, progress)
+                )
+                for start, end in rest:
+                    tg.create_task(
+                        self._download_range(
+                            http, fd, start, end, if_range, settings, progress
+                        )
+                    )
+        except ExceptionGroup as group:
+            # The other segments are cancelled, the download starts over
+            self._discard_partial()
+            raise _first_error(group) from group
+        finally:
+            os.close(fd)
+            connections.release(self.host, extra)
+        # Segments are written out of order, so they can't be hashed on the fly
+        size = self.partial_path.stat().st_size
+        self._verify(response, size, vprint, settings.check_size)
+        self._commit(response)
+
+    async def _download_range(self, http, fd, start, end, if_range, settings, progress):
+        headers = {"Range": f"bytes={start}-{end}"}
+        if if_range:
+            headers["If-Range"] = if_range
+        async with http.stream("GET", self.url, headers=headers) as response:
+            if response.status_code != httpx.codes.PARTIAL_CONTENT:
+                raise DownloadError(
+                    f"Range request failed for {self.filename}: "
+                    f"HTTP {response.status_code}"
+                )
+            await self._write_range(fd, response, start, end, settings, progress)
+
+    async def _write_range(self, fd, response, start, end, settings, progress):
+        writer = FileWriter(fd, start, settings.write_buffer_size)
+        try:
+            async for chunk in response.aiter_bytes():
+                chunk = chunk[: end + 1 - writer.position]
+                await writer.write(chunk)
+                progress.advance(len(chunk))
+                if writer.position > end:
+                    await writer.flush()
+                    return
+        finally:
+            writer.abort()
+        raise DownloadError(
+            f"Incomplete segment for {self.filename}: "
+            f"got {writer.position - start} bytes instead of {end + 1 - start}"
+        )
+
+    def _expected_size(self, response):
+        """The full size of the file according to the response headers."""
+        if response.status_code == httpx.codes.PARTIAL_CONTENT:
+            # Example: "bytes 1000-1999/2000"
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            return int(total) if total.isdigit() else None
+        # The length of compressed content is not the size of the file
+        if response.headers.get("Content-Encoding", "identity") != "identity":
+            return None
+        content_length = response.headers.get("Content-Length", "")
+        return int(content_length) if content_length.isdigit() else None
+
+    def _verify(self, response, size, vprint, check_size):
+        expected_size = self._expected_size(response)
+        if expected_size is not None and size != expected_size:
+            self._discard_partial()
+            raise VerificationError(
+                f"Incomplete download of {self.filename}: "
+                f"got {size} bytes instead of {expected_size}"
+            )
+        if self.size is None or size == self.size:
+            return
+        message = (
+            f"Size of {self.filename} is {size} bytes, "
+            f"but it is {self.size} bytes in the RSS feed"
+        )
+        # Lots of feeds have wrong enclosure lengths, so this is only a warning,
+        # unless the sizes are checked for finding missing episodes also
+        if check_size:
+            self._discard_partial()
+            raise SizeMismatchError(message)
+        vprint(f"WARNING: {message}", fg="yellow")
+
+    def _discard_partial(self):
+        self.partial_path.unlink(missing_ok=True)
+        self.resume_path.unlink(missing_ok=True)
+
+    def _commit(self, response, sha256=None):
+        self.partial_path.rename(self.full_path)
+        self.resume_path.unlink(missing_ok=True)
+        if self.state is not None:
+            size = self.full_path.stat().st_size
+            etag = response.headers.get("ETag")
+            self.state.record(self.key, self.url, self.filename, size, sha256, etag)
+
+    def _save_validators(self, response):
+        validators = {
+            "url": self.url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        self.resume_path.write_text(json.dumps(validators))
+
+
+def _first_error(group):
+    """The error of the first failed segment, which can be retried like the
+    errors of downloads without segments."""
+    errors = list(_leaf_errors(group))
+    for exc in errors:
+        if isinstance(exc, (DownloadError, httpx.HTTPError)):
+            return exc
+    return errors[0]
+
+
+def _leaf_errors(group):
+    for exc in group.exceptions:
+        if isinstance(exc, ExceptionGroup):
+            yield from _leaf_errors(exc)
+        else:
+            yield exc
+
+
+class ConnectionBudget:
+    """Global and per-host limits for the number of simultaneous downloading
+    connections. Every episode holds one connection, segmented downloads take the
+    free ones.
+    """
+
+    def __init__(self, limit: int, per_host: int | None = None):
+        self._semaphore = asyncio.Semaphore(limit)
+        self._per_host = per_host
+        self._host_semaphores = {}
+
+    def _host_semaphore(self, host):
+        if self._per_host is None:
+            return None
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self._per_host)
+        return self._host_semaphores[host]
+
+    @contextlib.asynccontextmanager
+    async def connection(self, host: str):
+        host_semaphore = self._host_semaphore(host)
+        started = time.perf_counter()
+        # Waiting for the host first, so it doesn't hold a global connection
+        if host_semaphore is not None:
+            await host_semaphore.acquire()
+        try:
+            async with self._semaphore:
+                waited = time.perf_counter() - started
+                metrics.record("connection_wait", waited, host=host)
+                yield self
+        finally:
+            if host_semaphore is not None:
+                host_semaphore.release()
+
+    async def try_acquire(self, host: str, max_count: int) -> int:
+        """Acquire at most max_count connections without waiting for any."""
+        host_semaphore = self._host_semaphore(host)
+        count = 0
+        while count < max_count and not self._semaphore.locked():
+            if host_semaphore is not None:
+                if host_semaphore.locked():
+                    break
+                await host_semaphore.acquire()
+            await self._semaphore.acquire()
+            count += 1
+        return count
+
+    def release(self, host: str, count: int = 1):
+        host_semaphore = self._host_semaphore(host)
+        for _ in range(count):
+            self._semaphore.release()
+            if host_semaphore is not None:
+                host_semaphore.release()
+
+
+class FeedNotModified(Exception):
+    """Raised when the RSS feed has not changed since the last successful sync."""
+
+
+@attrs.frozen
+class Feed:
+    items: list[BaseItem]
+    # How long the publisher asks to cache the feed, in seconds
+    ttl: int | None = None
+    # The parser of the items, detected when the podcast doesn't have one
+    rss_parser: type[BaseItem] | None = None
+
+
+async def download_feed(
+    http: httpx.AsyncClient,
+    rss_url: str,
+    rss_parser: type[BaseItem] | None,
+    feed_cache: FeedCache | None = None,
+) -> Feed:
+    """Download the RSS feed and parse the items while the body is being streamed.
+    Without a parser, it is detected from the first items."""
     click.echo(f"Downloading RSS feed: {rss_url} ...")
-    res = await http.get(rss_url)
-    return etree.XML(res.content)
+    headers = feed_cache.conditional_headers(rss_url) if feed_cache else {}
+    parser = RssItemParser(rss_parser)
+
+    host = urlparse(rss_url).hostname
+    with metrics.span("download_rss", host=host) as span:
+        span.set(url=rss_url)
+        async with http.stream("GET", rss_url, headers=headers) as res:
+            span.set(status=res.status_code)
+            if res.status_code == httpx.codes.NOT_MODIFIED:
+                raise FeedNotModified
+            res.raise_for_status()
+
+            if feed_cache is None:
+                async for chunk in res.aiter_bytes():
+                    parser.feed(chunk)
+            else:
+                with feed_cache.storing(rss_url, res.headers) as fp:
+                    async for chunk in res.aiter_bytes():
+                        parser.feed(chunk)
+                        fp.write(chunk)
+
+        items = parser.close()
+        span.set(
+            bytes=res.num_bytes_downloaded,
+            items=len(items),
+            parse_seconds=parser.parse_seconds,
+        )
+    return Feed(items, parser.ttl, parser.rss_parser)
+
+
+def load_cached_feed(
+    feed_cache: FeedCache, rss_url: str, rss_parser: type[BaseItem] | None
+) -> Feed:
+    with metrics.span("parse_rss", source="cache"):
+        parser = RssItemParser(rss_parser)
+        for chunk in feed_cache.iter_chunks(rss_url):
+            parser.feed(chunk)
+        items = parser.close()
+    return Feed(items, parser.ttl, parser.rss_parser)
+
+
+class RssItemParser:
+    """Incremental RSS parser which makes items from the <item> elements as soon as
+    they are complete, so it can be fed with chunks while downloading the feed.
+    The elements are thrown away right after the item fields are extracted.
+
+    Without a parser, the first elements are kept until there are enough of them
+    to detect the parser with.
+    """
+
+    def __init__(self, rss_parser: type[BaseItem] | None):
+        self.rss_parser = rss_parser
+        self._parser = etree.XMLPullParser(events=("end",), tag=_PARSED_TAGS)
+        self._sample = []
+        self._items = []
+        self._channel = {}
+        # Parsing is interleaved with downloading, so it is timed separately
+        self.parse_seconds = 0.0
+
+    @property
+    def ttl(self) -> int | None:
+        """How long the feed can be cached according to <ttl> or sy:updatePeriod."""
+        ttl = self._channel.get("ttl", "")
+        if ttl.isdigit():
+            return int(ttl) * 60
+        period = UPDATE_PERIODS.get(self._channel.get(_SY_UPDATE_PERIOD, "").lower())
+        if period is None:
+            return None
+        frequency = self._channel.get(_SY_UPDATE_FREQUENCY, "")
+        # The feed is updated frequency times in every period
+        if frequency.isdigit() and int(frequency) > 0:
+            return period // int(frequency)
+        return period
+
+    def feed(self, chunk: bytes):
+        started = time.perf_counter()
+        self._parser.feed(chunk)
+        self._read_items()
+        self.parse_seconds += time.perf_counter() - started
+
+    def close(self):
+        """Finish parsing and return every item sorted by filename."""
+        started = time.perf_counter()
+        self._parser.close()
+        self._read_items()
+        if self.rss_parser is None:
+            self._detect_parser()
+        items = sorted(self._items, key=attrgetter("filename"))
+        self.parse_seconds += time.perf_counter() - started
+        return items
+
+    def _read_items(self):
+        for _, item_elem in self._parser.read_events():
+            if item_elem.tag != "item":
+                self._channel[item_elem.tag] = (item_elem.text or "").strip()
+                continue
+            if self.rss_parser is None:
+                self._sample.append(item_elem)
+                if len(self._sample) == SAMPLE_SIZE:
+                    self._detect_parser()
+                continue
+            self._add_item(item_elem)
+
+    def _detect_parser(self):
+        self.rss_parser = detect_parser(self._sample)
+        for item_elem in self._sample:
+            self._add_item(item_elem)
+        self._sample = []
+
+    def _add_item(self, item_elem):
+        self._items.append(self.rss_parser(item_elem))
+        item_elem.clear()
+        parent = item_elem.getparent()
+        if parent is not None:
+            parent.remove(item_elem)
 
 
 def ensure_download_dir(download_dir: Path):
@@ -49,53 +580,81 @@ def ensure_download_dir(download_dir: Path):
 
 
 def get_all_rss_items(rss_root: etree.Element, rss_parser: BaseItem):
-    all_items = (rss_parser(item) for item in rss_root.xpath("//item"))
-    return sorted(all_items, key=attrgetter("filename"))
-
+    with metrics.span("parse_rss", source="tree"):
+        all_items = (rss_parser(item) for item in rss_root.xpath("//item"))
+        return sorted(all_items, key=attrgetter("filename"))
 
-def filter_rss_items(all_rss_items, episode_params, last_n):
-    search_message = "Searching episodes: " + ", ".join(str(e) for e in episode_params)
-    if last_n != 0:
-        search_message += " and/or " if episode_params else ""
-        search_message += f"last {last_n}."
-    click.echo(search_message)
 
-    # We can't make this function a generator, need to return a list, so
-    # the above output would print before we return from this function
-    filtered_items = []
-    episode_params_left = set(episode_params)
-    last_index = len(all_rss_items) - last_n
+def filter_rss_items(all_rss_items, selection: EpisodeSelection):
+    """Return the selected items in feed order and the episodes which are not in
+    the feed."""
+    click.echo(f"Searching episodes: {selection}")
+    return FeedIndex(all_rss_items).select(selection)
 
-    for n, item in enumerate(all_rss_items):
-        if item.episode in episode_params_left:
-            episode_params_left.remove(item.episode)
-            filtered_items.append(item)
 
-        elif item.filename in episode_params_left:
-            episode_params_left.remove(item.filename)
-            filtered_items.append(item)
+def make_episodes(download_dir, rss_items, state=None):
+    return (Episode(item, download_dir, state) for item in rss_items)
 
-        elif item.title in episode_params_left:
-            episode_params_left.remove(item.title)
-            filtered_items.append(item)
 
-        elif last_index <= n:
-            filtered_items.append(item)
-
-    return filtered_items, sorted(episode_params_left)
-
-
-def make_episodes(download_dir, rss_items):
-    return (Episode(item, download_dir) for item in rss_items)
+def find_missing(episodes, vprint, check_size=False):
+    """Find the episodes which are not downloaded yet by listing every download
+    directory only once, instead of checking the files one by one.
+    With check_size, files which are not the same size as the enclosure length
+    in the RSS feed are also considered missing.
+    Episodes recorded in the state database are never missing, even if the files
+    have been moved or deleted since.
+    When the title of an episode changed in the feed, the already downloaded file
+    with the same episode number and size is renamed instead of downloading the
+    episode again.
+    """
+    click.echo("Searching missing episodes...")
+    episodes = list(episodes)
+    with metrics.span("find_missing") as span:
+        missing = _find_missing(episodes, vprint, check_size)
+        span.set(episodes=len(episodes), missing=len(missing))
+    return missing
 
 
-def find_missing(episodes, vprint):
-    click.echo("Searching missing episodes...")
+def _find_missing(episodes, vprint, check_size):
     rv = []
+    dir_scans = {}
+    feed_filenames = {ep.filename for ep in episodes}
 
     for ep in episodes:
-        if not ep.is_missing:
-            continue
+        recorded = ep.state.get(ep.key) if ep.state is not None else None
+        if recorded is not None:
+            recorded_filename, recorded_size, _ = recorded
+            # With a different size, the file is checked like an unrecorded one
+            if not check_size or ep.size is None or recorded_size == ep.size:
+                if recorded_filename != ep.filename:
+                    _rename_episode(ep, recorded_filename, vprint)
+                continue
+
+        if ep.download_dir not in dir_scans:
+            dir_scans[ep.download_dir] = _DirScan(ep.download_dir)
+        dir_scan = dir_scans[ep.download_dir]
+        entry = dir_scan.entries.get(ep.filename)
+
+        if entry is None:
+            old_filename = dir_scan.find_renamed(ep, feed_filenames)
+            if old_filename is not None:
+                _rename_episode(ep, old_filename, vprint)
+                continue
+
+        if entry is not None:
+            if not check_size and ep.state is None:
+                continue
+            file_size = entry.stat().st_size
+            if ep.size is None or file_size == ep.size:
+                _record_existing(ep, file_size)
+                continue
+            if not check_size:
+                # Not recorded, so its size is checked when check_size is used
+                continue
+            vprint(
+                f"Size mismatch for {ep.filename}: "
+                f"{file_size} bytes instead of {ep.size} bytes"
+            )
 
         vprint(f"Found missing episode: {ep.filename}")
         if ep.number is None:
@@ -110,17 +669,146 @@ def find_missing(episodes, vprint):
     return rv
 
 
-async def download_episodes(http, episodes, max_threads, vprint, progressbar):
+def _record_existing(ep, file_size):
+    """Add episodes downloaded before the state database was used, only when
+    their size matches the feed."""
+    if ep.state is not None:
+        ep.state.record(ep.key, ep.url, ep.filename, file_size)
+
+
+def _rename_episode(ep, old_filename, vprint):
+    old_path = ep.download_dir / old_filename
+    # The file might have been moved or deleted on purpose
+    if not old_path.exists() or ep.full_path.exists():
+        return
+    vprint(f"Episode has been renamed: {old_filename} -> {ep.filename}")
+    old_path.rename(ep.full_path)
+    if ep.state is not None:
+        ep.state.record(ep.key, ep.url, ep.filename, ep.full_path.stat().st_size)
+
+
+class _DirScan:
+    """Files of a download directory, listed only once."""
+
+    def __init__(self, download_dir: Path):
+        try:
+            with os.scandir(download_dir) as it:
+                self.entries = {entry.name: entry for entry in it if entry.is_file()}
+        except FileNotFoundError:
+            self.entries = {}
+
+        self._by_number = {}
+        for name in self.entries:
+            number, sep, _ = name.partition("-")
+            if sep and number.isdigit():
+                self._by_number.setdefault(number, []).append(name)
+
+    def find_renamed(self, ep, feed_filenames):
+        """Find the file of the episode downloaded with a different title.
+        It has to be the only file with the same episode number and extension,
+        which doesn't belong to any other episode in the feed, and it has to be
+        the size of the enclosure. Feeds which start the numbering again every
+        season have different episodes with the same number."""
+        if ep.number is None or not ep.number.isdigit() or ep.size is None:
+            return None
+        candidates = [
+            name
+            for name in self._by_number.get(ep.number, [])
+            if name.endswith(ep.full_path.suffix) and name not in feed_filenames
+        ]
+        if len(candidates) != 1:
+            return None
+        (name,) = candidates
+        if self.entries[name].stat().st_size != ep.size:
+            return None
+        return name
+
+
+def _newest_first(ep):
+    # aware and naive datetimes can't be compared, timestamps can
+    if ep.published is None:
+        return (1, 0)
+    return (0, -ep.published.timestamp())
+
+
+def _smallest_first(ep):
+    return (ep.size is None, ep.size or 0)
+
+
+def _by_episode_number(ep):
+    number = ep.number or ""
+    if number.isdigit():
+        return (0, int(number))
+    return (1, 0)
+
+
+# Episodes with unknown date, size or episode number come last
+EPISODE_ORDERS = {
+    "filename": attrgetter("filename"),
+    "newest": _newest_first,
+    "smallest": _smallest_first,
+    "episode": _by_episode_number,
+}
+
+
+def sort_episodes(episodes, order="filename"):
+    """Sort episodes in the order they should be downloaded."""
+    return sorted(episodes, key=EPISODE_ORDERS[order])
+
+
+async def download_episodes(
+    http,
+    episodes,
+    max_threads,
+    vprint,
+    progress,
+    settings=None,
+    max_per_host=None,
+    retry_policy=None,
+    circuit_breaker=None,
+):
+    """Download every episode with a fixed number of workers, in the order of the
+    episodes, and return the ones which failed with the errors.
+    The progress tracks the downloaded bytes of every episode.
+    Failed downloads are retried according to the retry policy, and a failed
+    episode doesn't stop downloading the others."""
     click.echo("Downloading episodes...")
 
-    semaphore = asyncio.Semaphore(max_threads)
-
-    async def with_progressbar(coro):
-        async with semaphore:
-            await coro
-            progressbar.update(1)
-
-    with progressbar:
-        progressbar.update(0)
-        coros = [with_progressbar(ep.download(http, vprint)) for ep in episodes]
-        await asyncio.wait(asyncio.create_task(coro) for coro in coros)
+    connections = ConnectionBudget(max_threads, max_per_host)
+    retry_policy = retry_policy or RetryPolicy()
+    circuit_breaker = circuit_breaker or CircuitBreaker()
+    queue = asyncio.Queue()
+    for episode in episodes:
+        queue.put_nowait(episode)
+    failed = {}
+
+    async def download(episode, file_progress):
+        async with connections.connection(episode.host):
+            await episode.download(http, vprint, connections, settings, file_progress)
+
+    async def worker():
+        while not queue.empty():
+            episode = queue.get_nowait()
+            file_progress = progress.track(episode)
+            try:
+                await with_retries(
+                    functools.partial(download, episode, file_progress),
+                    retry_policy,
+                    circuit_breaker,
+                    episode.host,
+                    vprint,
+                    f"Downloading {episode.filename}",
+                )
+            except (httpx.HTTPError, DownloadError, HostUnavailable, OSError) as exc:
+                message = f"ERROR: {episode.filename}: {exc}"
+                click.secho(message, fg="red", err=True)
+                failed[episode] = exc
+            progress.finish(file_progress, failed=episode in failed)
+
+    with progress, metrics.span("download_episodes") as span:
+        span.set(episodes=queue.qsize())
+        workers = min(max_threads, queue.qsize())
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        span.set(failed=len(failed))
+
+    return failed
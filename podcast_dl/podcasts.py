@@ -13,7 +13,8 @@ class Podcast:
     title: str
     url: str
     rss: str
-    rss_parser: type[rssp.BaseItem]
+    # None for RSS feeds given by URL, it is detected from the feed then
+    rss_parser: type[rssp.BaseItem] | None
 
 
 PODCASTS = [
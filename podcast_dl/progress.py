@@ -0,0 +1,233 @@
+"""
+Byte-accurate progress of the downloads with throughput and ETA.
+
+Downloads only add the number of bytes to their FileProgress for every chunk,
+everything else is calculated and rendered at a bounded rate in a separate task.
+"""
+import sys
+import json
+import time
+import asyncio
+
+# How much the last interval counts in the smoothed throughput
+RATE_SMOOTHING = 0.3
+
+
+class FileProgress:
+    """Progress of downloading one file."""
+
+    __slots__ = ("name", "size", "done", "rate", "_last_done")
+
+    def __init__(self, name: str, size: int | None = None):
+        self.name = name
+        self.size = size
+        self.done = 0
+        self.rate = 0.0
+        self._last_done = 0
+
+    def start(self, size: int | None, done: int = 0):
+        """Called when the response arrives, with the size of the whole file and
+        the already downloaded part when resuming. Retries start over."""
+        if size is not None:
+            self.size = size
+        self.done = self._last_done = done
+
+    def advance(self, amount: int):
+        self.done += amount
+
+
+class NoProgress:
+    """Used when no progress is shown, the files are tracked but never rendered."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def track(self, episode) -> FileProgress:
+        return FileProgress(episode.filename, episode.size)
+
+    def finish(self, file_progress: FileProgress, failed=False):
+        pass
+
+
+class Progress:
+    """Aggregate progress of every episode, rendered every interval seconds by
+    the renderers while the downloads are running."""
+
+    def __init__(self, episodes, renderers, interval=0.5, clock=time.monotonic):
+        self.episodes_total = len(episodes)
+        self.episodes_done = 0
+        self.episodes_failed = 0
+        # Enclosure lengths in the feed, corrected by the responses. Keyed by the
+        # episodes, because podcasts can have files with the same name.
+        self._sizes = {ep: ep.size or 0 for ep in episodes}
+        self._episodes = {}
+        self.bytes_total = sum(self._sizes.values())
+        self._finished_bytes = 0
+        self.active = []
+        self.rate = 0.0
+        self._renderers = renderers
+        self._interval = interval
+        self._clock = clock
+        self._last_time = None
+        self._last_done = 0
+        self._task = None
+
+    @property
+    def bytes_done(self) -> int:
+        return self._finished_bytes + sum(fp.done for fp in self.active)
+
+    @property
+    def eta(self) -> float | None:
+        if not self.rate:
+            return None
+        return max(0, self.bytes_total - self.bytes_done) / self.rate
+
+    def track(self, episode) -> FileProgress:
+        file_progress = FileProgress(episode.filename, episode.size)
+        self.active.append(file_progress)
+        self._episodes[file_progress] = episode
+        return file_progress
+
+    def finish(self, file_progress: FileProgress, failed=False):
+        self.active.remove(file_progress)
+        episode = self._episodes.pop(file_progress)
+        self.episodes_done += 1
+        if failed:
+            self.episodes_failed += 1
+            # Failed downloads are not coming, they shouldn't count in the ETA
+            self.bytes_total -= self._sizes[episode]
+        else:
+            self._finished_bytes += file_progress.done
+            self._update_size(episode, file_progress.done)
+
+    def _update_size(self, episode, size):
+        self.bytes_total += size - self._sizes[episode]
+        self._sizes[episode] = size
+
+    def update(self):
+        """Calculate the throughput since the last update."""
+        for fp in self.active:
+            episode = self._episodes[fp]
+            if fp.size is not None and fp.size != self._sizes[episode]:
+                self._update_size(episode, fp.size)
+
+        now = self._clock()
+        done = self.bytes_done
+        if self._last_time is not None and now > self._last_time:
+            elapsed = now - self._last_time
+            self.rate = _smooth(self.rate, (done - self._last_done) / elapsed)
+            for fp in self.active:
+                fp.rate = _smooth(fp.rate, (fp.done - fp._last_done) / elapsed)
+                fp._last_done = fp.done
+        self._last_time = now
+        self._last_done = done
+
+    def render(self):
+        self.update()
+        for renderer in self._renderers:
+            renderer.render(self)
+
+    async def _render_periodically(self):
+        while True:
+            self.render()
+            await asyncio.sleep(self._interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._render_periodically())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._task.cancel()
+        self.render()
+        for renderer in self._renderers:
+            renderer.close()
+
+
+def _smooth(previous, current):
+    return previous + RATE_SMOOTHING * (current - previous)
+
+
+def _format_size(size):
+    return f"{size / 1024**2:.1f} MB"
+
+
+def _format_eta(eta):
+    if eta is None:
+        return "--:--:--"
+    minutes, seconds = divmod(int(eta), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+class TerminalRenderer:
+    """The aggregate progress and a line for every running download, redrawn in
+    place on the terminal. When the output is not a terminal, only the aggregate
+    progress is written."""
+
+    def __init__(self, file=None, width=80):
+        self._file = file or sys.stderr
+        self._width = width
+        self._redraw = self._file.isatty()
+        self._lines = 0
+
+    def render(self, progress: Progress):
+        total = progress.bytes_total
+        percent = progress.bytes_done / total if total else 0
+        lines = [
+            f"[{progress.episodes_done}/{progress.episodes_total} episodes]"
+            f" {_format_size(progress.bytes_done)} / {_format_size(total)}"
+            f" ({percent:.0%}) {_format_size(progress.rate)}/s"
+            f" ETA {_format_eta(progress.eta)}"
+        ]
+        if self._redraw:
+            for fp in progress.active:
+                size = _format_size(fp.size) if fp.size else "?"
+                status = f" {_format_size(fp.done)} / {size} {_format_size(fp.rate)}/s"
+                name = fp.name[: self._width - len(status) - 2]
+                lines.append(f"  {name}{status}")
+        # Go back to the first line of the previous render and clear everything
+        output = f"\x1b[{self._lines}F\x1b[J" if self._lines else ""
+        output += "\n".join(lines) + "\n"
+        self._file.write(output)
+        self._file.flush()
+        if self._redraw:
+            self._lines = len(lines)
+
+    def close(self):
+        pass
+
+
+class JsonRenderer:
+    """A JSON line for every render, for dashboards and CI logs."""
+
+    def __init__(self, file):
+        self._file = file
+
+    def render(self, progress: Progress):
+        line = {
+            "time": time.time(),
+            "episodes_done": progress.episodes_done,
+            "episodes_failed": progress.episodes_failed,
+            "episodes_total": progress.episodes_total,
+            "bytes_done": progress.bytes_done,
+            "bytes_total": progress.bytes_total,
+            "rate": round(progress.rate),
+            "eta": None if progress.eta is None else round(progress.eta, 1),
+            "files": [
+                {
+                    "name": fp.name,
+                    "bytes_done": fp.done,
+                    "bytes_total": fp.size,
+                    "rate": round(fp.rate),
+                }
+                for fp in progress.active
+            ],
+        }
+        self._file.write(json.dumps(line) + "\n")
+        self._file.flush()
+
+    def close(self):
+        pass
@@ -0,0 +1,146 @@
+"""
+Bandwidth limiting for downloads with token buckets.
+"""
+
+import re
+import time
+import asyncio
+import datetime
+
+import attrs
+import httpx
+
+UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+_size_re = re.compile(r"^([0-9]+(?:\.[0-9]+)?)([KMG]?)B?$")
+_window_re = re.compile(r"^([0-9]{1,2}):([0-9]{2})-([0-9]{1,2}):([0-9]{2})=(.+)$")
+
+
+def parse_size(value: str) -> int:
+    """Parse a number of bytes like "64K" or "1.5M"."""
+    m = _size_re.match(value.strip().upper())
+    if m is None:
+        raise ValueError(f"Invalid size: {value}")
+    number, unit = m.group(1, 2)
+    return int(float(number) * UNITS[unit])
+
+
+def parse_rate(value: str) -> int:
+    """Parse bytes per second like "500K" or "1.5M". 0 means unlimited."""
+    return parse_size(value.strip().upper().removesuffix("/S"))
+
+
+@attrs.frozen
+class RateWindow:
+    start: datetime.time
+    end: datetime.time
+    rate: int
+
+    def contains(self, now: datetime.time) -> bool:
+        if self.start <= self.end:
+            return self.start <= now < self.end
+        # the window goes over midnight, e.g. 22:00-06:00
+        return now >= self.start or now < self.end
+
+
+def parse_schedule(value: str) -> list[RateWindow]:
+    """Parse time windows with their rates like "09:00-17:00=500K,22:00-06:00=0"."""
+    windows = []
+    for spec in value.split(","):
+        if not spec.strip():
+            continue
+        m = _window_re.match(spec.strip())
+        if m is None:
+            raise ValueError(f"Invalid schedule: {spec}")
+        start_hour, start_minute, end_hour, end_minute, rate = m.groups()
+        start = datetime.time(int(start_hour), int(start_minute))
+        end = datetime.time(int(end_hour), int(end_minute))
+        windows.append(RateWindow(start, end, parse_rate(rate)))
+    return windows
+
+
+class TokenBucket:
+    """Allows rate bytes per second on average, with bursts of one second.
+    The rate is given at every call, so it can change any time."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._tokens = 0
+        self._updated = clock()
+        # Waiting in the lock makes the consumers take turns in order
+        self._lock = asyncio.Lock()
+
+    async def consume(self, amount: int, rate: int):
+        async with self._lock:
+            now = self._clock()
+            elapsed = now - self._updated
+            self._updated = now
+            self._tokens = min(rate, self._tokens + elapsed * rate) - amount
+            if self._tokens < 0:
+                await asyncio.sleep(-self._tokens / rate)
+
+
+class RateLimiter:
+    """Global and per-host bandwidth limits. The global rate can be changed by
+    time windows of a schedule. A rate of 0 or None means unlimited.
+    """
+
+    def __init__(self, rate=None, per_host=None, schedule=()):
+        self._rate = rate
+        self._per_host = per_host
+        self._schedule = schedule
+        self._bucket = TokenBucket()
+        self._host_buckets = {}
+
+    def current_rate(self, now: datetime.time | None = None):
+        if now is None:
+            now = datetime.datetime.now().time()
+        for window in self._schedule:
+            if window.contains(now):
+                return window.rate
+        return self._rate
+
+    async def throttle(self, host: str, amount: int):
+        rate = self.current_rate()
+        if rate:
+            await self._bucket.consume(amount, rate)
+        if self._per_host:
+            if host not in self._host_buckets:
+                self._host_buckets[host] = TokenBucket()
+            await self._host_buckets[host].consume(amount, self._per_host)
+
+
+class _ThrottledStream(httpx.AsyncByteStream):
+    def __init__(self, stream, rate_limiter, host):
+        self._stream = stream
+        self._rate_limiter = rate_limiter
+        self._host = host
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            await self._rate_limiter.throttle(self._host, len(chunk))
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Transport which throttles reading the response bodies."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, rate_limiter: RateLimiter):
+        self._transport = transport
+        self._rate_limiter = rate_limiter
+
+    async def handle_async_request(self, request):
+        response = await self._transport.handle_async_request(request)
+        stream = _ThrottledStream(response.stream, self._rate_limiter, request.url.host)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=stream,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,129 @@
+"""
+Podcasts defined in a TOML file, in addition to the built-in ones. A podcast can
+use one of the built-in parsers, extraction rules for the title, episode number
+and file extension, or both. The rules are compiled once, when the file is loaded.
+
+Example:
+
+    [podcasts.pythonbytes]
+    title = "Python Bytes"
+    url = "https://pythonbytes.fm/"
+    rss = "https://pythonbytes.fm/episodes/rss"
+    # Example title: "#95 Unleash the py-spy!"
+    title_regex = '^#\\S+ (.*)$'
+    episode_regex = '^#([0-9]+)'
+"""
+import os
+import re
+import tomllib
+from pathlib import Path
+
+from . import rss_parsers as rssp
+from .podcasts import PODCASTS, Podcast
+
+PARSERS = {
+    "base": rssp.BaseItem,
+    "talkpython": rssp.TalkPythonItem,
+    "changelog": rssp.ChangelogItem,
+    "indiehackers": rssp.IndieHackersItem,
+    "corecursive": rssp.CoRecursiveItem,
+}
+_XPATH_RULES = ("title_xpath", "episode_xpath")
+_REGEX_RULES = ("title_regex", "episode_regex", "file_ext_regex")
+_FIELDS = ("title", "url", "rss", "parser", *_XPATH_RULES, *_REGEX_RULES)
+
+
+class InvalidRegistry(Exception):
+    """Raised when the podcast registry file can't be loaded."""
+
+
+def default_registry_path() -> Path:
+    xdg_config_home = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(xdg_config_home) / "podcast-dl" / "podcasts.toml"
+
+
+def load_podcasts(path: Path | None = None, check_xpaths=True) -> list[Podcast]:
+    """The built-in podcasts and the ones in the registry file, which replace the
+    built-in podcasts with the same name. Without a path, the default registry
+    file is loaded if there is one. Checking the XPaths loads lxml, so it can be
+    skipped when the podcasts are only listed."""
+    if path is None:
+        path = default_registry_path()
+        if not path.is_file():
+            return PODCASTS
+    podcasts = {podcast.name: podcast for podcast in PODCASTS}
+    registry = load_registry(path, check_xpaths)
+    podcasts.update((podcast.name, podcast) for podcast in registry)
+    return list(podcasts.values())
+
+
+def load_registry(path: Path, check_xpaths=True) -> list[Podcast]:
+    try:
+        with path.open("rb") as f:
+            registry = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as exc:
+        raise InvalidRegistry(f"{path}: {exc}")
+
+    podcasts = registry.get("podcasts", {})
+    if not isinstance(podcasts, dict):
+        raise InvalidRegistry(f"{path}: podcasts should be a table")
+    return [
+        _make_podcast(path, name, fields, check_xpaths)
+        for name, fields in podcasts.items()
+    ]
+
+
+def _make_podcast(path, name, fields, check_xpaths) -> Podcast:
+    def invalid(message):
+        return InvalidRegistry(f'{path}: podcast "{name}": {message}')
+
+    if not isinstance(fields, dict):
+        raise invalid("should be a table")
+    unknown = fields.keys() - set(_FIELDS)
+    if unknown:
+        raise invalid(f"unknown fields: {', '.join(sorted(unknown))}")
+    for field, value in fields.items():
+        if not isinstance(value, str):
+            raise invalid(f"{field} should be a string")
+    if "rss" not in fields:
+        raise invalid("rss is missing")
+
+    parser_name = fields.get("parser", "base")
+    try:
+        base = PARSERS[parser_name]
+    except KeyError:
+        choices = ", ".join(PARSERS)
+        raise invalid(f"unknown parser {parser_name}, choose from: {choices}")
+
+    rules = {rule: fields[rule] for rule in _XPATH_RULES if rule in fields}
+    if check_xpaths and rules:
+        from lxml import etree
+
+        for rule, xpath in rules.items():
+            try:
+                rssp._xpath(xpath)
+            except etree.XPathError as exc:
+                raise invalid(f"{rule} is not a valid XPath: {exc}")
+    for rule in _REGEX_RULES:
+        if rule in fields:
+            try:
+                rules[rule] = re.compile(fields[rule])
+            except re.error as exc:
+                raise invalid(f"{rule} is not a valid regular expression: {exc}")
+    # Without rules, the built-in parser is used as is
+    rss_parser = base
+    if rules:
+        rss_parser = rssp.make_rule_parser(_class_name(name), base, **rules)
+
+    return Podcast(
+        name=name,
+        title=fields.get("title", name),
+        url=fields.get("url", fields["rss"]),
+        rss=fields["rss"],
+        rss_parser=rss_parser,
+    )
+
+
+def _class_name(name):
+    # Example: "python-bytes" -> "PythonBytesItem"
+    return "".join(part.capitalize() for part in re.split(r"[\W_]+", name)) + "Item"
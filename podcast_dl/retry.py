@@ -0,0 +1,109 @@
+"""
+Retrying failed requests with exponential backoff and per-host circuit breaking.
+"""
+import time
+import random
+import asyncio
+import email.utils
+
+import attrs
+import httpx
+
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class HostUnavailable(Exception):
+    """Raised without trying when a host failed too many times in a row."""
+
+
+@attrs.frozen
+class RetryPolicy:
+    """How many times and how long to wait between retrying failed requests.
+    The delay is exponential backoff with full jitter, or the Retry-After header
+    of the response when the server sends one."""
+
+    attempts: int = 3
+    backoff: float = 1.0
+    max_delay: float = 120.0
+
+    def is_retryable(self, exc: Exception) -> bool:
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in RETRY_STATUSES
+        if isinstance(exc, httpx.TransportError):
+            return True
+        # Exceptions can mark themselves retryable, e.g. incomplete downloads
+        return getattr(exc, "retryable", False)
+
+    def delay(self, attempt: int, exc: Exception | None = None) -> float:
+        retry_after = _parse_retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        backoff = min(self.backoff * 2 ** (attempt - 1), self.max_delay)
+        return random.uniform(0, backoff)
+
+
+def _parse_retry_after(exc):
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return None
+    value = exc.response.headers.get("Retry-After", "").strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """Stop sending requests to a host for a while after max_failures failed
+    requests in a row. 0 max_failures means never stop."""
+
+    def __init__(self, max_failures: int = 5, cooldown: float = 60.0, clock=None):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self._clock = clock or time.monotonic
+        self._failures = {}
+        self._opened_at = {}
+
+    def check(self, host: str):
+        opened_at = self._opened_at.get(host)
+        if opened_at is None:
+            return
+        if self._clock() - opened_at < self.cooldown:
+            raise HostUnavailable(f"Too many failed requests to {host}")
+        # Let one request through, a failure opens the circuit again
+        del self._opened_at[host]
+        self._failures[host] = self.max_failures - 1
+
+    def success(self, host: str):
+        self._failures.pop(host, None)
+
+    def failure(self, host: str):
+        self._failures[host] = self._failures.get(host, 0) + 1
+        if self.max_failures and self._failures[host] >= self.max_failures:
+            self._opened_at[host] = self._clock()
+
+
+async def with_retries(func, policy, breaker, host, vprint, description):
+    """Call and await func until it succeeds or the policy runs out of attempts.
+    Errors which are not retryable are raised immediately."""
+    for attempt in range(1, policy.attempts + 1):
+        breaker.check(host)
+        try:
+            result = await func()
+        except Exception as exc:
+            if not policy.is_retryable(exc):
+                raise
+            breaker.failure(host)
+            if attempt == policy.attempts:
+                raise
+            delay = policy.delay(attempt, exc)
+            vprint(
+                f"{description} failed: {exc}, retrying in {delay:.1f} seconds...",
+                fg="yellow",
+            )
+            await asyncio.sleep(delay)
+        else:
+            breaker.success(host)
+            return result
@@ -3,101 +3,180 @@ URL to filename parsers. They can be generic or entirely site-specific, based on
 what type of file names the RSS contains.
 """
 import os
+import re
+import datetime
+import functools
+from email.utils import parsedate_to_datetime
 
-from lxml import etree
-from slugify import slugify
+import attrs
 
+NSMAP = {"itunes": "http://www.itunes.com/dtds/podcast-1.0.dtd"}
 
+
+# Filenames are computed again every time a feed is parsed, e.g. on every poll
+# when watching, and titles rarely change
+SLUG_CACHE_SIZE = 8192
+
+_NUMBER_COMMA = re.compile(r"(?<=\d),(?=\d)")
+_NOT_ALPHANUMERIC = re.compile(r"[^a-zA-Z0-9]+")
+
+
+@functools.lru_cache(maxsize=SLUG_CACHE_SIZE)
 def _slug(string):
     # There are podcasts (e.g. Podcast.__init__) which mix and match underscores and
     # dashes in filenames, but slugify takes care of those also
+    if string.isascii() and "&" not in string:
+        # The same as slugify for plain ASCII: normalizing and transliterating
+        # doesn't change it, quotes and dashes become a single dash like every
+        # other disallowed character. HTML entities are left to slugify.
+        return _NOT_ALPHANUMERIC.sub("-", _NUMBER_COMMA.sub("", string)).strip("-")
+
+    # Imported here, so the CLI doesn't have to load it just for the podcast list
+    from slugify import slugify
+
     return slugify(string, lowercase=False)
 
 
+@functools.cache
+def _xpath(path):
+    # Compiled on first use, so lxml is not loaded just for the podcast list
+    from lxml import etree
+
+    return etree.XPath(path, namespaces=NSMAP)
+
+
+def _first_text(path, rss_item):
+    elems = _xpath(path)(rss_item)
+    return elems[0].text if elems else None
+
+
+@attrs.frozen(init=False)
 class BaseItem:
-    NSMAP = {"itunes": "http://www.itunes.com/dtds/podcast-1.0.dtd"}
+    """Every field is extracted once from the <item> element when the item is made,
+    so the element can be thrown away after. Subclasses can customize the fields
+    by overriding the _parse_* methods.
+    """
 
-    def __init__(self, rss_item: etree.Element):
-        self._rss_item = rss_item
+    url: str
+    title: str
+    episode: str | None
+    file_ext: str
+    filename: str
+    size: int | None
+    published: datetime.datetime | None
+    guid: str | None
 
-    @property
-    def url(self):
+    def __init__(self, rss_item):
         # will raise a ValueError if not exactly one element found
-        (enclosure,) = self._rss_item.xpath("enclosure")
-        return enclosure.get("url")
+        (enclosure,) = _xpath("enclosure")(rss_item)
+        url = enclosure.get("url")
+        raw_title = self._parse_raw_title(rss_item)
+        title = self._parse_title(raw_title)
+        episode = self._parse_episode(rss_item, raw_title)
+        file_ext = self._parse_file_ext(url)
+        filename = self._parse_filename(episode, title, file_ext)
+        size = self._parse_size(enclosure.get("length"))
+        published = self._parse_published(_first_text("pubDate", rss_item))
+        guid = _first_text("guid", rss_item)
+        guid = guid.strip() if guid else None
+        self.__attrs_init__(
+            url, title, episode, file_ext, filename, size, published, guid
+        )
 
     @property
-    def title(self):
-        return self._rss_item.xpath("title")[0].text
+    def key(self):
+        """Stable identity of the episode, even if the title changes."""
+        return self.guid or self.url
 
-    @property
-    def episode(self):
-        episode_elem = self._rss_item.xpath("itunes:episode", namespaces=self.NSMAP)
-        if len(episode_elem) == 0:
-            return None
-        episode = episode_elem[0].text
+    @classmethod
+    def _parse_raw_title(cls, rss_item):
+        return _xpath("title")(rss_item)[0].text
+
+    @classmethod
+    def _parse_title(cls, raw_title):
+        return raw_title
+
+    @classmethod
+    def _parse_episode(cls, rss_item, raw_title):
+        episode = _first_text("itunes:episode", rss_item)
         return episode.zfill(4) if episode else None
 
-    @property
-    def file_ext(self):
-        enclosure = self._rss_item.xpath("enclosure")[0]
-        url = enclosure.get("url")
+    @classmethod
+    def _parse_file_ext(cls, url):
         filename = url.split("/")[-1]
         return os.path.splitext(filename)[-1]
 
-    @property
-    def filename(self):
-        if self.episode is not None:
-            return f"{self.episode}-{_slug(self.title)}{self.file_ext}"
-        return f"{_slug(self.title)}{self.file_ext}"
+    @classmethod
+    def _parse_size(cls, length):
+        # Some feeds have an empty or zero length, which means unknown
+        if length and length.strip().isdigit() and int(length) > 0:
+            return int(length)
+        return None
 
+    @classmethod
+    def _parse_published(cls, pub_date):
+        if not pub_date:
+            return None
+        try:
+            return parsedate_to_datetime(pub_date.strip())
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def _parse_filename(cls, episode, title, file_ext):
+        if episode is not None:
+            return f"{episode}-{_slug(title)}{file_ext}"
+        return f"{_slug(title)}{file_ext}"
 
+
+@attrs.frozen(init=False)
 class TalkPythonItem(BaseItem):
-    @property
-    def title(self):
+    @classmethod
+    def _parse_title(cls, raw_title):
         # Example title: "#95 Unleash the py-spy!"
-        return super().title.split(" ", 1)[1]
+        return raw_title.split(" ", 1)[1]
 
-    @property
-    def episode(self):
+    @classmethod
+    def _parse_episode(cls, rss_item, raw_title):
         # Example title: "#95 Unleash the py-spy!"
-        episode = super().title.split(" ", 1)[0]
+        episode = raw_title.split(" ", 1)[0]
         return episode.lstrip("#").zfill(4)
 
 
+@attrs.frozen(init=False)
 class ChangelogItem(BaseItem):
-    @property
-    def episode(self):
-        super_episode = super().episode
+    @classmethod
+    def _parse_episode(cls, rss_item, raw_title):
+        super_episode = super()._parse_episode(rss_item, raw_title)
         if super_episode:
             return super_episode
         # There are episodes without episode number in the news section,
         # they have a different link: https://changelog.com/podcast/news-2023-01-09
         # Use the last part of that link as the episode number
-        link = self._rss_item.xpath("link")[0].text
+        link = _xpath("link")(rss_item)[0].text
         return link.rsplit("/", 1)[-1]
 
 
+@attrs.frozen(init=False)
 class IndieHackersItem(BaseItem):
-    @property
-    def title(self):
-        return self._split_title()[1].strip()
+    @classmethod
+    def _parse_title(cls, raw_title):
+        return cls._split_title(raw_title)[1].strip()
 
-    def _split_title(self):
+    @classmethod
+    def _split_title(cls, raw_title):
         # Some title contains long dash some not
         # Example title: "#077 – Iterating Your Way to a Product..."
-        tt = super().title.replace("–", "-")
+        tt = raw_title.replace("–", "-")
         return tt.split(" - ", 1)
 
-    @property
-    def episode(self):
-        ep = self._split_title()[0]
+    @classmethod
+    def _parse_episode(cls, rss_item, raw_title):
+        ep = cls._split_title(raw_title)[0]
         return ep.strip().lstrip("#").zfill(4)
 
-    @property
-    def file_ext(self):
-        enclosure = self._rss_item.xpath("enclosure")[0]
-        url = enclosure.get("url")
+    @classmethod
+    def _parse_file_ext(cls, url):
         filename = url.split("/")[-1]
         # Some filenames has parameters at the end:
         # 9b312200-acb1-11e8-88f7-0eb9d4683120/067-ryan-hoover-of-product-hunt.mp3?s=1&sd=1&u=1535674169
@@ -106,14 +185,81 @@ class IndieHackersItem(BaseItem):
         return os.path.splitext(filename)[-1]
 
 
+@attrs.frozen(init=False)
 class CoRecursiveItem(BaseItem):
-    @property
-    def title(self):
-        items = self._rss_item.xpath("itunes:title", namespaces=self.NSMAP)
-        return items[0].text
+    @classmethod
+    def _parse_raw_title(cls, rss_item):
+        return _xpath("itunes:title")(rss_item)[0].text
 
-    @property
-    def filename(self):
-        super_filename = super().filename
+    @classmethod
+    def _parse_filename(cls, episode, title, file_ext):
+        super_filename = super()._parse_filename(episode, title, file_ext)
         questionmark_pos = super_filename.index("?")
         return super_filename[:questionmark_pos]
+
+
+def make_rule_parser(
+    name: str,
+    base: type[BaseItem] = BaseItem,
+    *,
+    title_xpath: str | None = None,
+    title_regex: re.Pattern | None = None,
+    episode_xpath: str | None = None,
+    episode_regex: re.Pattern | None = None,
+    file_ext_regex: re.Pattern | None = None,
+) -> type[BaseItem]:
+    """Make a parser from extraction rules instead of a subclass.
+
+    The XPaths select the element of the raw title or the episode number, the
+    regexes pick a part of them, or the file extension from the URL: the first
+    group, or the whole match without groups. When a rule doesn't match, the base
+    parser is used for that field.
+    """
+    namespace = {}
+
+    if title_xpath is not None:
+
+        def _parse_raw_title(cls, rss_item):
+            return _xpath(title_xpath)(rss_item)[0].text
+
+        namespace["_parse_raw_title"] = classmethod(_parse_raw_title)
+
+    if title_regex is not None:
+
+        def _parse_title(cls, raw_title):
+            title = _search(title_regex, raw_title)
+            return title or super(parser, cls)._parse_title(raw_title)
+
+        namespace["_parse_title"] = classmethod(_parse_title)
+
+    if episode_xpath is not None or episode_regex is not None:
+
+        def _parse_episode(cls, rss_item, raw_title):
+            text = raw_title
+            if episode_xpath is not None:
+                text = _first_text(episode_xpath, rss_item)
+            if text is not None and episode_regex is not None:
+                text = _search(episode_regex, text)
+            if text:
+                return text.strip().zfill(4)
+            return super(parser, cls)._parse_episode(rss_item, raw_title)
+
+        namespace["_parse_episode"] = classmethod(_parse_episode)
+
+    if file_ext_regex is not None:
+
+        def _parse_file_ext(cls, url):
+            file_ext = _search(file_ext_regex, url)
+            return file_ext or super(parser, cls)._parse_file_ext(url)
+
+        namespace["_parse_file_ext"] = classmethod(_parse_file_ext)
+
+    parser = attrs.frozen(init=False)(type(name, (base,), namespace))
+    return parser
+
+
+def _search(pattern, string):
+    match = pattern.search(string)
+    if match is None:
+        return None
+    return match.group(1 if pattern.groups else 0)
@@ -0,0 +1,206 @@
+"""
+Selecting episodes of a feed with the --episodes option: episode numbers and
+ranges, filenames and titles, the last or newest episodes, publishing date ranges
+and regular expressions on the title.
+
+The feed is indexed once, then every selector is a lookup or an interval query.
+"""
+import re
+import bisect
+import datetime
+import operator
+import functools
+
+import attrs
+
+
+@functools.total_ordering
+class EpisodeParam:
+    def __init__(self, original: str):
+        self.original = original
+        self._spec = original.upper()
+
+    def __hash__(self):
+        return hash(self._spec)
+
+    def __eq__(self, other):
+        """Case insensitive equality."""
+        if self.__class__ is not other.__class__:
+            return self._spec == other.upper()
+        return self._spec == other._spec
+
+    def __lt__(self, other):
+        if self.__class__ is not other.__class__:
+            return NotImplemented
+        return self._spec < other._spec
+
+    def __str__(self):
+        return self.original
+
+    def __repr__(self):
+        return repr(self.original)
+
+
+@attrs.frozen
+class EpisodeSelection:
+    """An episode is selected when any of the selectors matches it."""
+
+    # Inclusive episode number intervals, sorted and merged
+    ranges: tuple[tuple[int, int], ...] = ()
+    # Episodes which are not numbers, filenames or titles, case insensitive
+    names: tuple[EpisodeParam, ...] = ()
+    # The last n episodes in filename order
+    last_n: int = 0
+    # Inclusive publishing date intervals, open ended with None
+    date_ranges: tuple[tuple[datetime.date | None, datetime.date | None], ...] = ()
+    title_patterns: tuple[re.Pattern, ...] = ()
+    # The n most recently published episodes, only the ones since the date
+    newest: tuple[tuple[int, datetime.date | None], ...] = ()
+
+    def __str__(self):
+        parts = [_format_range(first, last) for first, last in self.ranges]
+        parts += [str(name) for name in self.names]
+        parts += [f"{since or ''}..{until or ''}" for since, until in self.date_ranges]
+        parts += [f"title:{pattern.pattern}" for pattern in self.title_patterns]
+        for n, since in self.newest:
+            parts.append(f"newest {n}" + (f" since {since}" if since else ""))
+        if self.last_n:
+            parts.append(f"last {self.last_n}")
+        return ", ".join(parts)
+
+
+def merge_ranges(ranges) -> tuple[tuple[int, int], ...]:
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(last, merged[-1][1]))
+        else:
+            merged.append((first, last))
+    return tuple(merged)
+
+
+def _format_range(first, last):
+    if first == last:
+        return f"{first:04}"
+    return f"{first:04}-{last:04}"
+
+
+class FeedIndex:
+    """Indexes of the items of a feed by episode number, episode, filename, title
+    and publishing time. Items are referred to by their position in the feed.
+    Every index is built on first use, only the ones needed by the selection."""
+
+    def __init__(self, items):
+        self.items = items
+        self._name_indexes = {}
+
+    def select(self, selection: EpisodeSelection):
+        """Return the selected items in feed order, and the numbers, ranges and
+        names which didn't match any item."""
+        selected = set()
+        unknown = []
+
+        for first, last in selection.ranges:
+            numbers, positions = self._numbers
+            start = bisect.bisect_left(numbers, first)
+            end = bisect.bisect_right(numbers, last)
+            if start == end:
+                unknown.append(_format_range(first, last))
+            selected.update(positions[start:end])
+
+        for name in selection.names:
+            position = self._find_name(name)
+            if position is None:
+                unknown.append(str(name))
+            else:
+                selected.add(position)
+
+        for since, until in selection.date_ranges:
+            selected.update(self._published_between(since, until))
+
+        for pattern in selection.title_patterns:
+            selected.update(
+                position
+                for position, item in enumerate(self.items)
+                if pattern.search(item.title)
+            )
+
+        for n, since in selection.newest:
+            positions = self._published_between(since, None)
+            selected.update(positions[max(0, len(positions) - n) :])
+
+        if selection.last_n:
+            count = len(self.items)
+            selected.update(range(max(0, count - selection.last_n), count))
+
+        return [self.items[position] for position in sorted(selected)], unknown
+
+    @functools.cached_property
+    def _numbers(self):
+        """Numeric episode numbers in order, and the positions of the items."""
+        episodes = list(map(operator.attrgetter("episode"), self.items))
+        positions = [
+            position
+            for position, episode in enumerate(episodes)
+            if episode is not None and episode.isdigit()
+        ]
+        numbers = [int(episodes[position]) for position in positions]
+        return _sorted_together(numbers, positions)
+
+    def _find_name(self, name):
+        key = name.original.upper()
+        # Most names are episodes or filenames, so the later indexes are often
+        # not needed at all
+        for attribute in ("episode", "filename", "title"):
+            index = self._name_index(attribute)
+            if key in index:
+                return index[key]
+        return None
+
+    def _name_index(self, attribute):
+        if attribute not in self._name_indexes:
+            values = map(operator.attrgetter(attribute), self.items)
+            keys = [value and value.upper() for value in values]
+            # Reversed, so the first item wins
+            positions = range(len(keys) - 1, -1, -1)
+            index = dict(zip(reversed(keys), positions))
+            index.pop(None, None)
+            self._name_indexes[attribute] = index
+        return self._name_indexes[attribute]
+
+    @functools.cached_property
+    def _published(self):
+        """Publishing timestamps in order, and the positions of the items."""
+        positions = [
+            position
+            for position, item in enumerate(self.items)
+            if item.published is not None
+        ]
+        timestamps = [
+            self.items[position].published.timestamp() for position in positions
+        ]
+        return _sorted_together(timestamps, positions)
+
+    def _published_between(self, since, until):
+        """Positions of the items published on the days between since and until,
+        in UTC, in publishing order."""
+        timestamps, positions = self._published
+        start, end = 0, len(timestamps)
+        if since is not None:
+            start = bisect.bisect_left(timestamps, _utc_timestamp(since))
+        if until is not None:
+            next_day = until + datetime.timedelta(days=1)
+            end = bisect.bisect_left(timestamps, _utc_timestamp(next_day))
+        return positions[start:end]
+
+
+def _utc_timestamp(date):
+    return datetime.datetime.combine(date, datetime.time(), datetime.UTC).timestamp()
+
+
+def _sorted_together(keys, values):
+    """Sort both lists by the keys. Feeds are usually in order already."""
+    if all(map(operator.le, keys, keys[1:])):
+        return keys, values
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return [keys[i] for i in order], [values[i] for i in order]
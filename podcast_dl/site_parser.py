@@ -1,3 +1,4 @@
+import re
 from urllib.parse import urlparse
 import click
 from .podcasts import Podcast, PODCAST_MAP
@@ -7,18 +8,41 @@ class InvalidSite(Exception):
     """Raised when an invalid site is specified."""
 
 
-def parse_site(site: str):
-    if site.startswith("http"):
+def parse_site(site: str, podcast_map: dict[str, Podcast] = PODCAST_MAP):
+    url = site if site.startswith("http") else None
+    if url is not None:
         site = urlparse(site).netloc
 
-    if "." in site:
-        site = _parse_domain(site)
+    try:
+        if url is not None:
+            podcast = _get_podcast_by_url(podcast_map, url, site)
+        else:
+            if "." in site:
+                site = _parse_domain(site)
+            podcast = _get_podcast(podcast_map, site)
+    except InvalidSite:
+        # Any other URL can be the RSS feed of a podcast
+        if url is None:
+            raise
+        podcast = _feed_podcast(url)
+        click.echo(f"Specified RSS feed: {url}")
+        return podcast
 
-    podcast = _get_podcast(site)
     click.echo(f"Specified podcast: {podcast.name} - {podcast.title} ({podcast.url})")
     return podcast
 
 
+def _get_podcast_by_url(podcast_map, url, domain) -> Podcast:
+    for podcast in podcast_map.values():
+        if podcast.rss == url:
+            return podcast
+    # Other feeds on the same site are different podcasts, e.g. changelog.com/gotime
+    podcast = _get_podcast(podcast_map, _parse_domain(domain))
+    if not _is_under(url, podcast.url):
+        raise InvalidSite
+    return podcast
+
+
 def _parse_domain(domain):
     try:
         return domain.split(".")[-2]
@@ -26,8 +50,28 @@ def _parse_domain(domain):
         raise InvalidSite
 
 
-def _get_podcast(name) -> Podcast:
+def _get_podcast(podcast_map, name) -> Podcast:
     try:
-        return PODCAST_MAP[name]
+        return podcast_map[name]
     except KeyError:
         raise InvalidSite
+
+
+def _is_under(url, base_url):
+    url, base_url = urlparse(url), urlparse(base_url)
+    if _host(url) != _host(base_url):
+        return False
+    # Example: /podcast/ is under /podcast, but /podcasts is not
+    return f"{url.path.rstrip('/')}/".startswith(f"{base_url.path.rstrip('/')}/")
+
+
+def _host(parsed_url):
+    return parsed_url.netloc.removeprefix("www.")
+
+
+def _feed_podcast(url) -> Podcast:
+    parsed_url = urlparse(url)
+    # Example: https://www.example.com/show/feed.xml -> example-com-show-feed-xml
+    path = f"{_host(parsed_url)}{parsed_url.path}"
+    name = re.sub(r"[^a-z0-9]+", "-", path.lower()).strip("-")
+    return Podcast(name=name, title=name, url=url, rss=url, rss_parser=None)
@@ -0,0 +1,78 @@
+"""
+Persistent record of the downloaded episodes in an SQLite database.
+"""
+import sqlite3
+import datetime
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    podcast TEXT NOT NULL,
+    key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER,
+    sha256 TEXT,
+    etag TEXT,
+    downloaded_at TEXT NOT NULL,
+    PRIMARY KEY (podcast, key)
+)
+"""
+
+
+class StateDB:
+    """Downloaded episodes by podcast and episode key (GUID or enclosure URL).
+
+    The database can be shared by multiple processes: it is in WAL mode and every
+    record is written in its own short transaction.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def podcast(self, name: str) -> "PodcastState":
+        return PodcastState(self, name)
+
+    def downloaded(self, podcast: str) -> dict:
+        rows = self._conn.execute(
+            "SELECT key, filename, size, sha256 FROM episodes WHERE podcast = ?",
+            (podcast,),
+        )
+        return {key: (filename, size, sha256) for key, filename, size, sha256 in rows}
+
+    def record(self, podcast, key, url, filename, size=None, sha256=None, etag=None):
+        downloaded_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        # In autocommit mode, every statement is a separate transaction
+        self._conn.execute(
+            "INSERT OR REPLACE INTO episodes "
+            "(podcast, key, url, filename, size, sha256, etag, downloaded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (podcast, key, url, filename, size, sha256, etag, downloaded_at),
+        )
+
+
+class PodcastState:
+    """The state of one podcast. Downloaded episodes are loaded once,
+    so looking up an episode doesn't touch the database."""
+
+    def __init__(self, db: StateDB, name: str):
+        self._db = db
+        self.name = name
+        self._downloaded = db.downloaded(name)
+
+    def __contains__(self, key):
+        return key in self._downloaded
+
+    def get(self, key):
+        """Filename, size and SHA-256 hash of a downloaded episode or None."""
+        return self._downloaded.get(key)
+
+    def record(self, key, url, filename, size=None, sha256=None, etag=None):
+        self._db.record(self.name, key, url, filename, size, sha256, etag)
+        self._downloaded[key] = (filename, size, sha256)
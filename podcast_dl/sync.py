@@ -0,0 +1,403 @@
+"""
+Syncing the podcasts: downloading the feeds, finding and downloading the missing
+episodes, once or forever in watch mode.
+"""
+import atexit
+import asyncio
+import datetime
+import functools
+from pathlib import Path
+from typing import Callable, TextIO
+from urllib.parse import urlparse
+
+import attrs
+import click
+import httpx
+
+from . import metrics
+from .feed_cache import FeedCache
+from .state import StateDB
+from .retry import CircuitBreaker, RetryPolicy, with_retries
+from .progress import JsonRenderer, NoProgress, Progress, TerminalRenderer
+from .selection import EpisodeSelection
+from .detect import CANDIDATES, parser_name
+from .ratelimit import RateLimiter, RateLimitedTransport
+from .podcast_dl import (
+    DownloadSettings,
+    FeedNotModified,
+    ensure_download_dir,
+    download_feed,
+    load_cached_feed,
+    filter_rss_items,
+    make_episodes,
+    find_missing,
+    download_episodes,
+    sort_episodes,
+)
+
+
+@attrs.frozen
+class Sync:
+    """Everything needed for syncing podcasts, so it can be done many times with the
+    same HTTP client in watch mode."""
+
+    http: httpx.AsyncClient
+    download_dir: Path | None
+    multiple: bool
+    feed_cache: FeedCache | None
+    state: StateDB | None
+    episodes_param: EpisodeSelection | None
+    show_episodes: bool
+    show_progressbar: bool
+    order: str
+    max_threads: int
+    max_per_host: int | None
+    settings: DownloadSettings
+    retry_policy: RetryPolicy
+    circuit_breaker: CircuitBreaker
+    vprint: Callable
+    metrics_textfile: Path | None = None
+    progress_json: TextIO | None = None
+    progress_interval: float = 0.5
+
+    async def run(self, podcasts):
+        feeds = await self.download_feeds(podcasts)
+        failed_podcasts = await self.sync(podcasts, feeds)
+        return 1 if failed_podcasts else 0
+
+    async def download_feeds(self, podcasts):
+        """Download the RSS feeds concurrently. Returns the feed, None when it has
+        not changed, or the exception for every podcast."""
+        rss_coros = [
+            with_retries(
+                functools.partial(
+                    _download_feed,
+                    self.http,
+                    podcast,
+                    self.feed_cache,
+                    None if self.show_episodes else self._coverage(podcast),
+                ),
+                self.retry_policy,
+                self.circuit_breaker,
+                urlparse(podcast.rss).hostname,
+                self.vprint,
+                f"Downloading the RSS feed of {podcast.name}",
+            )
+            for podcast in podcasts
+        ]
+        return await asyncio.gather(*rss_coros, return_exceptions=True)
+
+    async def sync(self, podcasts, feeds):
+        """Download the missing episodes of the podcasts and return the ones which
+        could not be synced completely."""
+        failed_podcasts = set()
+        podcast_episodes = {}
+
+        for podcast, feed in zip(podcasts, feeds):
+            if isinstance(feed, Exception):
+                click.secho(
+                    f"ERROR: Could not download the RSS feed of {podcast.name}: "
+                    f"{feed}",
+                    fg="red",
+                    err=True,
+                )
+                failed_podcasts.add(podcast)
+                continue
+
+            if feed is None:
+                click.secho(
+                    f"The RSS feed of {podcast.name} has not changed since the last"
+                    " sync.",
+                    fg="green",
+                )
+                continue
+
+            if self.episodes_param is not None:
+                rss_items, unknown_episodes = filter_rss_items(
+                    feed.items, self.episodes_param
+                )
+                _warn_about_unknown_episodes(unknown_episodes)
+            else:
+                rss_items = feed.items
+
+            if self.show_episodes:
+                _list_episodes(podcast if self.multiple else None, rss_items)
+                continue
+
+            podcast_dir = _get_podcast_dir(self.download_dir, podcast, self.multiple)
+            ensure_download_dir(podcast_dir)
+            podcast_state = self.state.podcast(podcast.name) if self.state else None
+            episodes = make_episodes(podcast_dir, rss_items, podcast_state)
+            missing_episodes = find_missing(
+                episodes, self.vprint, self.settings.check_size
+            )
+
+            if not missing_episodes:
+                self._mark_synced(podcast)
+                click.secho(
+                    f"Every episode of {podcast.name} is downloaded.", fg="green"
+                )
+                continue
+
+            podcast_episodes[podcast] = missing_episodes
+
+        if self.show_episodes or not podcast_episodes:
+            return failed_podcasts
+
+        all_missing = sort_episodes(
+            (ep for eps in podcast_episodes.values() for ep in eps), self.order
+        )
+        click.echo(f"Found a total of {len(all_missing)} missing episodes.")
+        progress = _make_progress(
+            all_missing,
+            self.show_progressbar,
+            self.progress_json,
+            self.progress_interval,
+        )
+        failed_episodes = await download_episodes(
+            self.http,
+            all_missing,
+            self.max_threads,
+            self.vprint,
+            progress,
+            self.settings,
+            self.max_per_host,
+            self.retry_policy,
+            self.circuit_breaker,
+        )
+
+        _report_failed_episodes(failed_episodes)
+
+        for podcast, missing_episodes in podcast_episodes.items():
+            failed = sum(1 for ep in missing_episodes if ep in failed_episodes)
+            if failed:
+                failed_podcasts.add(podcast)
+            else:
+                self._mark_synced(podcast)
+            if self.multiple or failed:
+                _report_podcast(podcast, len(missing_episodes), failed)
+
+        if not failed_podcasts:
+            click.secho("Done.", fg="green")
+        return failed_podcasts
+
+    def _coverage(self, podcast):
+        """What syncing the podcast covers. When the feed has not changed since a
+        sync of the same, there is nothing to do."""
+        podcast_dir = _get_podcast_dir(self.download_dir, podcast, self.multiple)
+        try:
+            # Changes when episodes are deleted or moved away
+            dir_mtime = podcast_dir.stat().st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        episodes = self.episodes_param
+        return {
+            "download_dir": str(podcast_dir.resolve()),
+            "dir_mtime": dir_mtime,
+            "check_size": self.settings.check_size,
+            "episodes": None if episodes is None else str(episodes),
+        }
+
+    def _mark_synced(self, podcast):
+        if self.feed_cache is not None:
+            self.feed_cache.mark_synced(podcast.rss, self._coverage(podcast))
+
+
+async def watch_podcasts(sync, watcher, podcasts):
+    """Poll the feeds forever and sync the podcasts which have new items."""
+    for podcast in podcasts:
+        watcher.add(podcast)
+
+    while True:
+        await asyncio.sleep(watcher.wait_time())
+        due = watcher.due()
+        feeds = await sync.download_feeds(due)
+        changed_podcasts, changed_feeds = [], []
+        for podcast, feed in zip(due, feeds):
+            if isinstance(feed, Exception):
+                watcher.failed(podcast)
+            elif feed is None:
+                if podcast in watcher:
+                    watcher.not_modified(podcast)
+                    continue
+                # Synced before watching, the cached feed has the publishing history
+                rss_parser = _rss_parser(sync.feed_cache, podcast)
+                cached = load_cached_feed(sync.feed_cache, podcast.rss, rss_parser)
+                watcher.update(podcast, cached)
+            elif not watcher.update(podcast, feed):
+                sync.vprint(f"No new episodes of {podcast.name}.")
+                continue
+            # Failed and unchanged feeds are reported by sync
+            changed_podcasts.append(podcast)
+            changed_feeds.append(feed)
+
+        failed_podcasts = await sync.sync(changed_podcasts, changed_feeds)
+        for podcast in failed_podcasts:
+            watcher.failed(podcast)
+        if sync.metrics_textfile is not None:
+            metrics.write_prometheus(sync.metrics_textfile)
+
+        next_poll = datetime.datetime.now() + datetime.timedelta(
+            seconds=watcher.wait_time()
+        )
+        click.echo(f"Waiting for new episodes until {next_poll:%H:%M:%S}...")
+
+
+def _get_podcast_dir(download_dir, podcast, multiple):
+    if download_dir is None:
+        return Path(podcast.name)
+    if multiple:
+        return download_dir / podcast.name
+    return download_dir
+
+
+async def _download_feed(http, podcast, feed_cache, coverage):
+    """Download and parse the RSS feed of the podcast.
+    Returns None when there is nothing to do, because the feed has not changed
+    since it was synced with the same coverage."""
+    rss_parser = _rss_parser(feed_cache, podcast)
+    try:
+        feed = await download_feed(http, podcast.rss, rss_parser, feed_cache)
+    except FeedNotModified:
+        if coverage is not None and feed_cache.is_synced(podcast.rss, coverage):
+            return None
+        return load_cached_feed(feed_cache, podcast.rss, rss_parser)
+
+    if rss_parser is None:
+        name = parser_name(feed.rss_parser)
+        click.echo(f"Detected the episode format of {podcast.name}: {name}")
+        if feed_cache is not None:
+            feed_cache.store_detected_parser(podcast.rss, name)
+    return feed
+
+
+def _rss_parser(feed_cache, podcast):
+    """The parser of the podcast, or the one detected from its feed before. None
+    when it has to be detected."""
+    if podcast.rss_parser is not None or feed_cache is None:
+        return podcast.rss_parser
+    return CANDIDATES.get(feed_cache.detected_parser(podcast.rss))
+
+
+def _report_failed_episodes(failed_episodes):
+    if not failed_episodes:
+        return
+    click.secho("Failed episodes:", fg="red", err=True)
+    for episode, exc in failed_episodes.items():
+        click.secho(f"  {episode.full_path}: {exc}", fg="red", err=True)
+
+
+def _report_podcast(podcast, missing, failed):
+    downloaded = missing - failed
+    message = f"{podcast.name}: {downloaded} episodes downloaded, {failed} failed."
+    click.secho(message, fg="yellow" if failed else "green")
+
+
+def _list_episodes(podcast, rss_items):
+    if podcast is None:
+        click.echo("List of episodes:")
+    else:
+        click.echo(f"List of episodes of {podcast.name}:")
+    for item in rss_items:
+        episodenum = item.episode or " N/A"
+        click.echo(f"{episodenum} - {item.title}")
+
+
+def make_asyncio_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    atexit.register(loop.close)
+    return loop
+
+
+def make_async_http_client(
+    loop,
+    max_connections=None,
+    keepalive_expiry=5.0,
+    timeout=5.0,
+    http2=False,
+    rate_limiter=None,
+    event_hooks=None,
+):
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    # The number of downloads are limited by ConnectionBudget already,
+    # so waiting for a free connection in the pool should never time out
+    timeout = httpx.Timeout(timeout, pool=None)
+    transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+    if rate_limiter is not None:
+        transport = RateLimitedTransport(transport, rate_limiter)
+    http = httpx.AsyncClient(
+        transport=transport, timeout=timeout, event_hooks=event_hooks
+    )
+    atexit.register(lambda: loop.run_until_complete(http.aclose()))
+    return http
+
+
+def make_rate_limiter(limit_rate, limit_rate_per_host, limit_schedule):
+    if not limit_rate and not limit_rate_per_host and not limit_schedule:
+        return None
+    return RateLimiter(limit_rate, limit_rate_per_host, limit_schedule)
+
+
+def enable_metrics(metrics_log, metrics_textfile):
+    if metrics_log is None and metrics_textfile is None:
+        return False
+    jsonl_file = None
+    if metrics_log is not None:
+        # Line buffered, so every span is written right away
+        jsonl_file = metrics_log.open("a", buffering=1)
+        atexit.register(jsonl_file.close)
+    metrics.enable(metrics.Recorder(jsonl_file))
+    if metrics_textfile is not None:
+        atexit.register(metrics.write_prometheus, metrics_textfile)
+    return True
+
+
+def make_state_db(state_db):
+    if state_db is None:
+        return None
+    state = StateDB(state_db)
+    atexit.register(state.close)
+    return state
+
+
+def _warn_about_unknown_episodes(unknown_episodes):
+    if unknown_episodes:
+        click.secho(
+            "WARNING: Unknown episode numbers:"
+            + ", ".join(str(e) for e in unknown_episodes),
+            fg="yellow",
+            err=True,
+        )
+
+
+def _make_progress(episodes, show_progressbar, progress_json, interval):
+    renderers = []
+    if show_progressbar:
+        renderers.append(TerminalRenderer())
+    if progress_json is not None:
+        renderers.append(JsonRenderer(progress_json))
+    if not renderers:
+        return NoProgress()
+    return Progress(episodes, renderers, interval)
+
+
+def run_until_complete(loop, coro) -> int:
+    try:
+        return loop.run_until_complete(coro)
+    except KeyboardInterrupt:
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        # let the tasks close their files, so the downloads can be resumed
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        click.secho(
+            "CTRL-C pressed, aborting... Downloads will be resumed next time.",
+            fg="yellow",
+            err=True,
+        )
+        return 1
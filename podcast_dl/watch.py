@@ -0,0 +1,81 @@
+"""
+Polling RSS feeds in watch mode, every feed on its own interval adapted to how often
+new episodes are published.
+"""
+import time
+import statistics
+
+# Poll this many times between two episodes of a podcast
+POLLS_PER_EPISODE = 8
+
+# Only the recent publishing history tells how often episodes come out now
+HISTORY_SIZE = 10
+
+
+def poll_interval(feed, min_interval: float, max_interval: float) -> float:
+    """Seconds to wait before polling the feed again, based on the typical time
+    between the last episodes. The TTL of the feed is respected, but polling is
+    never rarer than max_interval.
+    """
+    # Aware and naive datetimes can't be compared, timestamps can
+    published = sorted(
+        item.published.timestamp() for item in feed.items if item.published
+    )
+    recent = published[-HISTORY_SIZE:]
+    gaps = [later - earlier for earlier, later in zip(recent, recent[1:])]
+    if gaps:
+        interval = statistics.median(gaps) / POLLS_PER_EPISODE
+    else:
+        interval = max_interval
+    interval = max(interval, min_interval, feed.ttl or 0)
+    return min(interval, max_interval)
+
+
+class FeedWatcher:
+    """Keeps track of when every podcast should be polled next and which items
+    have been seen already, so only feeds with new items are synced.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, clock=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._clock = clock or time.monotonic
+        self._next_poll = {}
+        self._intervals = {}
+        self._seen = {}
+
+    def __contains__(self, podcast):
+        """Whether the items of the podcast have been seen."""
+        return podcast in self._seen
+
+    def add(self, podcast):
+        self._next_poll[podcast] = self._clock()
+
+    def wait_time(self) -> float:
+        """Seconds until the next feed should be polled."""
+        return max(0.0, min(self._next_poll.values()) - self._clock())
+
+    def due(self) -> list:
+        now = self._clock()
+        return [podcast for podcast, at in self._next_poll.items() if at <= now]
+
+    def update(self, podcast, feed) -> bool:
+        """Schedule the next poll by the feed and tell if it has new items."""
+        interval = poll_interval(feed, self.min_interval, self.max_interval)
+        self._schedule(podcast, interval)
+        keys = {item.key for item in feed.items}
+        seen = self._seen.get(podcast)
+        self._seen[podcast] = keys
+        return seen is None or not keys <= seen
+
+    def not_modified(self, podcast):
+        self._schedule(podcast, self._intervals.get(podcast, self.min_interval))
+
+    def failed(self, podcast):
+        """Poll again soon and sync every item, because the last sync failed."""
+        self._next_poll[podcast] = self._clock() + self.min_interval
+        self._seen.pop(podcast, None)
+
+    def _schedule(self, podcast, interval):
+        self._intervals[podcast] = interval
+        self._next_poll[podcast] = self._clock() + interval
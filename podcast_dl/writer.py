@@ -0,0 +1,109 @@
+"""
+Writing downloaded files in a dedicated thread pool, so slow disks don't block
+the event loop.
+"""
+import os
+import asyncio
+import concurrent.futures
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+_executor = None
+
+# The maximum number of buffers for one writev call
+IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="podcast-dl-writer"
+        )
+    return _executor
+
+
+def preallocate(fd, size):
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fd, 0, size)
+    else:
+        os.ftruncate(fd, size)
+
+
+def _pwrite_all(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def _write_all(fd, chunks, offset):
+    """Write the chunks to the file at offset without joining them."""
+    if not hasattr(os, "pwritev"):
+        _pwrite_all(fd, b"".join(chunks), offset)
+        return
+    for start in range(0, len(chunks), IOV_MAX):
+        batch = chunks[start : start + IOV_MAX]
+        size = sum(map(len, batch))
+        written = os.pwritev(fd, batch, offset)
+        # short writes are rare, the rest is written in one piece
+        if written < size:
+            _pwrite_all(fd, b"".join(batch)[written:], offset + written)
+        offset += size
+
+
+class FileWriter:
+    """Collects chunks until buffer_size is reached, then writes them with one
+    positioned system call in the writer thread pool. While a buffer is written,
+    the next one can be collected, so network and disk I/O overlap.
+    """
+
+    def __init__(self, fd: int, offset: int = 0, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.fd = fd
+        self._offset = offset
+        self._buffer_size = buffer_size
+        self._chunks = []
+        self._buffered = 0
+        self._pending = None
+
+    @property
+    def position(self):
+        """Where the next chunk will be written in the file."""
+        return self._offset + self._buffered
+
+    async def write(self, chunk: bytes):
+        self._chunks.append(chunk)
+        self._buffered += len(chunk)
+        if self._buffered >= self._buffer_size:
+            await self._flush()
+
+    async def _flush(self):
+        await self._wait()
+        if not self._chunks:
+            return
+        chunks, self._chunks = self._chunks, []
+        self._pending = _get_executor().submit(
+            _write_all, self.fd, chunks, self._offset
+        )
+        self._offset += self._buffered
+        self._buffered = 0
+
+    async def _wait(self):
+        if self._pending is not None:
+            await asyncio.wrap_future(self._pending)
+            self._pending = None
+
+    async def flush(self):
+        """Write every collected chunk and wait until they are on the disk."""
+        await self._flush()
+        await self._wait()
+
+    def abort(self):
+        """Wait for the running write without the event loop, so the file can be
+        closed safely even when the download was cancelled."""
+        if self._pending is not None:
+            concurrent.futures.wait([self._pending])
+            self._pending = None
+        self._chunks = []
+        self._buffered = 0
@@ -0,0 +1,37 @@
+import pytest
+from lxml import etree
+
+from podcast_dl.rss_parsers import BaseItem
+
+
+@pytest.fixture
+def noprint():
+    """vprint which prints nothing."""
+
+    def noprint(*args, **kwargs):
+        pass
+
+    return noprint
+
+
+@pytest.fixture
+def make_item():
+    """Make a BaseItem from an <item> element with the given fields."""
+
+    def make_item(title, length=3, guid=None, pub_date=None):
+        guid = "" if guid is None else f"<guid>{guid}</guid>"
+        pub_date = "" if pub_date is None else f"<pubDate>{pub_date}</pubDate>"
+        return BaseItem(
+            etree.XML(
+                f"""
+                <item>
+                  <title>{title}</title>
+                  {guid}
+                  {pub_date}
+                  <enclosure url="https://example.com/{title}.mp3" length="{length}"/>
+                </item>
+                """
+            )
+        )
+
+    return make_item
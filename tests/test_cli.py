@@ -1,61 +1,88 @@
+import datetime
+
+import click
+import pytest
+
 from podcast_dl import cli
+from podcast_dl.selection import EpisodeSelection
 
 
 convert = cli.EpisodeList().convert
 
 
 def test_numeric_values():
-    assert convert("1") == (["0001"], 0)
-    assert convert("1,99") == (["0001", "0099"], 0)
-    assert convert("0,9999") == (["0000", "9999"], 0)
-    assert convert("0,9999,9999") == (["0000", "9999"], 0)
+    assert convert("1") == EpisodeSelection(ranges=((1, 1),))
+    assert convert("1,99") == EpisodeSelection(ranges=((1, 1), (99, 99)))
+    assert convert("0,9999") == EpisodeSelection(ranges=((0, 0), (9999, 9999)))
+    assert convert("0,9999,9999") == EpisodeSelection(ranges=((0, 0), (9999, 9999)))
 
 
 def test_ranges():
-    assert convert("12-15") == (["0012", "0013", "0014", "0015"], 0)
-    assert convert("0-3") == (["0000", "0001", "0002", "0003"], 0)
-    assert convert("0-2,99-101") == (
-        ["0000", "0001", "0002", "0099", "0100", "0101"],
-        0,
-    )
-    assert convert("3-3") == (["0003"], 0)
-    assert convert("3-3,3-3") == (["0003"], 0)
+    assert convert("12-15") == EpisodeSelection(ranges=((12, 15),))
+    assert convert("0-3") == EpisodeSelection(ranges=((0, 3),))
+    assert convert("0-2,99-101") == EpisodeSelection(ranges=((0, 2), (99, 101)))
+    assert convert("3-3") == EpisodeSelection(ranges=((3, 3),))
+    assert convert("3-3,3-3") == EpisodeSelection(ranges=((3, 3),))
+
+
+def test_ranges_are_merged():
+    assert convert("1-9999,5,20-30") == EpisodeSelection(ranges=((1, 9999),))
+    assert convert("1-3,4,5-6,8") == EpisodeSelection(ranges=((1, 6), (8, 8)))
 
 
 def test_last():
-    assert convert("last") == ([], 1)
-    assert convert("lAsT") == ([], 1)
-    assert convert("last,last") == ([], 1)
-    assert convert("last,last,last:5") == ([], 5)
-    assert convert("last,last:10,last:5") == ([], 10)
-    assert convert("last,last:10,last") == ([], 10)
+    assert convert("last") == EpisodeSelection(last_n=1)
+    assert convert("lAsT") == EpisodeSelection(last_n=1)
+    assert convert("last,last") == EpisodeSelection(last_n=1)
+    assert convert("last,last,last:5") == EpisodeSelection(last_n=5)
+    assert convert("last,last:10,last:5") == EpisodeSelection(last_n=10)
+    assert convert("last,last:10,last") == EpisodeSelection(last_n=10)
 
 
 def test_last_n():
-    assert convert("last:5") == ([], 5)
-    assert convert("last,last:5") == ([], 5)
-    assert convert("last,last,last:5") == ([], 5)
-    assert convert("last,lAst:10,laSt:5") == ([], 10)
+    assert convert("last:5") == EpisodeSelection(last_n=5)
+    assert convert("last,last:5") == EpisodeSelection(last_n=5)
+    assert convert("last,last,last:5") == EpisodeSelection(last_n=5)
+    assert convert("last,lAst:10,laSt:5") == EpisodeSelection(last_n=10)
 
 
 def test_not_numeric_or_unknown():
-    assert convert("the-changelog-afk-jeff-bonus.mp3") == (
-        ["THE-CHANGELOG-AFK-JEFF-BONUS.MP3"],
-        0,
+    assert convert("the-changelog-afk-jeff-bonus.mp3") == EpisodeSelection(
+        names=("THE-CHANGELOG-AFK-JEFF-BONUS.MP3",)
     )
 
-    assert convert("Some Title") == (["SOME TITLE"], 0)
-    assert convert("1,") == (["0001"], 0)
-    assert convert("3,10bla") == (["0003", "10BLA"], 0)
-    assert convert("2-10bla") == (["2-10BLA"], 0)
+    assert convert("Some Title") == EpisodeSelection(names=("SOME TITLE",))
+    assert convert("1,") == EpisodeSelection(ranges=((1, 1),))
+    assert convert("3,10bla") == EpisodeSelection(ranges=((3, 3),), names=("10BLA",))
+    assert convert("2-10bla") == EpisodeSelection(names=("2-10BLA",))
 
 
 def test_mixed_values():
-    assert convert("1,99,12-14,last,the-changelog") == (
-        ["0001", "0012", "0013", "0014", "0099", "THE-CHANGELOG"],
-        1,
+    assert convert("1,99,12-14,last,the-changelog") == EpisodeSelection(
+        ranges=((1, 1), (12, 14), (99, 99)), names=("THE-CHANGELOG",), last_n=1
+    )
+    assert convert("0,12-14,last:5") == EpisodeSelection(
+        ranges=((0, 0), (12, 14)), last_n=5
     )
-    assert convert("0,12-14,last:5") == (["0000", "0012", "0013", "0014"], 5)
+
+
+def test_dates_newest_and_titles():
+    selection = convert("2024-01-01..2024-03-31,..2020-12-31,newest:3@2024-06-01")
+    assert selection.date_ranges == (
+        (datetime.date(2024, 1, 1), datetime.date(2024, 3, 31)),
+        (None, datetime.date(2020, 12, 31)),
+    )
+    assert selection.newest == ((3, datetime.date(2024, 6, 1)),)
+    assert convert("newest:2").newest == ((2, None),)
+    (pattern,) = convert("title:^django").title_patterns
+    assert pattern.search("Django 5.0")
+
+
+def test_invalid_selectors():
+    with pytest.raises(click.BadParameter):
+        convert("2024-02-30..")
+    with pytest.raises(click.BadParameter):
+        convert("title:(")
 
 
 def test_EpisodeParam_ordering():
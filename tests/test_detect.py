@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+from lxml import etree
+
+from podcast_dl.detect import CANDIDATES, SAMPLE_SIZE, detect_parser, parser_name
+from podcast_dl.feed_cache import FeedCache
+from podcast_dl.podcast_dl import RssItemParser
+from podcast_dl.podcasts import Podcast
+from podcast_dl.sync import _download_feed
+
+ITUNES_XMLNS = 'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"'
+RSS_URL = "https://feeds.example.com/show.xml"
+
+
+def _item(title, url, episode=None):
+    episode = f"<itunes:episode>{episode}</itunes:episode>" if episode else ""
+    return (
+        f"<item><title>{title}</title>{episode}"
+        f'<enclosure url="{url}" length="10" type="audio/mpeg" /></item>'
+    )
+
+
+def _feed(items):
+    return f"<rss {ITUNES_XMLNS}><channel>{''.join(items)}</channel></rss>".encode()
+
+
+def _sample(items):
+    return etree.XML(_feed(items)).findall("channel/item")
+
+
+def test_itunes_episode_numbers_are_preferred():
+    items = [_item(f"#{n} Title {n}", f"https://x.com/{n}.mp3", n) for n in (1, 2)]
+    assert parser_name(detect_parser(_sample(items))) == "itunes"
+
+
+def test_episode_numbers_in_titles():
+    items = [
+        _item("#95 Unleash the py-spy!", "https://x.com/a.mp3?s=1"),
+        _item("Episode 96: Packaging", "https://x.com/b.mp3?s=1"),
+        _item("Bonus", "https://x.com/c.mp3?s=1"),
+    ]
+    parser = detect_parser(_sample(items))
+    assert parser_name(parser) == "title-number"
+    assert [parser(item).filename for item in _sample(items)] == [
+        "0095-Unleash-the-py-spy.mp3",
+        "0096-Packaging.mp3",
+        "Bonus.mp3",
+    ]
+
+
+def test_numbers_of_repeated_titles():
+    # The same title every week, only the number is different
+    items = [_item(f"{n} - Weekly news", f"https://x.com/{n}.mp3") for n in (1, 2)]
+    assert parser_name(detect_parser(_sample(items))) == "title-number"
+
+
+def test_parser_is_detected_from_the_first_items():
+    count = SAMPLE_SIZE + 10
+    items = [_item(f"#{n} Title", f"https://x.com/{n}.mp3") for n in range(count)]
+    parser = RssItemParser(None)
+    parser.feed(_feed(items))
+
+    assert parser_name(parser.rss_parser) == "title-number"
+    assert len(parser.close()) == count
+
+
+def test_detected_parser_is_cached(tmp_path):
+    body = _feed([_item("#1 First", "https://x.com/1.mp3")])
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    http = httpx.AsyncClient(transport=transport)
+    feed_cache = FeedCache(tmp_path)
+    podcast = Podcast("show", "show", RSS_URL, RSS_URL, None)
+
+    feed = asyncio.run(_download_feed(http, podcast, feed_cache, None))
+    assert feed.rss_parser is CANDIDATES["title-number"]
+    assert feed_cache.detected_parser(RSS_URL) == "title-number"
+
+    # Kept when the feed is stored again
+    with feed_cache.storing(RSS_URL, {}) as fp:
+        fp.write(body)
+    assert feed_cache.detected_parser(RSS_URL) == "title-number"
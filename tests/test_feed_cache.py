@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+
+from podcast_dl.feed_cache import FeedCache
+from podcast_dl.podcast_dl import FeedNotModified, download_feed, load_cached_feed
+from podcast_dl.rss_parsers import BaseItem
+
+RSS_URL = "https://example.com/feed"
+RSS_BODY = b"""<rss><channel><item>
+  <title>First</title>
+  <enclosure url="https://example.com/first.mp3" length="1234" type="audio/mpeg"/>
+</item></channel></rss>"""
+
+
+@pytest.fixture
+def feed_cache(tmp_path):
+    return FeedCache(tmp_path)
+
+
+def _store(feed_cache, headers):
+    with feed_cache.storing(RSS_URL, headers) as fp:
+        fp.write(RSS_BODY)
+
+
+def _make_http(requests):
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=RSS_BODY, headers={"ETag": '"v1"'})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_no_conditional_headers_without_cached_feed(feed_cache):
+    assert feed_cache.conditional_headers(RSS_URL) == {}
+
+
+def test_conditional_headers_of_cached_feed(feed_cache):
+    headers = {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    _store(feed_cache, headers)
+    assert feed_cache.conditional_headers(RSS_URL) == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert b"".join(feed_cache.iter_chunks(RSS_URL)) == RSS_BODY
+
+
+def test_synced_is_what_the_sync_covered(feed_cache):
+    synced = {"download_dir": "/podcasts/a", "check_size": False}
+    _store(feed_cache, {"ETag": '"v1"'})
+    assert not feed_cache.is_synced(RSS_URL, synced)
+
+    feed_cache.mark_synced(RSS_URL, synced)
+    assert feed_cache.is_synced(RSS_URL, synced)
+    assert not feed_cache.is_synced(RSS_URL, {**synced, "download_dir": "/b"})
+
+    # A new version of the feed has not been synced yet
+    _store(feed_cache, {"ETag": '"v2"'})
+    assert not feed_cache.is_synced(RSS_URL, synced)
+
+
+def test_download_feed_not_modified(feed_cache):
+    requests = []
+    http = _make_http(requests)
+
+    (item,) = asyncio.run(download_feed(http, RSS_URL, BaseItem, feed_cache)).items
+    assert item.filename == "First.mp3"
+    assert "If-None-Match" not in requests[0].headers
+
+    with pytest.raises(FeedNotModified):
+        asyncio.run(download_feed(http, RSS_URL, BaseItem, feed_cache))
+    assert requests[1].headers["If-None-Match"] == '"v1"'
+
+    (cached_item,) = load_cached_feed(feed_cache, RSS_URL, BaseItem).items
+    assert cached_item.filename == "First.mp3"
@@ -0,0 +1,100 @@
+import io
+import json
+import asyncio
+
+import httpx
+import pytest
+
+from podcast_dl import metrics
+from podcast_dl.mockserver import MockServer, ServerConfig
+from podcast_dl.podcast_dl import download_feed
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def jsonl_file():
+    return io.StringIO()
+
+
+@pytest.fixture
+def recorder(clock, jsonl_file):
+    recorder = metrics.Recorder(jsonl_file, clock=clock)
+    metrics.enable(recorder)
+    yield recorder
+    metrics.disable()
+
+
+def _lines(jsonl_file):
+    return [json.loads(line) for line in jsonl_file.getvalue().splitlines()]
+
+
+def test_spans_are_written_as_json_lines(recorder, clock, jsonl_file):
+    with metrics.span("find_missing", podcast="talkpython") as span:
+        clock.now += 1.5
+        span.set(missing=3)
+
+    (line,) = _lines(jsonl_file)
+    assert line["span"] == "find_missing"
+    assert line["duration"] == 1.5
+    assert line["podcast"] == "talkpython"
+    assert line["missing"] == 3
+
+
+def test_failed_span_is_recorded(recorder, jsonl_file):
+    with pytest.raises(ValueError):
+        with metrics.span("download_rss"):
+            raise ValueError
+
+    (line,) = _lines(jsonl_file)
+    assert line["error"] == "ValueError"
+
+
+def test_prometheus_text(recorder, clock):
+    for duration in (1.0, 2.0):
+        with metrics.span("download_episode", host="example.com"):
+            clock.now += duration
+    metrics.count("downloaded_bytes", 100, host="example.com")
+    metrics.count("downloaded_bytes", 50, host="example.com")
+
+    assert recorder.prometheus_text() == (
+        "# TYPE podcast_dl_span_seconds summary\n"
+        'podcast_dl_span_seconds_sum{span="download_episode",host="example.com"} 3.0\n'
+        'podcast_dl_span_seconds_count{span="download_episode",host="example.com"} 2\n'
+        "# TYPE podcast_dl_downloaded_bytes_total counter\n"
+        'podcast_dl_downloaded_bytes_total{host="example.com"} 150\n'
+    )
+
+
+def test_disabled_metrics_do_nothing():
+    with metrics.span("find_missing") as span:
+        span.set(missing=1)
+    metrics.count("downloaded_bytes", 1)
+
+
+def test_connection_timings_are_recorded(recorder, jsonl_file):
+    async def download():
+        async with MockServer(ServerConfig(episodes=1)) as server:
+            podcast = server.podcasts()[0]
+            hooks = metrics.http_event_hooks()
+            async with httpx.AsyncClient(event_hooks=hooks) as http:
+                await download_feed(http, podcast.rss, podcast.rss_parser)
+
+    asyncio.run(download())
+
+    spans = {line["span"]: line for line in _lines(jsonl_file)}
+    assert "http_connect_tcp" in spans
+    assert "http_receive_response_headers" in spans
+    assert spans["download_rss"]["items"] == 1
+    assert "podcast_dl_http_responses_total" in recorder.prometheus_text()
@@ -0,0 +1,186 @@
+import json
+import asyncio
+import functools
+
+import httpx
+import pytest
+
+from podcast_dl.mockserver import (
+    MockServer,
+    ServerConfig,
+    episode_content,
+    episode_etag,
+    subprocess_server,
+)
+from podcast_dl.podcast_dl import (
+    DownloadSettings,
+    download_episodes,
+    download_feed,
+    make_episodes,
+)
+from podcast_dl.progress import NoProgress
+from podcast_dl.retry import CircuitBreaker, RetryPolicy, with_retries
+
+EPISODE_SIZE = 300_000
+
+
+@pytest.fixture
+def sync_podcast(noprint):
+    def sync_podcast(download_dir, config, name="talkpython", prepare=None, **kwargs):
+        """Download every episode of the podcast from a mock server."""
+
+        async def sync():
+            async with MockServer(config) as server:
+                podcast = next(p for p in server.podcasts() if p.name == name)
+                async with httpx.AsyncClient() as http:
+                    feed = await with_retries(
+                        functools.partial(
+                            download_feed, http, podcast.rss, podcast.rss_parser
+                        ),
+                        RetryPolicy(attempts=10, backoff=0),
+                        CircuitBreaker(0),
+                        "localhost",
+                        noprint,
+                        "Downloading the feed",
+                    )
+                    download_dir.mkdir(exist_ok=True)
+                    episodes = list(make_episodes(download_dir, feed.items))
+                    if prepare is not None:
+                        prepare(episodes)
+                    failed = await download_episodes(
+                        http, episodes, 4, noprint, NoProgress(), **kwargs
+                    )
+                return episodes, failed, server.requests
+
+        return asyncio.run(sync())
+
+    return sync_podcast
+
+
+def test_download_every_podcast(tmp_path, sync_podcast):
+    config = ServerConfig(episodes=2, episode_size=EPISODE_SIZE)
+    for name in ("talkpython", "changelog", "indiehackers", "corecursive"):
+        episodes, failed, _ = sync_podcast(tmp_path / name, config, name)
+
+        assert not failed
+        for number, episode in enumerate(episodes, 1):
+            content = episode_content(name, number, EPISODE_SIZE)
+            assert episode.full_path.read_bytes() == content
+
+
+def test_segmented_download(tmp_path, monkeypatch, sync_podcast):
+    monkeypatch.setattr("podcast_dl.podcast_dl.MIN_SEGMENT_SIZE", 50_000)
+    config = ServerConfig(episodes=1, episode_size=EPISODE_SIZE)
+
+    (episode,), failed, requests = sync_podcast(
+        tmp_path, config, settings=DownloadSettings(segments=3)
+    )
+
+    assert not failed
+    # the feed, the episode and 2 more segments
+    assert requests == 4
+    assert episode.full_path.read_bytes() == episode_content(
+        "talkpython", 1, EPISODE_SIZE
+    )
+
+
+def test_resume_download(tmp_path, sync_podcast):
+    config = ServerConfig(episodes=1, episode_size=EPISODE_SIZE)
+    content = episode_content("talkpython", 1, EPISODE_SIZE)
+
+    def write_partial(episodes):
+        (episode,) = episodes
+        episode.partial_path.write_bytes(content[:1000])
+        etag = episode_etag("talkpython", 1, EPISODE_SIZE)
+        episode.resume_path.write_text(json.dumps({"url": episode.url, "etag": etag}))
+
+    (episode,), failed, _ = sync_podcast(tmp_path, config, prepare=write_partial)
+
+    assert not failed
+    assert episode.full_path.read_bytes() == content
+
+
+def test_failed_requests_are_retried(tmp_path, sync_podcast):
+    config = ServerConfig(episodes=4, episode_size=EPISODE_SIZE, error_rate=0.3, seed=1)
+
+    episodes, failed, requests = sync_podcast(
+        tmp_path,
+        config,
+        retry_policy=RetryPolicy(attempts=10, backoff=0),
+        circuit_breaker=CircuitBreaker(0),
+    )
+
+    assert not failed
+    assert requests > len(episodes) + 1
+    assert all(episode.full_path.exists() for episode in episodes)
+
+
+def test_truncated_episodes_are_not_committed(tmp_path, sync_podcast):
+    config = ServerConfig(episodes=2, episode_size=EPISODE_SIZE, truncate_rate=1.0)
+
+    episodes, failed, _ = sync_podcast(
+        tmp_path, config, retry_policy=RetryPolicy(attempts=2, backoff=0)
+    )
+
+    assert set(failed) == set(episodes)
+    assert not any(episode.full_path.exists() for episode in episodes)
+
+
+def test_failed_segments_are_retried(tmp_path, monkeypatch, sync_podcast):
+    monkeypatch.setattr("podcast_dl.podcast_dl.MIN_SEGMENT_SIZE", 50_000)
+    # Two episodes, so there are free connections for the segments
+    config = ServerConfig(
+        episodes=2, episode_size=EPISODE_SIZE, error_rate=0.2, truncate_rate=0.1, seed=3
+    )
+
+    episodes, failed, _ = sync_podcast(
+        tmp_path,
+        config,
+        settings=DownloadSettings(segments=4),
+        retry_policy=RetryPolicy(attempts=20, backoff=0),
+        circuit_breaker=CircuitBreaker(0),
+    )
+
+    assert not failed
+    for number, episode in enumerate(episodes, 1):
+        content = episode_content("talkpython", number, EPISODE_SIZE)
+        assert episode.full_path.read_bytes() == content
+
+
+def test_failed_segments_dont_stop_the_other_episodes(
+    tmp_path, monkeypatch, sync_podcast
+):
+    monkeypatch.setattr("podcast_dl.podcast_dl.MIN_SEGMENT_SIZE", 50_000)
+    # A range request of the first episode fails with this seed
+    config = ServerConfig(episodes=2, episode_size=EPISODE_SIZE, error_rate=0.2, seed=1)
+
+    episodes, failed, _ = sync_podcast(
+        tmp_path,
+        config,
+        settings=DownloadSettings(segments=4),
+        retry_policy=RetryPolicy(attempts=1),
+        circuit_breaker=CircuitBreaker(0),
+    )
+
+    first, second = episodes
+    assert list(failed) == [first]
+    assert "Range request failed" in str(failed[first])
+    assert not first.full_path.exists()
+    assert not first.partial_path.exists()
+    assert second.full_path.exists()
+
+
+def test_subprocess_server_outside_the_repository(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("PYTHONPATH", raising=False)
+
+    with subprocess_server(ServerConfig(episodes=1, episode_size=1000)) as url:
+        response = httpx.get(f"{url}/feeds/talkpython.xml")
+
+    assert response.status_code == 200
+
+
+def test_subprocess_server_which_doesnt_start():
+    with pytest.raises(RuntimeError, match="The mock server didn't start"):
+        with subprocess_server(ServerConfig(episodes=0)):
+            pass
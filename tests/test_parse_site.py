@@ -1,3 +1,4 @@
+from podcast_dl.podcasts import Podcast
 from podcast_dl.site_parser import parse_site, InvalidSite
 import pytest
 
@@ -31,3 +32,27 @@ def test_parse_site_episode_url_still_returns_site_name():
 def test_invalid_sites():
     with pytest.raises(InvalidSite):
         parse_site("not_supported")
+
+
+def test_any_rss_feed_url():
+    podcast = parse_site("https://www.example.com/show/feed.xml")
+    assert podcast.name == "example-com-show-feed-xml"
+    assert podcast.rss == "https://www.example.com/show/feed.xml"
+    assert podcast.rss_parser is None
+
+
+def test_other_feed_on_the_site_of_a_podcast():
+    podcast = parse_site("https://changelog.com/gotime/feed")
+    assert podcast.name == "changelog-com-gotime-feed"
+    assert podcast.rss_parser is None
+
+
+def test_podcast_by_rss_url_on_other_domain():
+    mirror = Podcast(
+        name="talkpython",
+        title="Talk Python To Me, mirrored",
+        url="https://talkpython.fm",
+        rss="https://mirror.example.com/talkpython.xml",
+        rss_parser=None,
+    )
+    assert parse_site(mirror.rss, {"talkpython": mirror}) is mirror
@@ -0,0 +1,327 @@
+import json
+import asyncio
+import hashlib
+from pathlib import Path
+
+import httpx
+
+import pytest
+from lxml import etree
+
+from podcast_dl import podcast_dl
+from podcast_dl.podcast_dl import (
+    ConnectionBudget,
+    DownloadSettings,
+    Episode,
+    RssItemParser,
+    VerificationError,
+    download_episodes,
+    find_missing,
+    get_all_rss_items,
+    make_episodes,
+    sort_episodes,
+)
+from podcast_dl.progress import NoProgress
+from podcast_dl.rss_parsers import BaseItem, TalkPythonItem
+from podcast_dl.state import StateDB
+
+XML_DIR = Path(__file__).parent.parent / "xml"
+
+
+@pytest.mark.parametrize(
+    "xml_name, rss_parser",
+    (
+        ("talkpython.xml", TalkPythonItem),
+        ("pythonbytes.xml", TalkPythonItem),
+        ("podcastinit.xml", BaseItem),
+    ),
+)
+def test_streamed_items_are_the_same_as_parsed(xml_name, rss_parser):
+    content = (XML_DIR / xml_name).read_bytes()
+    expected = get_all_rss_items(etree.XML(content), rss_parser)
+
+    parser = RssItemParser(rss_parser)
+    for start in range(0, len(content), 1000):
+        parser.feed(content[start : start + 1000])
+    streamed = parser.close()
+
+    assert [i.filename for i in streamed] == [i.filename for i in expected]
+    assert [i.url for i in streamed] == [i.url for i in expected]
+
+
+@pytest.fixture
+def rss_items(make_item):
+    return [make_item("first", 3), make_item("second", 3), make_item("third", 0)]
+
+
+def test_find_missing(tmp_path, rss_items, noprint):
+    (tmp_path / "first.mp3").write_bytes(b"123")
+    (tmp_path / "third.mp3").write_bytes(b"123")
+
+    missing = find_missing(make_episodes(tmp_path, rss_items), noprint)
+
+    assert [ep.filename for ep in missing] == ["second.mp3"]
+
+
+def test_find_missing_check_size(tmp_path, rss_items, noprint):
+    (tmp_path / "first.mp3").write_bytes(b"12")
+    (tmp_path / "second.mp3").write_bytes(b"123")
+    # unknown size in the feed
+    (tmp_path / "third.mp3").write_bytes(b"1")
+
+    missing = find_missing(make_episodes(tmp_path, rss_items), noprint, True)
+
+    assert [ep.filename for ep in missing] == ["first.mp3"]
+
+
+EPISODE_CONTENT = b"0123456789" * 100
+
+
+def _episode_server(requests, etag='"v1"'):
+    def handler(request):
+        requests.append(request)
+        range_header = request.headers.get("Range")
+        if range_header and request.headers.get("If-Range") == etag:
+            start, _, end = range_header.removeprefix("bytes=").partition("-")
+            start = int(start)
+            end = int(end) if end else len(EPISODE_CONTENT) - 1
+            return httpx.Response(
+                206,
+                content=EPISODE_CONTENT[start : end + 1],
+                headers={
+                    "ETag": etag,
+                    "Content-Range": f"bytes {start}-{end}/{len(EPISODE_CONTENT)}",
+                },
+            )
+        headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+        return httpx.Response(200, content=EPISODE_CONTENT, headers=headers)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture
+def download(noprint):
+    def download(episode, http):
+        asyncio.run(episode.download(http, noprint))
+
+    return download
+
+
+def test_download_resumes_partial_file(tmp_path, make_item, download):
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path)
+    episode.partial_path.write_bytes(EPISODE_CONTENT[:300])
+    episode.resume_path.write_text(json.dumps({"url": episode.url, "etag": '"v1"'}))
+    requests = []
+
+    download(episode, _episode_server(requests))
+
+    assert requests[0].headers["Range"] == "bytes=300-"
+    assert episode.full_path.read_bytes() == EPISODE_CONTENT
+    assert not episode.partial_path.exists()
+    assert not episode.resume_path.exists()
+
+
+def test_download_restarts_when_file_changed(tmp_path, make_item, download):
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path)
+    episode.partial_path.write_bytes(b"old content")
+    episode.resume_path.write_text(json.dumps({"url": episode.url, "etag": '"v0"'}))
+    requests = []
+
+    download(episode, _episode_server(requests))
+
+    assert requests[0].headers["If-Range"] == '"v0"'
+    assert episode.full_path.read_bytes() == EPISODE_CONTENT
+
+
+def test_download_restarts_on_range_error(tmp_path, make_item, download):
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path)
+    episode.partial_path.write_bytes(EPISODE_CONTENT + b"more")
+    episode.resume_path.write_text(json.dumps({"url": episode.url, "etag": '"v1"'}))
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if "Range" in request.headers:
+            return httpx.Response(416)
+        return httpx.Response(200, content=EPISODE_CONTENT)
+
+    download(episode, httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    assert len(requests) == 2
+    assert episode.full_path.read_bytes() == EPISODE_CONTENT
+
+
+def test_range_error_without_range_request(tmp_path, make_item, download):
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(416)
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.HTTPStatusError):
+        download(episode, http)
+
+    assert len(requests) == 1
+
+
+def test_segmented_download(tmp_path, monkeypatch, noprint, make_item):
+    monkeypatch.setattr(podcast_dl, "MIN_SEGMENT_SIZE", 100)
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path)
+    requests = []
+
+    async def download():
+        connections = ConnectionBudget(3)
+        async with connections.connection(episode.host):
+            http = _episode_server(requests)
+            await episode.download(
+                http, noprint, connections, DownloadSettings(segments=4)
+            )
+        # every extra connection is given back
+        assert await connections.try_acquire(episode.host, 10) == 3
+
+    asyncio.run(download())
+
+    assert sorted(r.headers.get("Range", "") for r in requests) == [
+        "",
+        "bytes=334-667",
+        "bytes=668-999",
+    ]
+    assert episode.full_path.read_bytes() == EPISODE_CONTENT
+
+
+def test_connection_budget_per_host():
+    async def acquire():
+        connections = ConnectionBudget(4, per_host=2)
+        async with connections.connection("a.com"):
+            assert await connections.try_acquire("a.com", 3) == 1
+            assert await connections.try_acquire("b.com", 3) == 2
+            connections.release("a.com")
+            connections.release("b.com", 2)
+            assert await connections.try_acquire("b.com", 5) == 2
+
+    asyncio.run(acquire())
+
+
+def test_sort_episodes(tmp_path, make_item):
+    first = make_item("first", 30)
+    second = make_item("second", 10)
+    third = make_item("third", 0)
+    episodes = list(make_episodes(tmp_path, [first, second, third]))
+
+    def filenames(order):
+        return [ep.filename for ep in sort_episodes(episodes, order)]
+
+    assert filenames("filename") == ["first.mp3", "second.mp3", "third.mp3"]
+    assert filenames("smallest") == ["second.mp3", "first.mp3", "third.mp3"]
+
+
+def test_download_episodes_with_worker_pool(tmp_path, noprint, make_item):
+    items = [make_item(f"episode{n}", len(EPISODE_CONTENT)) for n in range(5)]
+    episodes = list(make_episodes(tmp_path, items))
+    requests = []
+
+    http = _episode_server(requests)
+    failed = asyncio.run(download_episodes(http, episodes, 2, noprint, NoProgress()))
+
+    assert failed == {}
+    assert len(requests) == 5
+    assert all(ep.full_path.read_bytes() == EPISODE_CONTENT for ep in episodes)
+
+
+def test_find_missing_renames_episode_with_same_number(tmp_path, noprint):
+    talkpython_item = TalkPythonItem(
+        etree.XML(
+            """
+            <item>
+              <title>#12 New title</title>
+              <enclosure url="https://example.com/12.mp3" length="3"/>
+            </item>
+            """
+        )
+    )
+    (tmp_path / "0012-Old-title.mp3").write_bytes(b"123")
+    (tmp_path / "0013-Other-episode.mp3").write_bytes(b"123")
+
+    missing = find_missing(make_episodes(tmp_path, [talkpython_item]), noprint)
+
+    assert missing == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "0012-New-title.mp3",
+        "0013-Other-episode.mp3",
+    ]
+
+
+def test_find_missing_doesnt_rename_episode_of_other_size(tmp_path, noprint):
+    # Feeds starting the numbering again every season
+    season_2_item = TalkPythonItem(
+        etree.XML(
+            """
+            <item>
+              <title>#1 Season 2 Pilot</title>
+              <enclosure url="https://example.com/s2/1.mp3" length="5000"/>
+            </item>
+            """
+        )
+    )
+    (tmp_path / "0001-Season-1-Pilot.mp3").write_bytes(b"0123456789")
+
+    (missing,) = find_missing(make_episodes(tmp_path, [season_2_item]), noprint)
+
+    assert missing.filename == "0001-Season-2-Pilot.mp3"
+    assert (tmp_path / "0001-Season-1-Pilot.mp3").exists()
+
+
+def test_truncated_download_is_not_committed(tmp_path, make_item, download):
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path)
+
+    def handler(request):
+        headers = {"Content-Length": str(len(EPISODE_CONTENT))}
+        return httpx.Response(200, content=EPISODE_CONTENT[:500], headers=headers)
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with pytest.raises(VerificationError):
+        download(episode, http)
+
+    assert not episode.full_path.exists()
+    assert not episode.partial_path.exists()
+
+
+def test_download_is_hashed_while_writing(tmp_path, make_item, download):
+    state = StateDB(tmp_path / "state.sqlite").podcast("podcast")
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path, state)
+    episode.partial_path.write_bytes(EPISODE_CONTENT[:300])
+    episode.resume_path.write_text(json.dumps({"url": episode.url, "etag": '"v1"'}))
+
+    download(episode, _episode_server([]))
+
+    expected_hash = hashlib.sha256(EPISODE_CONTENT).hexdigest()
+    assert state.get(episode.key) == ("first.mp3", len(EPISODE_CONTENT), expected_hash)
+
+
+def test_download_is_not_hashed_without_state_db(
+    tmp_path, monkeypatch, make_item, download
+):
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path)
+    episode.partial_path.write_bytes(EPISODE_CONTENT[:300])
+    episode.resume_path.write_text(json.dumps({"url": episode.url, "etag": '"v1"'}))
+    monkeypatch.setattr(hashlib, "sha256", None)
+
+    download(episode, _episode_server([]))
+
+    assert episode.full_path.read_bytes() == EPISODE_CONTENT
+
+
+def test_preallocated_download_is_not_resumed(tmp_path, noprint, make_item):
+    episode = Episode(make_item("first", len(EPISODE_CONTENT)), tmp_path)
+    episode.partial_path.write_bytes(EPISODE_CONTENT[:300])
+    episode.resume_path.write_text(json.dumps({"url": episode.url, "etag": '"v1"'}))
+    requests = []
+    settings = DownloadSettings(write_buffer_size=64, preallocate=True)
+
+    asyncio.run(episode.download(_episode_server(requests), noprint, None, settings))
+
+    assert "Range" not in requests[0].headers
+    assert episode.full_path.read_bytes() == EPISODE_CONTENT
+    assert not episode.resume_path.exists()
@@ -0,0 +1,116 @@
+import io
+import json
+import asyncio
+
+import httpx
+
+from podcast_dl.mockserver import MockServer, ServerConfig
+from podcast_dl.podcast_dl import download_episodes, download_feed, make_episodes
+from podcast_dl.progress import JsonRenderer, Progress, TerminalRenderer
+
+EPISODE_SIZE = 300_000
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeEpisode:
+    def __init__(self, filename, size):
+        self.filename = filename
+        self.size = size
+
+
+def test_throughput_and_eta():
+    clock = FakeClock()
+    episodes = [FakeEpisode("1.mp3", 1000), FakeEpisode("2.mp3", 3000)]
+    progress = Progress(episodes, [], clock=clock)
+    first = progress.track(episodes[0])
+    progress.update()
+
+    first.advance(500)
+    clock.now += 1
+    progress.update()
+
+    assert progress.bytes_done == 500
+    assert progress.bytes_total == 4000
+    assert first.rate == progress.rate > 0
+    assert progress.eta == 3500 / progress.rate
+
+
+def test_sizes_are_corrected_by_the_responses():
+    episodes = [FakeEpisode("1.mp3", 1000), FakeEpisode("2.mp3", None)]
+    progress = Progress(episodes, [], clock=FakeClock())
+    first = progress.track(episodes[0])
+    second = progress.track(episodes[1])
+
+    first.start(1200)
+    second.start(2000, done=500)
+    progress.update()
+    assert progress.bytes_total == 3200
+    assert progress.bytes_done == 500
+
+    # retries start over
+    second.start(2000)
+    second.advance(2000)
+    progress.finish(second)
+    progress.finish(first, failed=True)
+    assert progress.bytes_total == 2000
+    assert progress.bytes_done == 2000
+    assert progress.episodes_done == 2
+    assert progress.episodes_failed == 1
+
+
+def test_episodes_with_the_same_filename():
+    # Of different podcasts
+    episodes = [FakeEpisode("1.mp3", 1000), FakeEpisode("1.mp3", 3000)]
+    progress = Progress(episodes, [], clock=FakeClock())
+    assert progress.bytes_total == 4000
+
+    first = progress.track(episodes[0])
+    first.start(1200)
+    progress.update()
+    progress.finish(progress.track(episodes[1]), failed=True)
+
+    assert progress.bytes_total == 1200
+
+
+def test_terminal_renderer_writes_only_the_total_when_not_a_terminal():
+    output = io.StringIO()
+    episodes = [FakeEpisode("1.mp3", 2 * 1024**2)]
+    progress = Progress(episodes, [TerminalRenderer(output)], clock=FakeClock())
+    progress.track(episodes[0]).advance(1024**2)
+
+    progress.render()
+
+    assert output.getvalue() == (
+        "[0/1 episodes] 1.0 MB / 2.0 MB (50%) 0.0 MB/s ETA --:--:--\n"
+    )
+
+
+def test_json_progress_of_downloads(tmp_path, noprint):
+    output = io.StringIO()
+
+    async def sync():
+        config = ServerConfig(episodes=3, episode_size=EPISODE_SIZE)
+        async with MockServer(config) as server:
+            podcast = server.podcasts()[0]
+            async with httpx.AsyncClient() as http:
+                feed = await download_feed(http, podcast.rss, podcast.rss_parser)
+                episodes = list(make_episodes(tmp_path, feed.items))
+                progress = Progress(episodes, [JsonRenderer(output)], interval=0.01)
+                return await download_episodes(http, episodes, 2, noprint, progress)
+
+    failed = asyncio.run(sync())
+
+    assert not failed
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert lines[0]["bytes_done"] == 0
+    last = lines[-1]
+    assert last["episodes_done"] == last["episodes_total"] == 3
+    assert last["bytes_done"] == last["bytes_total"] == 3 * EPISODE_SIZE
+    assert last["files"] == []
@@ -0,0 +1,58 @@
+import asyncio
+import datetime
+
+import pytest
+
+from podcast_dl import ratelimit
+from podcast_dl.ratelimit import RateLimiter, TokenBucket, parse_rate, parse_schedule
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    (
+        ("100", 100),
+        ("500K", 500 * 1024),
+        ("500k", 500 * 1024),
+        ("1.5M", 1536 * 1024),
+        ("2MB", 2 * 1024 * 1024),
+        ("0", 0),
+    ),
+)
+def test_parse_rate(value, expected):
+    assert parse_rate(value) == expected
+
+
+def test_parse_invalid_rate():
+    with pytest.raises(ValueError):
+        parse_rate("fast")
+
+
+def test_schedule():
+    limiter = RateLimiter(
+        1000, schedule=parse_schedule("09:00-17:00=500,22:00-06:00=0")
+    )
+    assert limiter.current_rate(datetime.time(8, 59)) == 1000
+    assert limiter.current_rate(datetime.time(9, 0)) == 500
+    assert limiter.current_rate(datetime.time(17, 0)) == 1000
+    assert limiter.current_rate(datetime.time(23, 0)) == 0
+    assert limiter.current_rate(datetime.time(5, 0)) == 0
+
+
+def test_token_bucket(monkeypatch):
+    now = 0.0
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        nonlocal now
+        sleeps.append(seconds)
+        now += seconds
+
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", fake_sleep)
+
+    async def consume():
+        bucket = TokenBucket(clock=lambda: now)
+        await bucket.consume(500, 1000)
+        await bucket.consume(1000, 1000)
+
+    asyncio.run(consume())
+    assert sleeps == [0.5, 1.0]
@@ -0,0 +1,139 @@
+import pytest
+from click.testing import CliRunner
+from lxml import etree
+
+from podcast_dl import cli, rss_parsers as rssp
+from podcast_dl.registry import InvalidRegistry, load_podcasts, load_registry
+
+ITUNES_XMLNS = 'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"'
+
+REGISTRY = r"""
+[podcasts.pybytes]
+title = "Python Bytes"
+url = "https://pythonbytes.fm/"
+rss = "https://pythonbytes.fm/episodes/rss"
+title_regex = '^#\S+ (.*)$'
+episode_regex = '^#([0-9]+)'
+file_ext_regex = '(\.\w+)(?:\?|$)'
+
+[podcasts.talkpython]
+title = "Talk Python To Me, mirrored"
+rss = "https://mirror.example.com/talkpython.xml"
+parser = "talkpython"
+
+[podcasts.storytime]
+rss = "https://storytime.example.com/feed"
+title_xpath = "itunes:title"
+episode_xpath = "link"
+episode_regex = '/episode-([0-9]+)$'
+"""
+
+
+def _item(body):
+    return etree.XML(f"<item {ITUNES_XMLNS}>{body}</item>")
+
+
+@pytest.fixture
+def registry_path(tmp_path):
+    path = tmp_path / "podcasts.toml"
+    path.write_text(REGISTRY)
+    return path
+
+
+def test_rules_are_compiled_into_parsers(registry_path):
+    podcasts = {podcast.name: podcast for podcast in load_registry(registry_path)}
+
+    pybytes = podcasts["pybytes"]
+    assert pybytes.rss_parser.__name__ == "PybytesItem"
+    assert issubclass(pybytes.rss_parser, rssp.BaseItem)
+    item = pybytes.rss_parser(
+        _item(
+            "<title>#95 Unleash the py-spy!</title>"
+            '<enclosure url="https://x.example.com/95.mp3?s=1" length="10" />'
+        )
+    )
+    assert item.episode == "0095"
+    assert item.title == "Unleash the py-spy!"
+    assert item.filename == "0095-Unleash-the-py-spy.mp3"
+
+    # Without rules, the built-in parser is used
+    assert podcasts["talkpython"].rss_parser is rssp.TalkPythonItem
+
+    storytime = podcasts["storytime"]
+    assert storytime.title == "storytime"
+    assert storytime.url == storytime.rss
+    item = storytime.rss_parser(
+        _item(
+            "<title>Ignored</title><itunes:title>The Story</itunes:title>"
+            "<link>https://storytime.example.com/episode-7</link>"
+            '<enclosure url="https://storytime.example.com/7.m4a" length="10" />'
+        )
+    )
+    assert item.filename == "0007-The-Story.m4a"
+
+
+def test_rules_fall_back_to_the_base_parser(registry_path):
+    (pybytes,) = [p for p in load_registry(registry_path) if p.name == "pybytes"]
+    item = pybytes.rss_parser(
+        _item(
+            "<title>Bonus</title><itunes:episode>12</itunes:episode>"
+            '<enclosure url="https://x.example.com/bonus.mp3" length="10" />'
+        )
+    )
+    assert item.filename == "0012-Bonus.mp3"
+
+
+def test_registry_podcasts_replace_built_in_ones(registry_path):
+    podcasts = {podcast.name: podcast for podcast in load_podcasts(registry_path)}
+    assert podcasts["talkpython"].rss == "https://mirror.example.com/talkpython.xml"
+    assert "changelog" in podcasts
+    assert "pybytes" in podcasts
+
+
+@pytest.mark.parametrize(
+    "content,message",
+    (
+        ("[podcasts", "Expected ']'"),
+        ('[podcasts.x]\ntitle = "X"', "rss is missing"),
+        ('[podcasts.x]\nrss = "u"\nepisode = "1"', "unknown fields: episode"),
+        ('[podcasts.x]\nrss = "u"\nparser = "nope"', "unknown parser nope"),
+        ('[podcasts.x]\nrss = "u"\ntitle_regex = "("', "not a valid regular"),
+        ("[podcasts.x]\nrss = 1", "rss should be a string"),
+        ('[podcasts.x]\nrss = "u"\ntitle_xpath = "title["', "not a valid XPath"),
+        ('[podcasts.x]\nrss = "u"\nepisode_xpath = "//"', "not a valid XPath"),
+    ),
+)
+def test_invalid_registry(tmp_path, content, message):
+    path = tmp_path / "podcasts.toml"
+    path.write_text(content)
+    with pytest.raises(InvalidRegistry, match=message):
+        load_registry(path)
+
+
+@pytest.mark.parametrize("list_first", (True, False))
+def test_list_podcasts_with_registry(registry_path, list_first):
+    args = ["--registry", str(registry_path)]
+    args = ["-l", *args] if list_first else [*args, "-l"]
+    result = CliRunner().invoke(cli.main, args)
+    assert result.exit_code == 0
+    assert "pybytes" in result.output
+    assert "Talk Python To Me, mirrored" in result.output
+
+
+def test_missing_registry(tmp_path):
+    path = tmp_path / "missing.toml"
+    result = CliRunner().invoke(cli.main, ["--registry", str(path), "-l"])
+    assert result.exit_code == 2
+    assert "missing.toml" in result.output
+
+
+def test_invalid_xpath_fails_only_the_download(tmp_path):
+    path = tmp_path / "podcasts.toml"
+    path.write_text('[podcasts.x]\nrss = "u"\ntitle_xpath = "title["')
+
+    listed = CliRunner().invoke(cli.main, ["--registry", str(path), "-l"])
+    assert listed.exit_code == 0
+
+    result = CliRunner().invoke(cli.main, ["--registry", str(path), "x"])
+    assert result.exit_code == 2
+    assert "title_xpath is not a valid XPath" in result.output
@@ -0,0 +1,100 @@
+import asyncio
+
+import httpx
+import pytest
+
+from podcast_dl import retry
+from podcast_dl.podcast_dl import DownloadError, SizeMismatchError
+from podcast_dl.retry import CircuitBreaker, HostUnavailable, RetryPolicy, with_retries
+
+
+def _status_error(status_code, headers=None):
+    request = httpx.Request("GET", "https://example.com/")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(retry.asyncio, "sleep", fake_sleep)
+    return sleeps
+
+
+@pytest.fixture
+def run_with_retries(noprint):
+    def run_with_retries(errors, policy, breaker=None):
+        calls = []
+
+        async def func():
+            calls.append(None)
+            if errors:
+                raise errors.pop(0)
+            return "done"
+
+        breaker = breaker or CircuitBreaker()
+        coro = with_retries(func, policy, breaker, "example.com", noprint, "Test")
+        return asyncio.run(coro), len(calls)
+
+    return run_with_retries
+
+
+def test_retries_until_success(sleeps, run_with_retries):
+    errors = [httpx.ConnectError("reset"), DownloadError("incomplete")]
+    assert run_with_retries(errors, RetryPolicy(attempts=3)) == ("done", 3)
+    assert len(sleeps) == 2
+
+
+def test_gives_up_after_attempts(sleeps, run_with_retries):
+    errors = [_status_error(503) for _ in range(5)]
+    with pytest.raises(httpx.HTTPStatusError):
+        run_with_retries(errors, RetryPolicy(attempts=3))
+    assert len(errors) == 2
+
+
+def test_not_retryable_error(sleeps, run_with_retries):
+    errors = [_status_error(404)]
+    with pytest.raises(httpx.HTTPStatusError):
+        run_with_retries(errors, RetryPolicy(attempts=3))
+    assert sleeps == []
+
+
+def test_size_mismatch_is_not_retried(sleeps, run_with_retries):
+    errors = [SizeMismatchError("not the size in the feed")]
+    with pytest.raises(SizeMismatchError):
+        run_with_retries(errors, RetryPolicy(attempts=3))
+    assert sleeps == []
+
+
+def test_retry_after_is_honored(sleeps, run_with_retries):
+    errors = [_status_error(429, {"Retry-After": "7"})]
+    run_with_retries(errors, RetryPolicy(attempts=2, max_delay=60))
+    assert sleeps == [7]
+
+
+def test_backoff_is_exponential_with_jitter():
+    policy = RetryPolicy(backoff=1.0, max_delay=5.0)
+    for attempt, limit in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0), (10, 5.0)):
+        assert 0 <= policy.delay(attempt) <= limit
+
+
+def test_circuit_breaker():
+    now = 0.0
+    breaker = CircuitBreaker(max_failures=2, cooldown=10, clock=lambda: now)
+    breaker.failure("a.com")
+    breaker.check("a.com")
+    breaker.failure("a.com")
+    with pytest.raises(HostUnavailable):
+        breaker.check("a.com")
+    breaker.check("b.com")
+
+    now = 11.0
+    breaker.check("a.com")
+    # one more failure after the cooldown opens the circuit again
+    breaker.failure("a.com")
+    with pytest.raises(HostUnavailable):
+        breaker.check("a.com")
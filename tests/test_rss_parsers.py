@@ -1,11 +1,15 @@
+import random
+
 import pytest
 from lxml import etree
+from slugify import slugify
 
 from podcast_dl.rss_parsers import (
     BaseItem,
     ChangelogItem,
     IndieHackersItem,
     TalkPythonItem,
+    _slug,
 )
 
 ITUNES_XMLNS = 'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"'
@@ -128,3 +132,30 @@ def test_indiehackers(indiehackers_item):
         rss_item.filename
         == "0094-How-to-Build-a-Better-Funnier-Brand-for-Your-Business-with-Allie-LeFevere-of-Obedient.mp3"
     )
+
+
+# Pieces of titles which slugify treats specially
+SLUG_ASCII = [*"aZ09 -_',.#?!&;:/()\t\n\x00\x7f", "1,000", "''", "--", "&amp;"]
+SLUG_ALPHABET = [
+    *SLUG_ASCII,
+    "&eacute;",
+    "&#39;",
+    "&#x27;",
+    "&#1234567890;",
+    "é",
+    "–",
+    "ß",
+    "ﬁ",
+    "日本",
+    "😀",
+]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_slug_is_the_same_as_slugify(seed):
+    rng = random.Random(seed)
+    for _ in range(500):
+        # Mostly ASCII titles, which take the fast path
+        alphabet = SLUG_ASCII if rng.random() < 0.7 else SLUG_ALPHABET
+        title = "".join(rng.choices(alphabet, k=rng.randint(0, 30)))
+        assert _slug(title) == slugify(title, lowercase=False), repr(title)
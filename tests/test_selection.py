@@ -0,0 +1,102 @@
+import re
+import datetime
+
+import attrs
+import pytest
+
+from podcast_dl.selection import EpisodeParam, EpisodeSelection, FeedIndex
+
+
+@attrs.frozen
+class Item:
+    episode: str | None
+    title: str
+    published: datetime.datetime | None = None
+
+    @property
+    def filename(self):
+        return f"{self.episode or 'no-number'}-{self.title.replace(' ', '-')}.mp3"
+
+
+def _published(day):
+    return datetime.datetime(2024, 1, day, 12, tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+def items():
+    # In filename order, like the parsed feeds
+    return [
+        Item("0001", "First", _published(1)),
+        Item("0002", "Django and Flask", _published(8)),
+        Item("0003", "Packaging", _published(15)),
+        Item("0010", "Django 5", _published(22)),
+        Item("news-2024-01-29", "News", _published(29)),
+        Item(None, "Bonus episode"),
+    ]
+
+
+def _select(items, **selection):
+    selected, unknown = FeedIndex(items).select(EpisodeSelection(**selection))
+    return [item.title for item in selected], unknown
+
+
+def test_numbers_and_ranges(items):
+    assert _select(items, ranges=((2, 3), (10, 10))) == (
+        ["Django and Flask", "Packaging", "Django 5"],
+        [],
+    )
+    assert _select(items, ranges=((1, 9999),))[0] == [
+        "First",
+        "Django and Flask",
+        "Packaging",
+        "Django 5",
+    ]
+    assert _select(items, ranges=((4, 9), (11, 11))) == ([], ["0004-0009", "0011"])
+
+
+def test_names_match_episodes_filenames_and_titles(items):
+    names = tuple(
+        EpisodeParam(name)
+        for name in ("NEWS-2024-01-29", "0003-packaging.mp3", "bonus episode", "Nope")
+    )
+    assert _select(items, names=names) == (
+        ["Packaging", "News", "Bonus episode"],
+        ["Nope"],
+    )
+
+
+def test_last_n(items):
+    assert _select(items, last_n=2)[0] == ["News", "Bonus episode"]
+    assert _select(items, last_n=100)[0] == [item.title for item in items]
+
+
+def test_date_ranges(items):
+    january = datetime.date(2024, 1, 1)
+    first_week = ((january, datetime.date(2024, 1, 8)),)
+    assert _select(items, date_ranges=first_week)[0] == ["First", "Django and Flask"]
+    assert _select(items, date_ranges=((datetime.date(2024, 1, 20), None),))[0] == [
+        "Django 5",
+        "News",
+    ]
+
+
+def test_newest(items):
+    assert _select(items, newest=((2, None),))[0] == ["Django 5", "News"]
+    since = datetime.date(2024, 1, 28)
+    assert _select(items, newest=((2, since),))[0] == ["News"]
+
+
+def test_title_patterns(items):
+    pattern = re.compile("^django", re.IGNORECASE)
+    assert _select(items, title_patterns=(pattern,))[0] == [
+        "Django and Flask",
+        "Django 5",
+    ]
+
+
+def test_selectors_are_combined(items):
+    assert _select(items, ranges=((1, 1),), last_n=1, newest=((1, None),))[0] == [
+        "First",
+        "News",
+        "Bonus episode",
+    ]
@@ -0,0 +1,53 @@
+import sys
+import subprocess
+
+import pytest
+
+from podcast_dl import cli, podcast_dl
+
+# Modules which are slow to import and not needed for listing and the help
+HEAVY_MODULES = {"httpx", "lxml", "slugify", "asyncio", "sqlite3"}
+# Compared to importing click alone, so a slow or busy machine doesn't fail the test.
+# The startup imports take about 1.5 times as long, importing httpx too about 2.5.
+IMPORT_TIME_BUDGET = 2.5
+CLI_CODE = "from podcast_dl import cli; cli.main()"
+
+
+def _import_times(code, *args):
+    """Run the code with -X importtime and return the self import time in seconds
+    of every imported module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # Example: "import time:       158 |       8689 |             fnmatch"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(self_us) / 1_000_000
+    return times
+
+
+@pytest.mark.parametrize("args", [["--help"], ["--list-podcasts"]])
+def test_startup_doesnt_import_heavy_modules(args):
+    times = _import_times(CLI_CODE, *args)
+
+    imported = {name.split(".")[0] for name in times}
+    assert imported & HEAVY_MODULES == set()
+
+
+@pytest.mark.parametrize("args", [["--help"], ["--list-podcasts"]])
+def test_startup_time(args):
+    # The best of a few runs, the others can be slowed down by anything else
+    startup = min(sum(_import_times(CLI_CODE, *args).values()) for _ in range(3))
+    click = min(sum(_import_times("import click").values()) for _ in range(3))
+
+    assert startup < click * IMPORT_TIME_BUDGET
+
+
+def test_episode_orders_are_the_same():
+    assert cli.EPISODE_ORDERS == list(podcast_dl.EPISODE_ORDERS)
@@ -0,0 +1,59 @@
+from podcast_dl.podcast_dl import find_missing, make_episodes
+from podcast_dl.state import StateDB
+
+
+def test_state_is_persistent(tmp_path):
+    db = StateDB(tmp_path / "state.sqlite")
+    db.podcast("talkpython").record("guid-1", "https://a/1.mp3", "1.mp3", 3)
+    db.close()
+
+    state = StateDB(tmp_path / "state.sqlite").podcast("talkpython")
+    assert "guid-1" in state
+    assert state.get("guid-1") == ("1.mp3", 3, None)
+    assert "guid-1" not in StateDB(tmp_path / "state.sqlite").podcast("other")
+
+
+def test_find_missing_uses_state(tmp_path, noprint, make_item):
+    state = StateDB(tmp_path / "state.sqlite").podcast("podcast")
+    state.record("guid-1", "https://example.com/first.mp3", "first.mp3", 3)
+    # downloaded before the state database was used
+    (tmp_path / "second.mp3").write_bytes(b"123")
+    items = [
+        make_item("first", guid="guid-1"),
+        make_item("second", guid="guid-2"),
+        make_item("third", guid="guid-3"),
+    ]
+
+    missing = find_missing(make_episodes(tmp_path, items, state), noprint)
+
+    assert [ep.filename for ep in missing] == ["third.mp3"]
+    assert "guid-2" in state
+
+
+def test_renamed_episode_with_state(tmp_path, noprint, make_item):
+    state = StateDB(tmp_path / "state.sqlite").podcast("podcast")
+    state.record("guid-1", "https://example.com/old.mp3", "old-title.mp3", 3)
+    (tmp_path / "old-title.mp3").write_bytes(b"123")
+
+    missing = find_missing(
+        make_episodes(tmp_path, [make_item("new-title", guid="guid-1")], state), noprint
+    )
+
+    assert missing == []
+    assert (tmp_path / "new-title.mp3").read_bytes() == b"123"
+    assert not (tmp_path / "old-title.mp3").exists()
+    assert state.get("guid-1")[0] == "new-title.mp3"
+
+
+def test_check_size_of_recorded_episodes(tmp_path, noprint, make_item):
+    state = StateDB(tmp_path / "state.sqlite").podcast("podcast")
+    (tmp_path / "first.mp3").write_bytes(b"123")
+    items = [make_item("first", guid="guid-1", length=10)]
+
+    # Without check_size the file is not missing, but not recorded either
+    assert find_missing(make_episodes(tmp_path, items, state), noprint) == []
+    assert "guid-1" not in state
+
+    state.record("guid-1", "https://example.com/first.mp3", "first.mp3", 3)
+    (missing,) = find_missing(make_episodes(tmp_path, items, state), noprint, True)
+    assert missing.filename == "first.mp3"
@@ -0,0 +1,150 @@
+import json
+import asyncio
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+from podcast_dl import cli
+from podcast_dl.mockserver import MockServer, ServerConfig
+from podcast_dl.watch import FeedWatcher
+
+EPISODE_SIZE = 100_000
+
+
+@pytest.fixture
+def server():
+    """Mock server running in a thread, so the CLI can run its own event loop."""
+    loop = asyncio.new_event_loop()
+    server = MockServer(ServerConfig(episodes=3, episode_size=EPISODE_SIZE))
+    loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.fixture
+def run(server, tmp_path):
+    """Run the CLI with the podcasts of the mock server."""
+    registry = tmp_path / "podcasts.toml"
+    registry.write_text(
+        "".join(
+            f'[podcasts.{name}]\nrss = "{server.url}/feeds/{name}.xml"\n'
+            f'parser = "{name}"\n'
+            for name in ("talkpython", "changelog")
+        )
+        # Not on the server
+        + f'[podcasts.missing]\nrss = "{server.url}/feeds/missing.xml"\n'
+    )
+
+    def run(*args):
+        cache_dir = tmp_path / "cache"
+        args = ["--registry", registry, "--cache-dir", cache_dir, *map(str, args)]
+        return CliRunner().invoke(cli.main, list(map(str, args)))
+
+    return run
+
+
+def _mp3_files(directory):
+    return sorted(path.name for path in directory.glob("*.mp3"))
+
+
+def test_unchanged_feed_is_synced_again_to_another_directory(run, tmp_path):
+    first = run("-d", tmp_path / "a", "talkpython")
+    assert first.exit_code == 0, first.output
+    assert len(_mp3_files(tmp_path / "a")) == 3
+
+    unchanged = run("-d", tmp_path / "a", "talkpython")
+    assert "has not changed since the last sync" in unchanged.output
+
+    other_dir = run("-d", tmp_path / "b", "talkpython")
+    assert "has not changed" not in other_dir.output
+    assert _mp3_files(tmp_path / "b") == _mp3_files(tmp_path / "a")
+
+
+def test_deleted_episodes_are_downloaded_again(run, tmp_path):
+    run("-d", tmp_path / "a", "talkpython")
+    deleted = sorted((tmp_path / "a").glob("*.mp3"))[0]
+    deleted.unlink()
+
+    result = run("-d", tmp_path / "a", "talkpython")
+
+    assert "Found a total of 1 missing episodes." in result.output
+    assert deleted.exists()
+
+
+def test_check_size_and_selection_are_part_of_the_sync(run, tmp_path):
+    run("-d", tmp_path / "a", "-e", "1", "talkpython")
+    assert len(_mp3_files(tmp_path / "a")) == 1
+
+    result = run("-d", tmp_path / "a", "talkpython")
+    assert "has not changed" not in result.output
+    assert len(_mp3_files(tmp_path / "a")) == 3
+
+    result = run("-d", tmp_path / "a", "--check-size", "talkpython")
+    assert "has not changed" not in result.output
+    assert "Every episode of talkpython is downloaded." in result.output
+
+
+def test_exit_code_of_failed_feeds(run, tmp_path):
+    result = run("-d", tmp_path, "talkpython", "missing")
+
+    assert result.exit_code == 1
+    assert "Could not download the RSS feed of missing" in result.output
+    assert len(_mp3_files(tmp_path / "talkpython")) == 3
+
+
+def test_sync_many_podcasts(run, tmp_path):
+    first = run("-d", tmp_path, "talkpython", "changelog")
+
+    assert first.exit_code == 0, first.output
+    assert "Found a total of 6 missing episodes." in first.output
+    assert "talkpython: 3 episodes downloaded, 0 failed." in first.output
+    assert "changelog: 3 episodes downloaded, 0 failed." in first.output
+    assert len(_mp3_files(tmp_path / "talkpython")) == 3
+    assert len(_mp3_files(tmp_path / "changelog")) == 3
+
+    second = run("-d", tmp_path, "talkpython", "changelog")
+
+    assert second.exit_code == 0, second.output
+    for name in ("talkpython", "changelog"):
+        assert f"The RSS feed of {name} has not changed" in second.output
+    assert "missing episodes" not in second.output
+
+
+def test_watch_syncs_only_changed_feeds(run, tmp_path, monkeypatch):
+    polls = []
+
+    def due(watcher):
+        # Stop like CTRL-C after the second poll
+        if len(polls) == 2:
+            raise KeyboardInterrupt
+        polls.append(list(watcher._next_poll))
+        return polls[-1]
+
+    monkeypatch.setattr(FeedWatcher, "due", due)
+    monkeypatch.setattr(FeedWatcher, "wait_time", lambda watcher: 0.0)
+
+    result = run("-d", tmp_path, "--watch", "talkpython", "changelog")
+
+    assert [len(podcasts) for podcasts in polls] == [2, 2]
+    assert result.output.count("Found a total of 6 missing episodes.") == 1
+    assert result.output.count("Waiting for new episodes") == 2
+    assert "CTRL-C pressed" in result.output
+    assert len(_mp3_files(tmp_path / "talkpython")) == 3
+    assert len(_mp3_files(tmp_path / "changelog")) == 3
+
+
+def test_progress_json_is_not_mixed_with_the_messages(run, tmp_path):
+    result = run("-d", tmp_path, "--progress-json", "-", "talkpython")
+    assert result.exit_code == 2
+    assert "the standard output is used for the messages" in result.output
+
+    progress_json = tmp_path / "progress.jsonl"
+    result = run("-d", tmp_path, "--progress-json", progress_json, "talkpython")
+    assert result.exit_code == 0, result.output
+    assert json.loads(progress_json.read_text().splitlines()[-1])["episodes_done"] == 3
@@ -0,0 +1,96 @@
+import datetime
+
+import pytest
+
+from podcast_dl.podcast_dl import Feed, RssItemParser
+from podcast_dl.rss_parsers import BaseItem
+from podcast_dl.watch import FeedWatcher, poll_interval
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+def _pub_date(days_ago, zone="+0000"):
+    published = datetime.datetime(2024, 1, 31) - datetime.timedelta(days=days_ago)
+    return published.strftime(f"%a, %d %b %Y %H:%M:%S {zone}")
+
+
+@pytest.fixture
+def weekly_feed(make_item):
+    def weekly_feed(count=5, ttl=None):
+        items = [make_item(f"ep{i}", pub_date=_pub_date(i * 7)) for i in range(count)]
+        return Feed(items, ttl)
+
+    return weekly_feed
+
+
+def test_poll_interval_follows_publishing_history(weekly_feed):
+    assert poll_interval(weekly_feed(), 60, 30 * DAY) == 7 * DAY / 8
+
+
+def test_poll_interval_of_naive_and_aware_dates(make_item):
+    # -0000 means an unknown time zone, it is parsed into a naive datetime
+    items = [
+        make_item("ep0", pub_date=_pub_date(0)),
+        make_item("ep1", pub_date=_pub_date(7, "-0000")),
+    ]
+    assert poll_interval(Feed(items), 60, 30 * DAY) > 0
+
+
+def test_poll_interval_is_limited(weekly_feed):
+    assert poll_interval(weekly_feed(), 60, HOUR) == HOUR
+    assert poll_interval(weekly_feed(), 2 * DAY, 30 * DAY) == 2 * DAY
+    # no history
+    assert poll_interval(Feed([]), 60, HOUR) == HOUR
+
+
+def test_poll_interval_respects_ttl(weekly_feed):
+    assert poll_interval(weekly_feed(ttl=2 * DAY), 60, 30 * DAY) == 2 * DAY
+
+
+def test_ttl_is_parsed_from_channel():
+    def parse(channel):
+        parser = RssItemParser(BaseItem)
+        parser.feed(
+            b'<rss xmlns:sy="http://purl.org/rss/1.0/modules/syndication/">'
+            b"<channel>" + channel + b"</channel></rss>"
+        )
+        parser.close()
+        return parser.ttl
+
+    assert parse(b"<ttl>60</ttl>") == HOUR
+    assert parse(b"<sy:updatePeriod>daily</sy:updatePeriod>") == DAY
+    assert (
+        parse(
+            b"<sy:updatePeriod>daily</sy:updatePeriod>"
+            b"<sy:updateFrequency>4</sy:updateFrequency>"
+        )
+        == DAY / 4
+    )
+    assert parse(b"") is None
+
+
+def test_watcher_reports_only_new_items(weekly_feed):
+    now = 1000.0
+    watcher = FeedWatcher(60, HOUR, clock=lambda: now)
+    watcher.add("podcast")
+    assert watcher.due() == ["podcast"]
+
+    assert watcher.update("podcast", weekly_feed(3))
+    assert watcher.due() == []
+    assert watcher.wait_time() == HOUR
+
+    now += HOUR
+    assert not watcher.update("podcast", weekly_feed(3))
+    assert watcher.update("podcast", weekly_feed(4))
+
+
+def test_watcher_syncs_everything_after_failure(weekly_feed):
+    watcher = FeedWatcher(60, HOUR, clock=lambda: 0.0)
+    watcher.add("podcast")
+    watcher.update("podcast", weekly_feed(3))
+
+    watcher.failed("podcast")
+
+    assert watcher.wait_time() == 60
+    assert watcher.update("podcast", weekly_feed(3))
@@ -0,0 +1,39 @@
+import os
+import asyncio
+
+from podcast_dl.writer import FileWriter
+
+
+def _write(path, chunks, offset, buffer_size):
+    async def write():
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        writer = FileWriter(fd, offset, buffer_size)
+        try:
+            for chunk in chunks:
+                await writer.write(chunk)
+            await writer.flush()
+        finally:
+            writer.abort()
+            os.close(fd)
+        return writer.position
+
+    return asyncio.run(write())
+
+
+def test_chunks_are_written_at_offset(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(b"." * 20)
+    chunks = [b"ab", b"cde", b"f", b"ghij"]
+
+    position = _write(path, chunks, 5, buffer_size=4)
+
+    assert position == 15
+    assert path.read_bytes() == b"....." + b"abcdefghij" + b"....."
+
+
+def test_buffered_chunks_are_written_on_flush(tmp_path):
+    path = tmp_path / "file"
+
+    _write(path, [b"small"], 0, buffer_size=1024)
+
+    assert path.read_bytes() == b"small"